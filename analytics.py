@@ -0,0 +1,263 @@
+# analytics.py
+# Performance metrics over the whole journal with NumPy: drawdown, expectancy, profit factor,
+# Sharpe/Sortino, rolling win rate, and per-strategy / per-pair / per-rule breakdowns.
+# Trades are loaded once into column arrays; every metric is a vectorized pass over them.
+
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from migrations import MISSING_TS
+
+# Trades in the rolling win rate window
+ROLLING_WINDOW = 20
+
+DAY = np.timedelta64(1, "D")
+
+
+class TradeArrays(namedtuple("TradeArrays", "dates profit strategy strategies pair pairs rules rule_labels")):
+    """Column arrays of the journal in date order.
+
+    strategy/pair are integer codes into the strategies/pairs label lists (grouped
+    case-insensitively, like the lookup tables); rules is an (n, len(rule_labels)) bool matrix,
+    one column per active rule of the journal.
+    """
+
+
+Metrics = namedtuple("Metrics", [
+    "trades", "win_rate", "expectancy", "profit_factor", "total",
+    "max_drawdown", "drawdown_start", "drawdown_end", "drawdown_days", "recovered",
+    "sharpe", "sortino", "annual_sharpe", "annual_sortino",
+])
+
+GroupStats = namedtuple("GroupStats", "label trades win_rate expectancy profit_factor total")
+
+Report = namedtuple("Report", "metrics by_strategy by_pair by_rule rolling_win_rate window")
+
+
+# -------------------------- LOADING --------------------------
+
+def _codes(names):
+    # Lookup table id -> dense integer code, and the label of each code. Names differing only in
+    # surrounding spaces share a code; the lowest id names the group.
+    index, labels = {}, []
+    lut = np.zeros(max(names, default=0) + 1, dtype=np.int32)
+    for id_ in sorted(names):
+        key = names[id_].strip().lower()
+        code = index.get(key)
+        if code is None:
+            code = index[key] = len(labels)
+            labels.append(names[id_].strip() or "(none)")
+        lut[id_] = code
+    return lut, labels
+
+
+def load_trades(repo, where=(), params=()):
+    bits = np.array([repo.rule_bits[key] for key, _ in repo.rules], dtype=np.int64)
+    rule_labels = [label for _, label in repo.rules]
+    dates, profit, strategy, pair, rules = [], [], [], [], []
+    for chunk in repo.iter_analytics_chunks(where, params):
+        columns = list(zip(*chunk))
+        ts = np.array(columns[0], dtype=np.int64)
+        stamps = ts.astype("datetime64[s]")
+        stamps[ts == MISSING_TS] = np.datetime64("NaT")
+        dates.append(stamps)
+        profit.append(np.array(columns[1], dtype=float))
+        strategy.append(np.array(columns[2], dtype=np.int64))
+        pair.append(np.array(columns[3], dtype=np.int64))
+        masks = np.array(columns[4], dtype=np.int64)
+        rules.append(((masks[:, None] >> bits) & 1).astype(bool))
+    # Read after the trades: lookup ids only ever grow, so every id seen above is covered
+    strategy_lut, strategies = _codes(repo.symbols("strategies"))
+    pair_lut, pairs = _codes(repo.symbols("pairs"))
+
+    if not profit:
+        return TradeArrays(np.empty(0, dtype="datetime64[s]"), np.empty(0), np.empty(0, dtype=np.int32), strategies,
+                           np.empty(0, dtype=np.int32), pairs, np.empty((0, len(bits)), dtype=bool), rule_labels)
+    return TradeArrays(np.concatenate(dates), np.concatenate(profit), strategy_lut[np.concatenate(strategy)],
+                       strategies, pair_lut[np.concatenate(pair)], pairs, np.concatenate(rules), rule_labels)
+
+
+# -------------------------- METRICS --------------------------
+
+def _ratio(a, b):
+    return a / b if b else (math.inf if a > 0 else 0.0)
+
+
+def rolling_win_rate(profit, window=ROLLING_WINDOW):
+    # Win rate (%) of each run of `window` consecutive trades; entry i covers trades i .. i + window - 1
+    if len(profit) < window:
+        return np.empty(0)
+    wins = np.concatenate(([0], np.cumsum(profit > 0)))
+    return (wins[window:] - wins[:-window]) * (100.0 / window)
+
+
+def drawdown(profit, dates):
+    # Deepest fall of the cumulative P/L from a prior peak (starting from 0), and the longest
+    # stretch (in days) spent below a peak. Returns (depth, start date, trough date, days, recovered).
+    if not len(profit):
+        return 0.0, None, None, 0.0, True
+    # Position 0 is the flat start before the first trade; position i is after trade i - 1
+    equity = np.concatenate(([0.0], np.cumsum(profit)))
+    peaks = np.maximum.accumulate(equity)
+    under = equity - peaks
+
+    trough = int(np.argmin(under))
+    depth = float(under[trough])
+    # Last time the peak was set before the trough
+    peak = trough - int(np.argmax(equity[trough::-1] == peaks[trough]))
+
+    # Underwater runs: from the peak before the first negative position to the first position back at 0
+    below = np.concatenate(([0], (under < 0).astype(np.int8), [0]))
+    edges = np.diff(below)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    days = 0.0
+    if len(starts):
+        ends_at = np.minimum(ends, len(equity) - 1)
+        lengths = (dates[ends_at - 1] - dates[np.maximum(starts - 2, 0)]) / DAY
+        days = float(np.nanmax(lengths)) if not np.isnan(lengths).all() else 0.0
+    recovered = bool(not len(ends) or ends[-1] < len(equity))
+
+    def date_at(position):
+        value = dates[max(position - 1, 0)]
+        return None if np.isnat(value) else str(value.astype("datetime64[D]"))
+
+    if depth >= 0:
+        return 0.0, None, None, days, recovered
+    return depth, date_at(peak), date_at(trough), days, recovered
+
+
+def metrics(trades):
+    profit = trades.profit
+    n = len(profit)
+    if not n:
+        return Metrics(0, 0.0, 0.0, 0.0, 0.0, 0.0, None, None, 0.0, True, 0.0, 0.0, None, None)
+
+    total = float(profit.sum())
+    magnitude = float(np.abs(profit).sum())
+    gross_win, gross_loss = (magnitude + total) / 2, (magnitude - total) / 2
+    mean = total / n
+    std = float(profit.std(ddof=1)) if n > 1 else 0.0
+    losses = np.minimum(profit, 0.0)
+    downside = math.sqrt(float(np.dot(losses, losses)) / n)
+    sharpe = mean / std if std else 0.0
+    sortino = mean / downside if downside else 0.0
+
+    # Per-trade ratios scaled by the journal's own trade frequency
+    dated = trades.dates[~np.isnat(trades.dates)]
+    years = float((dated.max() - dated.min()) / DAY) / 365.25 if len(dated) > 1 else 0.0
+    scale = math.sqrt(n / years) if years > 0 else None
+
+    depth, dd_start, dd_end, dd_days, recovered = drawdown(profit, trades.dates)
+    return Metrics(
+        trades=n,
+        win_rate=int(np.count_nonzero(profit > 0)) * 100.0 / n,
+        expectancy=mean,
+        profit_factor=_ratio(gross_win, gross_loss),
+        total=total,
+        max_drawdown=depth,
+        drawdown_start=dd_start,
+        drawdown_end=dd_end,
+        drawdown_days=dd_days,
+        recovered=recovered,
+        sharpe=sharpe,
+        sortino=sortino,
+        annual_sharpe=sharpe * scale if scale else None,
+        annual_sortino=sortino * scale if scale else None,
+    )
+
+
+# Rows of the matrix returned by group_sums
+COUNT, TOTAL, WINS, MAGNITUDE = range(4)
+
+
+def group_sums(codes, size, profit, wins=None, magnitude=None):
+    # (4, size) matrix of per-group trade count, P/L total, winning trades and sum of |P/L|.
+    # Gross win/loss per group follow from total and magnitude, which saves two passes.
+    if wins is None:
+        wins = (profit > 0).astype(float)
+    if magnitude is None:
+        magnitude = np.abs(profit)
+    return np.vstack([
+        np.bincount(codes, minlength=size),
+        np.bincount(codes, weights=profit, minlength=size),
+        np.bincount(codes, weights=wins, minlength=size),
+        np.bincount(codes, weights=magnitude, minlength=size),
+    ])
+
+
+def _groups(labels, sums):
+    groups = []
+    for i in np.flatnonzero(sums[COUNT]):
+        n = int(sums[COUNT, i])
+        total, magnitude = float(sums[TOTAL, i]), float(sums[MAGNITUDE, i])
+        groups.append(GroupStats(
+            label=labels[i],
+            trades=n,
+            win_rate=float(sums[WINS, i]) * 100.0 / n,
+            expectancy=total / n,
+            profit_factor=_ratio((magnitude + total) / 2, (magnitude - total) / 2),
+            total=total,
+        ))
+    return groups
+
+
+def group_stats(codes, labels, profit, wins=None, magnitude=None):
+    # One GroupStats per label that has trades; largest total first
+    groups = _groups(labels, group_sums(codes, len(labels), profit, wins, magnitude))
+    groups.sort(key=lambda g: g.total, reverse=True)
+    return groups
+
+
+# Up to this many rules are grouped through one bitmask code per trade
+RULE_MASK_BITS = 16
+
+
+def rule_stats(trades, wins=None, magnitude=None):
+    # P/L split by whether each checklist rule was followed: two rows per rule, in rule_labels order.
+    # Each trade's rule flags form one bitmask code, so a single grouping pass over the trades
+    # covers every rule; the per-rule sums are then folded out of the 2**k mask table.
+    count = trades.rules.shape[1]
+    if not count:
+        return []
+    if count <= RULE_MASK_BITS:
+        weights = (1 << np.arange(count)).astype(np.uint8 if count <= 8 else np.uint16)
+        codes = trades.rules.view(np.uint8) @ weights
+        table = group_sums(codes, 1 << count, trades.profit, wins, magnitude)
+        bits = (np.arange(1 << count)[:, None] >> np.arange(count)) & 1
+        followed = table @ bits
+        totals = table.sum(axis=1)[:, None]
+    else:
+        # Too many rules for a mask table: one grouping pass per rule
+        per_rule = [group_sums(trades.rules[:, j].astype(np.int64), 2, trades.profit, wins, magnitude)
+                    for j in range(count)]
+        followed = np.column_stack([sums[:, 1] for sums in per_rule])
+        totals = per_rule[0].sum(axis=1)[:, None]
+    broken = totals - followed
+
+    rows = []
+    for column, label in enumerate(trades.rule_labels):
+        rows.extend(_groups([f"{label}: followed", f"{label}: broken"],
+                            np.column_stack([followed[:, column], broken[:, column]])))
+    return rows
+
+
+def summarize(trades, window=ROLLING_WINDOW):
+    # Per-trade columns shared by every grouping
+    wins = (trades.profit > 0).astype(float)
+    magnitude = np.abs(trades.profit)
+    return Report(
+        metrics=metrics(trades),
+        by_strategy=group_stats(trades.strategy, trades.strategies, trades.profit, wins, magnitude),
+        by_pair=group_stats(trades.pair, trades.pairs, trades.profit, wins, magnitude),
+        by_rule=rule_stats(trades, wins, magnitude),
+        rolling_win_rate=rolling_win_rate(trades.profit, window),
+        window=window,
+    )
+
+
+def load_report(repo, where=(), params=(), window=ROLLING_WINDOW):
+    # Worker side of the Statistics tab's performance section
+    return summarize(load_trades(repo, where, params), window)
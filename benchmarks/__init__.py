@@ -0,0 +1,2 @@
+# benchmarks
+# Headless performance suite for the journal; see run.py
@@ -0,0 +1,427 @@
+# benchmarks/run.py
+# Times the journal's core operations on synthetic databases and compares them with stored baselines.
+#
+#   python -m benchmarks.run                          10k and 100k trades, compare with baseline.json
+#   python -m benchmarks.run --sizes 10k,100k,1m,10m  larger journals (generated once, then cached)
+#   python -m benchmarks.run --update-baseline        record this machine's timings as the baseline
+#
+# Exits with status 1 when an operation is slower than its baseline by more than --threshold,
+# or when importing the GUI or the CLI loads one of STARTUP_LAZY_MODULES.
+# Suspected regressions are measured again (--confirm times) and only reported if they persist.
+# Headless: needs numpy, PIL and matplotlib (for matplotlib.dates only), never a display.
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import analytics
+import equity
+import exporter
+import imagestore
+import montecarlo
+import portfolio
+from benchmarks.synthetic import GENERATOR_VERSION, generate_journal, make_screenshot
+from repository import TradeRepository, history_filter_clauses, year_range
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+DATA_DIR = os.path.join(HERE, ".data")
+BASELINE_PATH = os.path.join(HERE, "baseline.json")
+RESULTS_PATH = os.path.join(HERE, "results.json")
+
+DEFAULT_SIZES = "10k,100k"
+# Slower than baseline by more than this fraction fails...
+DEFAULT_THRESHOLD = 0.5
+# ...unless the difference is below this many milliseconds (timer and scheduler noise)
+MIN_DELTA_MS = 5.0
+
+# Rows mutated by the insert/update/delete benchmarks
+MUTATIONS = 200
+# History window as the GUI reads it: visible rows plus prefetch on both sides
+PAGE_ROWS = 430
+EQUITY_WIDTH = 800
+# Journals of the benchmark size aggregated by portfolio.aggregate
+PORTFOLIO_JOURNALS = 4
+# Imported where first needed, never when main (up to the Add Trade form) or cli start
+STARTUP_LAZY_MODULES = ("numpy", "matplotlib", "PIL")
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1000000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def size_label(rows):
+    if rows % 1000000 == 0:
+        return f"{rows // 1000000}m"
+    if rows % 1000 == 0:
+        return f"{rows // 1000}k"
+    return str(rows)
+
+
+def timed(fn, repeat):
+    # Best wall time of fn() in milliseconds, after one warm-up call. The minimum is the most
+    # repeatable statistic: noise from other processes only ever adds time.
+    fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return min(samples)
+
+
+def screenshots(data_dir):
+    # Two stored screenshots (PNG and JPEG) with thumbnails, shared by the synthetic journals
+    root = os.path.join(data_dir, "images")
+    stored = []
+    for seed, ext in ((1, ".png"), (2, ".jpg")):
+        src = os.path.join(data_dir, f"chart{seed}{ext}")
+        if not os.path.exists(src):
+            make_screenshot(src, seed=seed)
+        path = imagestore.store_image(src, root)
+        stored.append((path, imagestore.make_thumbnail(path, root)))
+    return stored
+
+
+def journal(rows, seed, data_dir, images):
+    # Path of a cached synthetic journal, generated on first use
+    name = f"journal-{size_label(rows)}-s{seed}-v{GENERATOR_VERSION}{'-img' if images else ''}.db"
+    path = os.path.join(data_dir, name)
+    if not os.path.exists(path):
+        print(f"generating {name} ...", file=sys.stderr, flush=True)
+        start = time.perf_counter()
+        generate_journal(path + ".tmp", rows, seed, screenshots(data_dir) if images else ())
+        os.replace(path + ".tmp", path)
+        print(f"  {time.perf_counter() - start:.1f} s", file=sys.stderr)
+    return path
+
+
+# -------------------------- BENCHMARKS --------------------------
+
+def bench_history(repo, repeat):
+    results = {}
+    filters = {
+        "all": {},
+        "strategy": {"strategy": "break"},
+        "pair": {"pair": "eurusd"},
+        "winning": {"outcome": "Winning"},
+        "date_range": {"date_from": "2016-01-01", "date_to": "2016-03-31"},
+    }
+    for name, kwargs in filters.items():
+        where, params = history_filter_clauses(**kwargs)
+        pager = repo.history(where, params)
+        results[f"history.count.{name}"] = timed(pager.count, repeat)
+        results[f"history.first_page.{name}"] = timed(lambda: pager.page_at(0, PAGE_ROWS), repeat)
+
+    pager = repo.history()
+    total = pager.count()
+    middle = pager.page_at(total // 2, PAGE_ROWS)
+    key = pager.key(middle[-1])
+    results["history.scroll"] = timed(lambda: pager.page_after(key, PAGE_ROWS), repeat)
+    results["history.jump_offset"] = timed(lambda: pager.page_at(total // 2, PAGE_ROWS), repeat)
+    results["history.jump_date"] = timed(lambda: pager.position_of("2016-06-01"), repeat)
+    for sort in ("profit", "strategy"):
+        sorted_pager = pager.with_sort(sort, True)
+        results[f"history.sort.{sort}"] = timed(lambda: sorted_pager.page_at(0, PAGE_ROWS), repeat)
+
+    # Search as typed: a common word (one trade in eight) as a prefix, in date and in match order,
+    # with the Match column of the first page
+    where, params = history_filter_clauses(search="news sp")
+    for sort in ("date", "match"):
+        search_pager = repo.history(where, params, sort, search="news sp")
+
+        def search():
+            search_pager.count()
+            rows = search_pager.page_at(0, PAGE_ROWS)
+            search_pager.matches([row[0] for row in rows])
+        results[f"history.search.{sort}"] = timed(search, repeat)
+    return results
+
+
+def bench_stats(repo, repeat):
+    return {
+        "stats.summary": timed(repo.stats, repeat),
+        "stats.check": timed(repo.check_stats, max(1, repeat // 2)),
+        "analytics.report": timed(lambda: analytics.load_report(repo), max(1, repeat // 2)),
+    }
+
+
+def bench_equity(repo, repeat):
+    def prepare():
+        x, y = equity.load_equity_series(repo)
+        equity.downsample_m4(x, y, EQUITY_WIDTH)
+    series = equity.load_equity_series(repo)
+    curve = equity.load_equity_curve(repo)
+    trade = repo.get_trade(int(curve.ids[len(curve.ids) // 2]))
+
+    def patch():
+        # A trade in the middle of the curve edited: taken out and put back, then the running total
+        curve.remove(trade)
+        curve.add(trade)
+        return curve.y
+    return {
+        "equity.prepare": timed(prepare, max(1, repeat // 2)),
+        "equity.downsample": timed(lambda: equity.downsample_m4(*series, EQUITY_WIDTH), repeat),
+        "equity.patch": timed(patch, repeat),
+    }
+
+
+def bench_simulation(repo, repeat):
+    # The Risk view's default run, in one process so the figure doesn't depend on the core count
+    sample = montecarlo.load_sample(repo)
+    return {
+        "montecarlo.sample": timed(lambda: montecarlo.load_sample(repo), max(1, repeat // 2)),
+        "montecarlo.simulate": timed(lambda: montecarlo.run_simulation(sample, workers=1), max(1, repeat // 2)),
+    }
+
+
+def bench_periods(repo, repeat):
+    # What the Calendar view reads: every month, then one year's days and weeks
+    year = repo.rollup_years()[-1]
+
+    def calendar():
+        repo.rollups("day", *year_range(year))
+        repo.rollups("week", *year_range(year, "week"))
+    return {
+        "periods.months": timed(lambda: repo.rollups("month"), repeat),
+        "periods.year": timed(calendar, repeat),
+        "periods.rebuild": timed(repo.rebuild_rollups, max(1, repeat // 2)),
+    }
+
+
+def bench_export(repo, repeat, tmp):
+    out = os.path.join(tmp, "export")
+    return {
+        "export.csv": timed(lambda: exporter.export_csv(repo, out + ".csv"), max(1, repeat // 2)),
+        "export.columnar": timed(lambda: exporter.export_columnar(repo, out + ".tjc"), max(1, repeat // 2)),
+    }
+
+
+def bench_portfolio(path, repeat, tmp):
+    # Copies of the journal as separate accounts, summarized one process per core and combined
+    paths = []
+    for i in range(PORTFOLIO_JOURNALS):
+        paths.append(os.path.join(tmp, f"account{i}.db"))
+        shutil.copyfile(path, paths[-1])
+    try:
+        return {"portfolio.aggregate": timed(lambda: portfolio.aggregate_journals(paths), max(1, repeat // 2))}
+    finally:
+        for account in paths:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(account + suffix):
+                    os.remove(account + suffix)
+
+
+def bench_mutations(repo, repeat, suffix=""):
+    # Insert, update and delete MUTATIONS single trades, each in its own transaction as the GUI does.
+    # Everything inserted is deleted again, so the journal ends as it started.
+    ids = []
+
+    def insert():
+        ids.extend(repo.insert_trade(date="2030-01-01 10:00", pair="EURUSD", direction="Buy", strategy="Bench",
+                                     profit_percent=1.0) for _ in range(MUTATIONS))
+
+    def update():
+        for trade_id in ids[-MUTATIONS:]:
+            repo.update_trade(trade_id, profit_percent=-0.5, notes="updated")
+
+    def delete():
+        for _ in range(MUTATIONS):
+            repo.delete_trade(ids.pop())
+
+    results = {}
+    for _ in range(repeat):
+        for name, fn in (("insert", insert), ("update", update), ("delete", delete)):
+            start = time.perf_counter()
+            fn()
+            results.setdefault(name, []).append((time.perf_counter() - start) * 1000 / MUTATIONS)
+    return {f"trade.{name}{suffix}": min(samples) for name, samples in results.items()}
+
+
+def bench_startup(repeat):
+    # Cold import of the GUI and the CLI, each in a fresh interpreter; fails if either pulls in
+    # a module that should only load on demand
+    results = {}
+    for module in ("main", "cli"):
+        code = f"import sys, {module}; print(*(m for m in {STARTUP_LAZY_MODULES!r} if m in sys.modules))"
+
+        def start():
+            return subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True, capture_output=True,
+                                  text=True).stdout.split()
+        loaded = start()
+        if loaded:
+            raise SystemExit(f"import {module} loads {', '.join(loaded)} at startup; import it where it is first needed")
+        results[f"startup.import_{module}"] = timed(start, repeat)
+    return results
+
+
+def bench_images(data_dir, repeat, tmp):
+    results = {}
+    palette = os.path.join(data_dir, "chart3-palette.png")
+    if not os.path.exists(palette):
+        make_screenshot(palette, seed=3, palette=True)
+    for ext, src in (("png", os.path.join(data_dir, "chart1.png")), ("jpg", os.path.join(data_dir, "chart2.jpg")),
+                     ("palette_png", palette)):
+        if not os.path.exists(src):
+            screenshots(data_dir)
+        root = os.path.join(tmp, "images")
+
+        def thumbnail():
+            shutil.rmtree(root, ignore_errors=True)
+            imagestore.make_thumbnail(src, root)
+        results[f"image.thumbnail.{ext}"] = timed(thumbnail, repeat)
+        results[f"image.store.{ext}"] = timed(lambda: imagestore.store_image(src, root), repeat)
+
+        def cache_miss():
+            imagestore.ThumbnailCache().get(src)
+        cache = imagestore.ThumbnailCache()
+        results[f"image.cache_miss.{ext}"] = timed(cache_miss, repeat)
+        results[f"image.cache_hit.{ext}"] = timed(lambda: cache.get(src), repeat)
+    return results
+
+
+def run_size(rows, args, tmp):
+    path = journal(rows, args.seed, args.data_dir, args.images)
+    # Benchmark a copy: the mutation benchmarks write to it
+    work = os.path.join(tmp, "journal.db")
+    shutil.copyfile(path, work)
+    repo = TradeRepository(work)
+    try:
+        repo.init_schema()
+        results = {}
+        results.update(bench_history(repo, args.repeat))
+        results.update(bench_stats(repo, args.repeat))
+        results.update(bench_equity(repo, args.repeat))
+        results.update(bench_export(repo, args.repeat, tmp))
+        results.update(bench_periods(repo, args.repeat))
+        results.update(bench_simulation(repo, args.repeat))
+        results.update(bench_mutations(repo, args.repeat))
+        # Again with a subscriber, as in the GUI: each change then also reads the trade for its event
+        listener = repo.events.subscribe(lambda event: None)
+        results.update(bench_mutations(repo, args.repeat, ".events"))
+        repo.events.unsubscribe(listener)
+        if args.images:
+            results["image.gc_scan"] = timed(
+                lambda: imagestore.collect_garbage(repo, os.path.join(args.data_dir, "images"), dry_run=True),
+                args.repeat)
+    finally:
+        repo.close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(work + suffix):
+            os.remove(work + suffix)
+    results.update(bench_portfolio(path, args.repeat, tmp))
+    return results
+
+
+# -------------------------- REPORTING --------------------------
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold):
+    # Regressions as (size, benchmark, baseline ms, current ms)
+    regressions = []
+    for size, timings in results.items():
+        for name, ms in timings.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                continue
+            if ms > base * (1 + threshold) and ms - base > MIN_DELTA_MS:
+                regressions.append((size, name, base, ms))
+    return regressions
+
+
+def print_table(results, baseline):
+    for size, timings in results.items():
+        print(f"\n{size}" if size in ("images", "startup") else f"\n{size} trades")
+        for name, ms in timings.items():
+            base = baseline.get(size, {}).get(name)
+            change = f"{(ms / base - 1) * 100:+6.1f}%" if base else "      "
+            print(f"  {name:<32} {ms:10.2f} ms  {change}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="Trading journal benchmarks")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"journal sizes, e.g. 10k,100k,1m,10m (default {DEFAULT_SIZES})")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark (the best is reported)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--images", action="store_true", help="give a fifth of the trades screenshots")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="where generated journals are cached")
+    parser.add_argument("--output", default=RESULTS_PATH, help="results file (JSON)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"allowed slowdown as a fraction (default {DEFAULT_THRESHOLD})")
+    parser.add_argument("--confirm", type=int, default=1, help="re-measure suspected regressions this many times")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("results", {})
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    sizes = {size_label(parse_size(text)): parse_size(text) for text in args.sizes.split(",")}
+
+    def measure(size, tmp):
+        if size == "images":
+            return bench_images(args.data_dir, args.repeat, tmp)
+        if size == "startup":
+            return bench_startup(args.repeat)
+        return run_size(sizes[size], args, tmp)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in list(sizes) + ["images", "startup"]:
+            results[size] = measure(size, tmp)
+        if not args.update_baseline:
+            for _ in range(args.confirm):
+                suspects = {size for size, _, _, _ in compare(results, baseline, args.threshold)}
+                for size in suspects:
+                    # Keep the better of the two measurements of every benchmark in the group
+                    again = measure(size, tmp)
+                    results[size] = {name: min(ms, again.get(name, ms)) for name, ms in results[size].items()}
+
+    report = {"environment": environment(), "generator": GENERATOR_VERSION, "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print_table(results, baseline)
+    print(f"\nresults written to {args.output}")
+
+    if args.update_baseline:
+        # Merge, so sizes that weren't run keep their baselines
+        for size, timings in results.items():
+            baseline.setdefault(size, {}).update(timings)
+        with open(args.baseline, "w") as f:
+            json.dump({"environment": environment(), "generator": GENERATOR_VERSION, "results": baseline}, f, indent=2)
+        print(f"baseline updated: {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for size, name, base, ms in regressions:
+        print(f"REGRESSION {size} {name}: {base:.2f} ms -> {ms:.2f} ms ({(ms / base - 1) * 100:+.0f}%)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
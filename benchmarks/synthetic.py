@@ -0,0 +1,113 @@
+# benchmarks/synthetic.py
+# Synthetic journals for the benchmarks: realistic strategy, pair and rule distributions,
+# generated batch by batch with a seeded RNG so every size is reproducible and memory stays flat.
+
+import os
+
+import numpy as np
+
+from migrations import DEFAULT_RULES
+from repository import TradeRepository
+
+# Bump when the generated data changes, so cached databases are rebuilt
+GENERATOR_VERSION = 2
+
+GENERATE_BATCH = 100000
+
+STRATEGIES = (("Breakout", 0.35), ("Pullback", 0.25), ("Reversal", 0.15), ("Range", 0.15), ("News", 0.10))
+PAIRS = (
+    ("EURUSD", 0.24), ("GBPUSD", 0.16), ("USDJPY", 0.14), ("XAUUSD", 0.12), ("AUDUSD", 0.08),
+    ("USDCAD", 0.07), ("GBPJPY", 0.07), ("BTCUSD", 0.06), ("NAS100", 0.06),
+)
+# Chance that each checklist rule was followed, in DEFAULT_RULES order (a new journal's rules,
+# on bits 0, 1, ...)
+RULE_ODDS = (0.55, 0.75, 0.8, 0.85, 0.7)
+NOTES = ("", "", "", "Clean setup", "Moved stop to breakeven", "Entered early", "News spike", "Partial at 1R")
+
+START = np.datetime64("2015-01-05T08:00")
+
+
+def _choice(rng, table, size):
+    labels = np.array([name for name, _ in table])
+    weights = np.array([w for _, w in table])
+    return labels[rng.choice(len(table), size=size, p=weights / weights.sum())]
+
+
+def synthetic_batches(rows, seed=0, screenshots=(), batch_size=GENERATE_BATCH):
+    # IMPORT_COLUMNS tuples in date order; screenshots is a list of (image, thumbnail) paths
+    # that a fifth of the trades refer to
+    rng = np.random.default_rng(seed)
+    clock = START
+    done = 0
+    while done < rows:
+        n = min(batch_size, rows - done)
+
+        # Trades arrive about every three hours on average
+        gaps = rng.exponential(180, n).astype("int64") + 1
+        minutes = np.cumsum(gaps)
+        stamps = clock + minutes.astype("timedelta64[m]")
+        clock = stamps[-1]
+        dates = np.datetime_as_string(stamps, unit="m")
+        dates = np.char.replace(dates, "T", " ")
+
+        followed = rng.random((n, len(DEFAULT_RULES))) < np.array(RULE_ODDS)
+        # Discipline pays: every followed rule adds to the win probability
+        win = rng.random(n) < 0.32 + 0.05 * followed.sum(axis=1)
+        profit = np.where(win, rng.lognormal(0.3, 0.6, n), -rng.lognormal(-0.1, 0.4, n)).round(2)
+
+        columns = [
+            dates.tolist(),
+            _choice(rng, PAIRS, n).tolist(),
+            np.where(rng.random(n) < 0.5, "Buy", "Sell").tolist(),
+            (rng.integers(1, 50, n) / 10).tolist(),
+            _choice(rng, STRATEGIES, n).tolist(),
+        ]
+        bits = 1 << np.arange(len(DEFAULT_RULES), dtype=np.int64)
+        columns.append((followed @ bits).tolist())
+        columns += [profit.tolist(), np.array(NOTES)[rng.integers(0, len(NOTES), n)].tolist()]
+
+        if screenshots:
+            picked = rng.integers(0, len(screenshots), n)
+            shown = rng.random(n) < 0.2
+            images = [screenshots[i] if s else ("", "") for i, s in zip(picked.tolist(), shown.tolist())]
+            pre, thumb = zip(*images)
+            columns += [list(pre), [""] * n, list(thumb), [""] * n]
+        else:
+            columns += [[""] * n] * 4
+        columns.append([None] * n)
+
+        yield list(zip(*columns))
+        done += n
+
+
+def make_screenshot(path, size=(3840, 2160), seed=0, palette=False):
+    # A chart-like screenshot: dark background with a random-walk price line. palette saves it
+    # as an 8-bit palette (P mode) PNG, as many screenshot tools do.
+    from PIL import Image, ImageDraw
+
+    rng = np.random.default_rng(seed)
+    img = Image.new("RGB", size, (18, 22, 30))
+    draw = ImageDraw.Draw(img)
+    walk = np.cumsum(rng.normal(0, 1, size[0] // 4))
+    walk = (walk - walk.min()) / ((walk.max() - walk.min()) or 1) * (size[1] * 0.8) + size[1] * 0.1
+    draw.line([(i * 4, float(y)) for i, y in enumerate(walk)], fill=(80, 200, 120), width=3)
+    for x in range(0, size[0], 160):
+        draw.line([(x, 0), (x, size[1])], fill=(35, 40, 50))
+    if palette:
+        img = img.convert("P", palette=Image.Palette.ADAPTIVE)
+    img.save(path)
+    return path
+
+
+def generate_journal(path, rows, seed=0, screenshots=()):
+    # Create a journal database at path holding `rows` synthetic trades
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    repo = TradeRepository(path)
+    try:
+        repo.init_schema()
+        repo.insert_trades(synthetic_batches(rows, seed, screenshots))
+    finally:
+        repo.close()
+    return path
@@ -0,0 +1,368 @@
+# cli.py
+# Headless command line for the journal: python -m cli <command> [options]
+# Uses the same repository, exporter and importer code as the GUI, but never imports
+# tkinter or matplotlib, so it runs from cron on a machine without a display.
+#
+#   stats       journal-wide statistics (the Statistics tab summary)
+#   export      trades as CSV (to a file or stdout) or columnar (.tjc/.parquet/.arrow)
+#   import      a CSV or broker statement; re-imports skip known trades
+#   query       list trades with the History filters and sort order (--search for full-text,
+#               --sort match to rank by relevance)
+#   rules       list, add, rename or remove checklist rules
+#   periods     P/L per day, ISO week or month (from the rollup tables; --rebuild recomputes them)
+#   portfolio   combined statistics of several journals (--trades lists their trades in date order)
+#   simulate    Monte Carlo bootstrap of the trades: drawdown and final P/L percentiles, risk of ruin
+#   vacuum      compact the database file
+#   gc-images   delete screenshots no trade refers to
+#
+# --profile prints per-operation and per-statement timings (with query plans of slow ones) to stderr.
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+
+import exporter
+import imagestore
+import importer
+import migrations
+import perf
+from repository import DB_PATH, HISTORY_FIELDS, HISTORY_SORT_KEYS, TradeRepository, history_filter_clauses, year_range
+
+# simulate option defaults: montecarlo's DEFAULT_PATHS, DEFAULT_HORIZON, DEFAULT_RUIN and DEFAULT_SEED,
+# repeated so building the parser doesn't load numpy
+SIMULATE_PATHS = 20000
+SIMULATE_HORIZON = 1000
+SIMULATE_RUIN = 50.0
+SIMULATE_SEED = 0
+
+
+def progress_printer(template):
+    # Progress callback that rewrites one stderr line, only when someone is watching
+    if not sys.stderr.isatty():
+        return None
+
+    def progress(*counts):
+        sys.stderr.write("\r" + template.format(*counts))
+        sys.stderr.flush()
+    return progress
+
+
+def end_progress(progress):
+    if progress:
+        sys.stderr.write("\n")
+
+
+def filters(args):
+    return history_filter_clauses(
+        outcome=args.outcome,
+        strategy=args.strategy,
+        pair=args.pair,
+        direction=args.direction,
+        date_from=args.date_from,
+        date_to=args.date_to,
+        search=args.search,
+    )
+
+
+def cmd_stats(repo, args):
+    if args.check:
+        problems = repo.check_stats(rebuild=args.rebuild)
+        for problem in problems:
+            print(problem, file=sys.stderr)
+        if problems and not args.rebuild:
+            return 1
+    stats = repo.stats()
+    if args.json:
+        json.dump({
+            "total_trades": stats.total,
+            "wins": stats.wins,
+            "losses": stats.losses,
+            "win_rate": stats.win_rate,
+            "avg_win": stats.avg_win,
+            "avg_loss": stats.avg_loss,
+            "total_profit": stats.profit_sum,
+            "most_broken_rule": stats.most_broken_rule(repo.rules),
+            "rules_followed": stats.followed,
+        }, sys.stdout, indent=2)
+        print()
+    else:
+        print(f"Total Trades: {stats.total}")
+        print(f"Win Rate: {stats.win_rate:.1f}%")
+        print(f"Avg Win %: {stats.avg_win:.2f}%")
+        print(f"Avg Loss %: {stats.avg_loss:.2f}%")
+        print(f"Total P/L %: {stats.profit_sum:.2f}%")
+        print(f"Most Broken Rule: {stats.most_broken_rule(repo.rules) or 'None'}")
+    return 0
+
+
+def cmd_export(repo, args):
+    where, params = filters(args)
+    progress = progress_printer("Exported {0} of {1} trades")
+    if args.output == "-":
+        if args.format != "csv":
+            raise SystemExit("Only CSV can be written to stdout")
+        count = exporter.stream_csv(repo, sys.stdout, where, params, progress=progress)
+    elif args.format == "csv":
+        count = exporter.export_csv(repo, args.output, where, params, progress=progress)
+    else:
+        count = exporter.export_columnar(repo, args.output, where, params, progress=progress)
+    end_progress(progress)
+    if args.output != "-":
+        print(f"Exported {count} trades to {args.output}")
+    return 0
+
+
+def cmd_import(repo, args):
+    progress = progress_printer("Imported {0} new, {1} already imported")
+    inserted, skipped = importer.import_csv(repo, args.path, progress=progress)
+    end_progress(progress)
+    print(f"Imported {inserted} trades from {args.path} ({skipped} already imported)")
+    return 0
+
+
+def cmd_query(repo, args):
+    where, params = filters(args)
+    pager = repo.history(where, params, args.sort, args.desc, args.search)
+    writer = csv.writer(sys.stdout, delimiter="," if args.csv else "\t")
+    writer.writerow(HISTORY_FIELDS)
+    for n, row in enumerate(pager.iter_rows(), start=1):
+        writer.writerow(row[:len(HISTORY_FIELDS)])
+        if n == args.limit:
+            break
+    return 0
+
+
+def cmd_rules(repo, args):
+    if args.action == "add":
+        print(repo.add_rule(args.label, args.key))
+    elif args.action == "rename":
+        repo.rename_rule(args.key, args.label)
+    elif args.action == "remove":
+        repo.remove_rule(args.key)
+    else:
+        followed = repo.stats().followed
+        for key, label in repo.rules:
+            print(f"{key}\t{followed.get(key, 0)}\t{label}")
+    return 0
+
+
+def cmd_periods(repo, args):
+    if args.rebuild:
+        repo.rebuild_rollups()
+    start, end = year_range(args.year, args.period) if args.year else (None, None)
+    writer = csv.writer(sys.stdout, delimiter="," if args.csv else "\t")
+    writer.writerow((args.period, "trades", "win_rate", "profit_percent", "max_drawdown"))
+    for r in repo.rollups(args.period, start, end):
+        writer.writerow((r.label, r.trades, f"{r.win_rate:.1f}", f"{r.profit:.2f}", f"{r.drawdown:.2f}"))
+    return 0
+
+
+def cmd_portfolio(repo, args):
+    # Imported here: portfolio loads numpy, which the other commands don't need at startup
+    import portfolio
+
+    writer = csv.writer(sys.stdout, delimiter="," if args.csv else "\t")
+    if args.trades:
+        conn = portfolio.attach_journals(args.journals)
+        try:
+            writer.writerow(portfolio.PORTFOLIO_COLUMNS)
+            for n, row in enumerate(portfolio.iter_portfolio_trades(conn), start=1):
+                writer.writerow(row)
+                if n == args.limit:
+                    break
+        finally:
+            conn.close()
+        return 0
+
+    result = portfolio.aggregate_journals(args.journals, args.workers)
+    rows = [(j.name, j.metrics) for j in result.journals] + [("combined", result.metrics)]
+    if args.json:
+        json.dump([{
+            "journal": name,
+            "trades": m.trades,
+            "win_rate": m.win_rate,
+            "expectancy": m.expectancy,
+            "profit_factor": m.profit_factor if m.profit_factor != float("inf") else None,
+            "total_profit": m.total,
+            "max_drawdown": m.max_drawdown,
+        } for name, m in rows], sys.stdout, indent=2)
+        print()
+        return 0
+    writer.writerow(("journal", "trades", "win_rate", "expectancy", "profit_factor", "profit_percent", "max_drawdown"))
+    for name, m in rows:
+        writer.writerow((name, m.trades, f"{m.win_rate:.1f}", f"{m.expectancy:.2f}", f"{m.profit_factor:.2f}",
+                         f"{m.total:.2f}", f"{m.max_drawdown:.2f}"))
+    return 0
+
+
+def cmd_simulate(repo, args):
+    import montecarlo
+
+    result = montecarlo.simulate_journal(repo, args.strategy, args.rules_followed, args.paths, args.trades,
+                                         args.ruin, args.seed, args.workers)
+    if args.json:
+        json.dump({
+            "trades": result.trades,
+            "paths": result.paths,
+            "horizon": result.horizon,
+            "ruin": result.ruin,
+            "ruin_probability": result.ruin_probability,
+            "percentiles": [{"percentile": p, "final_profit": float(final), "max_drawdown": float(drawdown)}
+                            for p, final, drawdown in zip(montecarlo.PERCENTILES, result.final, result.max_drawdown)],
+        }, sys.stdout, indent=2)
+        print()
+        return 0
+    print(f"Paths: {result.paths} of {result.horizon} trades, resampled from {result.trades} trades")
+    print(f"Probability of ruin (down {result.ruin:g}%): {result.ruin_probability * 100:.2f}%")
+    writer = csv.writer(sys.stdout, delimiter="\t")
+    writer.writerow(("percentile", "final_profit", "max_drawdown"))
+    for p, final, drawdown in zip(montecarlo.PERCENTILES, result.final, result.max_drawdown):
+        writer.writerow((p, f"{final:.2f}", f"{drawdown:.2f}"))
+    return 0
+
+
+def cmd_vacuum(repo, args):
+    before = os.path.getsize(repo.path)
+    repo.vacuum()
+    after = os.path.getsize(repo.path)
+    print(f"{repo.path}: {before / 1048576:.1f} MB -> {after / 1048576:.1f} MB")
+    return 0
+
+
+def cmd_gc_images(repo, args):
+    removed, freed = imagestore.collect_garbage(repo, args.root, dry_run=args.dry_run)
+    for path in removed:
+        print(path)
+    verb = "Would remove" if args.dry_run else "Removed"
+    print(f"{verb} {len(removed)} unreferenced files ({freed / 1048576:.1f} MB)", file=sys.stderr)
+    return 0
+
+
+def add_filter_options(parser):
+    parser.add_argument("--outcome", choices=["All", "Winning", "Losing"], default="All")
+    parser.add_argument("--strategy", default="", help="strategy prefix (case-insensitive)")
+    parser.add_argument("--pair", default="")
+    parser.add_argument("--direction", choices=["", "Buy", "Sell"], default="")
+    parser.add_argument("--from", dest="date_from", default="", metavar="DATE")
+    parser.add_argument("--to", dest="date_to", default="", metavar="DATE")
+    parser.add_argument("--search", default="", metavar="TEXT",
+                        help="words in the notes, strategy or pair (each one a prefix)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m cli", description="Trading journal command line")
+    parser.add_argument("--db", default=DB_PATH, help=f"journal database (default: {DB_PATH})")
+    parser.add_argument("--profile", action="store_true", help="print timings of the command and its SQL to stderr")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stats = commands.add_parser("stats", help="journal-wide statistics")
+    stats.add_argument("--json", action="store_true")
+    stats.add_argument("--check", action="store_true", help="compare stored aggregates with a full recompute")
+    stats.add_argument("--rebuild", action="store_true", help="with --check: rebuild aggregates that are off")
+    stats.set_defaults(run=cmd_stats)
+
+    export = commands.add_parser("export", help="export trades")
+    export.add_argument("output", help="output file, or - for CSV on stdout")
+    export.add_argument("--format", choices=["csv", "columnar"], default=None,
+                        help="default: from the output extension")
+    add_filter_options(export)
+    export.set_defaults(run=cmd_export)
+
+    import_ = commands.add_parser("import", help="import a CSV or broker statement")
+    import_.add_argument("path")
+    import_.set_defaults(run=cmd_import)
+
+    query = commands.add_parser("query", help="list trades")
+    add_filter_options(query)
+    query.add_argument("--sort", choices=sorted(HISTORY_SORT_KEYS), default="date")
+    query.add_argument("--desc", action="store_true")
+    query.add_argument("--limit", type=int, default=0, help="stop after this many trades")
+    query.add_argument("--csv", action="store_true", help="comma-separated instead of tab-separated")
+    query.set_defaults(run=cmd_query)
+
+    rules = commands.add_parser("rules", help="list or edit the checklist rules")
+    actions = rules.add_subparsers(dest="action")
+    add = actions.add_parser("add", help="add a rule (or bring back a removed one)")
+    add.add_argument("label")
+    add.add_argument("--key", help="column name in exports (default: from the label)")
+    rename = actions.add_parser("rename", help="change a rule's label")
+    rename.add_argument("key")
+    rename.add_argument("label")
+    remove = actions.add_parser("remove", help="hide a rule; trades keep its checkmarks")
+    remove.add_argument("key")
+    rules.set_defaults(run=cmd_rules)
+
+    periods = commands.add_parser("periods", help="P/L per day, ISO week or month")
+    periods.add_argument("--period", choices=migrations.PERIODS, default="month")
+    periods.add_argument("--year", type=int, help="only periods beginning in this calendar year")
+    periods.add_argument("--rebuild", action="store_true", help="recompute the rollups from the trades first")
+    periods.add_argument("--csv", action="store_true", help="comma-separated instead of tab-separated")
+    periods.set_defaults(run=cmd_periods)
+
+    portfolio_ = commands.add_parser("portfolio", help="combined statistics of several journals")
+    portfolio_.add_argument("journals", nargs="+", metavar="JOURNAL", help="journal database files")
+    portfolio_.add_argument("--workers", type=int, help="processes summarizing journals (default: one per core)")
+    portfolio_.add_argument("--json", action="store_true")
+    portfolio_.add_argument("--trades", action="store_true", help="list every trade of the journals in date order")
+    portfolio_.add_argument("--limit", type=int, default=0, help="with --trades: stop after this many trades")
+    portfolio_.add_argument("--csv", action="store_true", help="comma-separated instead of tab-separated")
+    portfolio_.set_defaults(run=cmd_portfolio, uses_db=False)
+
+    simulate = commands.add_parser("simulate", help="Monte Carlo bootstrap of the journal's trades")
+    simulate.add_argument("--strategy", default="", help="resample only this strategy's trades")
+    simulate.add_argument("--rules-followed", action="store_true", help="resample only trades that followed every rule")
+    simulate.add_argument("--paths", type=int, default=SIMULATE_PATHS)
+    simulate.add_argument("--trades", type=int, help=f"trades per path (default: as many as resampled, "
+                                                     f"up to {SIMULATE_HORIZON})")
+    simulate.add_argument("--ruin", type=float, default=SIMULATE_RUIN,
+                          help="loss (%%) at which a path counts as ruined")
+    simulate.add_argument("--seed", type=int, default=SIMULATE_SEED)
+    simulate.add_argument("--workers", type=int, help="processes simulating paths (default: one per core)")
+    simulate.add_argument("--json", action="store_true")
+    simulate.set_defaults(run=cmd_simulate)
+
+    vacuum = commands.add_parser("vacuum", help="compact the database file")
+    vacuum.set_defaults(run=cmd_vacuum)
+
+    gc = commands.add_parser("gc-images", help="delete screenshots no trade refers to")
+    gc.add_argument("--root", help="image store to clean (default: the journal's, e.g. journal-images for journal.db)")
+    gc.add_argument("--dry-run", action="store_true", help="only list what would be deleted")
+    gc.set_defaults(run=cmd_gc_images)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "export" and args.format is None:
+        args.format = "csv" if args.output == "-" or args.output.lower().endswith(".csv") else "columnar"
+
+    perf.enable_from_environment()
+    if args.profile:
+        perf.enable()
+    # Commands given their own journals (portfolio) leave --db alone, so it isn't created
+    repo = TradeRepository(args.db) if getattr(args, "uses_db", True) else None
+    try:
+        if repo:
+            repo.init_schema()
+        with perf.span(args.command):
+            status = args.run(repo, args)
+        if args.profile:
+            print(perf.format_report(repo.query_plan if repo else None, recent=0), file=sys.stderr)
+        return status
+    except BrokenPipeError:
+        # Output piped into head or similar: stop quietly, and keep the interpreter's final flush quiet too
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    except (OSError, ValueError, RuntimeError, sqlite3.Error) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if repo:
+            repo.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
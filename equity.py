@@ -0,0 +1,100 @@
+# equity.py
+# Equity curve data: trade dates to matplotlib date numbers, cumulative P/L, and M4 downsampling.
+# Imported on first use by the Statistics tab; needs numpy and matplotlib.dates but no GUI backend.
+
+import matplotlib.dates as mdates
+import numpy as np
+
+from migrations import MISSING_TS, trade_ts
+
+
+def downsample_m4(x, y, width):
+    # Keep the first, last, min and max point of every pixel column (M4); x must be sorted.
+    # The line drawn from the result is pixel-identical to drawing every point.
+    n = len(x)
+    if n <= 4 * width:
+        return x, y
+    span = (x[-1] - x[0]) or 1.0
+    columns = np.minimum(((x - x[0]) / span * width).astype(np.int64), width - 1)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(columns)) + 1))
+    ends = np.append(starts[1:], n) - 1
+    group = np.repeat(np.arange(len(starts)), ends - starts + 1)
+
+    def first_where(mask):
+        idx = np.flatnonzero(mask)
+        g = group[idx]
+        return idx[np.concatenate(([True], g[1:] != g[:-1]))]
+
+    mins = first_where(y == np.minimum.reduceat(y, starts)[group])
+    maxs = first_where(y == np.maximum.reduceat(y, starts)[group])
+    keep = np.unique(np.concatenate((starts, ends, mins, maxs)))
+    return x[keep], y[keep]
+
+
+def load_equity_series(repo):
+    # Worker side of the equity curve: (date numbers, cumulative P/L) in date order
+    curve = load_equity_curve(repo)
+    return curve.x, curve.y
+
+
+def load_equity_curve(repo):
+    trades = repo.equity_series()
+    ts = np.fromiter((t[0] for t in trades), dtype=np.int64, count=len(trades))
+    profit = np.fromiter((t[1] for t in trades), dtype=float, count=len(trades))
+    ids = np.fromiter((t[2] for t in trades), dtype=np.int64, count=len(trades))
+    dated = ts != MISSING_TS
+    return EquityCurve(mdates.date2num(ts[dated].astype("datetime64[s]")), ids[dated], profit[dated],
+                       float(profit[~dated].sum()))
+
+
+class EquityCurve:
+    """The dated trades' equity curve, patched one trade at a time as trades change.
+
+    Points are kept in (date, id) order as date numbers x, trade ids and each trade's P/L; base
+    is the P/L of the undated trades, which come first. y, the running total, is recomputed
+    (one cumsum) after a change rather than shifted point by point.
+    """
+
+    def __init__(self, x, ids, profit, base=0.0):
+        self.x, self.ids, self.profit, self.base = x, ids, profit, base
+        self._y = None
+
+    @property
+    def y(self):
+        if self._y is None:
+            self._y = self.base + np.cumsum(self.profit)
+        return self._y
+
+    @staticmethod
+    def _point(trade):
+        # (date number, or None if undated, and P/L) of a Trade, dated as it is stored
+        ts = trade_ts(trade.date)
+        x = None if ts == MISSING_TS else mdates.date2num(np.datetime64(ts, "s"))
+        return x, trade.profit_percent or 0
+
+    def _index(self, x, trade_id):
+        # Where (x, trade_id) is, or would go, in the (date, id) order
+        lo, hi = np.searchsorted(self.x, x, "left"), np.searchsorted(self.x, x, "right")
+        return int(lo + np.searchsorted(self.ids[lo:hi], trade_id))
+
+    def remove(self, trade):
+        x, profit = self._point(trade)
+        self._y = None
+        if x is None:
+            self.base -= profit
+            return
+        i = self._index(x, trade.id)
+        if i < len(self.ids) and self.ids[i] == trade.id:
+            self.x, self.ids, self.profit = (np.delete(a, i) for a in (self.x, self.ids, self.profit))
+
+    def add(self, trade):
+        # True if the trade became the last point, so a plot of the curve only has to extend its line
+        x, profit = self._point(trade)
+        self._y = None
+        if x is None:
+            self.base += profit
+            return False
+        i = self._index(x, trade.id)
+        self.x, self.ids, self.profit = (np.insert(a, i, v) for a, v in ((self.x, x), (self.ids, trade.id),
+                                                                       (self.profit, profit)))
+        return i == len(self.x) - 1
@@ -0,0 +1,41 @@
+# events.py
+# In-process change events: TradeRepository publishes one for every trade it inserts, updates or
+# deletes, and views subscribe to apply just that change instead of reloading everything.
+# Nothing here imports tkinter; subscribers are called on the thread that made the change.
+
+import threading
+from collections import namedtuple
+
+INSERTED, UPDATED, DELETED = "inserted", "updated", "deleted"
+
+
+class TradeEvent(namedtuple("TradeEvent", "kind trade_id trade old")):
+    """One committed trade change: trade is the Trade after it (None once deleted), old the Trade
+    before it (None for an insert)."""
+
+
+class EventBus:
+    """Subscribers are plain callables taking a TradeEvent. publish() calls them in order on the
+    publishing thread, so a GUI subscriber must hand the event over to its own thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = ()
+
+    @property
+    def active(self):
+        # Publishers skip building events (an extra read per change) when nobody listens
+        return bool(self._subscribers)
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers += (callback,)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = tuple(c for c in self._subscribers if c != callback)
+
+    def publish(self, event):
+        for callback in self._subscribers:
+            callback(event)
@@ -0,0 +1,229 @@
+# exporter.py
+# Chunked trade export: CSV, plus a typed columnar format for analysis tools.
+# Every exporter streams the cursor chunk by chunk, reports progress and can be cancelled
+# from another thread through a threading.Event.
+
+import csv
+import json
+import os
+import struct
+from array import array
+
+from repository import export_columns
+
+# Rows read from the cursor per chunk
+EXPORT_CHUNK_SIZE = 5000
+
+# CSV header of each exported column; other rules are headed by their label
+CSV_HEADERS = {
+    "id": "ID", "date": "Date", "pair": "Pair", "direction": "Direction", "quantity": "Quantity",
+    "strategy": "Strategy", "waited_4h": "Waited 4H", "trend_followed": "Trend Followed",
+    "rr_ok": "RR OK", "emotional": "Emotional", "followed_plan": "Followed Plan",
+    "profit_percent": "Profit%", "notes": "Notes", "pre_image_path": "Pre Image",
+    "post_image_path": "Post Image", "pre_thumb_path": "Pre Thumb", "post_thumb_path": "Post Thumb",
+}
+
+# Types of the columnar exports; every rule column is int8. timestamp is epoch seconds, as the
+# trades table stores dates.
+FIELD_TYPES = {"id": "int64", "date": "timestamp", "quantity": "float64", "profit_percent": "float64"}
+
+# Compact typed binary format used when pyarrow is not installed (see write_tjc/read_tjc)
+TJC_MAGIC = b"TJC1"
+# struct format of each fixed-width type: standard sizes, little-endian on every platform
+TJC_FORMATS = {"int64": "q", "timestamp": "q", "float64": "d", "int8": "b"}
+# An undated trade in a TJC timestamp column: the int64 minimum, which NumPy reads as NaT
+TJC_NULL_TIMESTAMP = -(1 << 63)
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def csv_header(rules):
+    # rules: the journal's (key, label) checklist rules, as on TradeRepository.rules
+    labels = dict(rules)
+    return [CSV_HEADERS.get(c) or labels[c] for c in export_columns(rules)]
+
+
+def column_types(rules):
+    # (name, type) of every exported column, in export_columns(rules) order
+    labels = dict(rules)
+    return tuple((c, "int8" if c in labels else FIELD_TYPES.get(c, "utf8")) for c in export_columns(rules))
+
+
+def _pyarrow():
+    # pyarrow is optional; it is only imported when a columnar export asks for it
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def columnar_extension():
+    # Default file extension for the columnar export on this installation
+    return ".parquet" if _pyarrow() else ".tjc"
+
+
+def _chunks(repo, where, params, chunk_size, progress, cancel, typed=False):
+    # Filtered export_columns(repo.rules) chunks with progress(done, total) after each one; stops with ExportCancelled.
+    # typed chunks carry dates as epoch seconds, for the columnar formats.
+    total = repo.count_trades(where, params)
+    done = 0
+    if progress:
+        progress(done, total)
+    for chunk in repo.iter_export_chunks(where, params, chunk_size, typed):
+        if cancel is not None and cancel.is_set():
+            raise ExportCancelled()
+        yield chunk
+        done += len(chunk)
+        if progress:
+            progress(done, total)
+
+
+def _write_atomically(path, write):
+    # Write to a temporary file and move it into place, so a cancelled or failed export leaves nothing behind
+    tmp = path + ".part"
+    try:
+        result = write(tmp)
+        os.replace(tmp, path)
+        return result
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def write_csv(f, chunks, rules):
+    # CSV rows for every chunk to an open text file, flushed chunk by chunk; returns the row count
+    writer = csv.writer(f)
+    writer.writerow(csv_header(rules))
+    count = 0
+    for chunk in chunks:
+        writer.writerows(chunk)
+        f.flush()
+        count += len(chunk)
+    return count
+
+
+def export_csv(repo, path, where=(), params=(), progress=None, cancel=None, chunk_size=EXPORT_CHUNK_SIZE):
+    # Returns the number of trades written
+    def write(tmp):
+        with open(tmp, "w", newline="") as f:
+            return write_csv(f, _chunks(repo, where, params, chunk_size, progress, cancel), repo.rules)
+    return _write_atomically(path, write)
+
+
+def stream_csv(repo, f, where=(), params=(), progress=None, chunk_size=EXPORT_CHUNK_SIZE):
+    # export_csv to an already open file such as stdout
+    return write_csv(f, _chunks(repo, where, params, chunk_size, progress, None), repo.rules)
+
+
+def export_columnar(repo, path, where=(), params=(), progress=None, cancel=None, chunk_size=EXPORT_CHUNK_SIZE):
+    # .parquet -> Parquet, .arrow/.feather -> Arrow IPC (both need pyarrow), anything else -> TJC
+    ext = os.path.splitext(path)[1].lower()
+    columns = column_types(repo.rules)
+    chunks = _chunks(repo, where, params, chunk_size, progress, cancel, typed=True)
+    if ext in (".parquet", ".arrow", ".feather"):
+        pa = _pyarrow()
+        if pa is None:
+            raise RuntimeError(f"Writing {ext} files needs pyarrow; use the .tjc format instead")
+        return _write_atomically(path, lambda tmp: _write_arrow(pa, tmp, chunks, columns, parquet=ext == ".parquet"))
+    return _write_atomically(path, lambda tmp: write_tjc(tmp, chunks, columns))
+
+
+def _column_values(chunk, index, kind):
+    values = [row[index] for row in chunk]
+    if kind == "utf8":
+        return ["" if v is None else str(v) for v in values]
+    if kind == "float64":
+        return [float("nan") if v is None else float(v) for v in values]
+    if kind == "timestamp":
+        return [None if v is None else int(v) for v in values]
+    return [0 if v is None else int(v) for v in values]
+
+
+def _write_arrow(pa, path, chunks, columns, parquet):
+    arrow_types = {"int64": pa.int64(), "timestamp": pa.timestamp("s"), "float64": pa.float64(),
+                   "int8": pa.int8(), "utf8": pa.string()}
+    schema = pa.schema([(name, arrow_types[kind]) for name, kind in columns])
+    count = 0
+    if parquet:
+        writer = pa.parquet.ParquetWriter(path, schema)
+    else:
+        writer = pa.ipc.new_file(path, schema)
+    try:
+        for chunk in chunks:
+            arrays = [pa.array(_column_values(chunk, i, kind), type=arrow_types[kind])
+                      for i, (_, kind) in enumerate(columns)]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            count += len(chunk)
+    finally:
+        writer.close()
+    return count
+
+
+# -------------------------- TJC FORMAT --------------------------
+# TJC1 layout (all integers little-endian):
+#   b"TJC1", uint32 header length, JSON header {"columns": [[name, type], ...]}
+#   then record batches: uint32 row count (0 terminates the file), then each column in order:
+#     int64 / float64 / int8 -> row count fixed-width values
+#     timestamp -> row count int64 epoch seconds, TJC_NULL_TIMESTAMP where there is no date
+#     utf8 -> uint32 offsets (row count + 1) followed by the UTF-8 bytes they index
+
+def _pack(code, values):
+    return struct.pack(f"<{len(values)}{code}", *values)
+
+
+def write_tjc(path, chunks, columns):
+    # columns: (name, type) of each chunk row's values, as from column_types()
+    count = 0
+    with open(path, "wb") as f:
+        header = json.dumps({"columns": [list(c) for c in columns]}).encode("utf-8")
+        f.write(TJC_MAGIC + struct.pack("<I", len(header)) + header)
+        for chunk in chunks:
+            f.write(struct.pack("<I", len(chunk)))
+            for index, (_, kind) in enumerate(columns):
+                values = _column_values(chunk, index, kind)
+                if kind == "utf8":
+                    encoded = [v.encode("utf-8") for v in values]
+                    offsets = [0]
+                    for blob in encoded:
+                        offsets.append(offsets[-1] + len(blob))
+                    f.write(_pack("I", offsets))
+                    f.write(b"".join(encoded))
+                else:
+                    if kind == "timestamp":
+                        values = [TJC_NULL_TIMESTAMP if v is None else v for v in values]
+                    f.write(_pack(TJC_FORMATS[kind], values))
+            count += len(chunk)
+        f.write(struct.pack("<I", 0))
+    return count
+
+
+def read_tjc(path):
+    # Load a TJC file into {column: list or array}; numeric columns come back as array.array
+    with open(path, "rb") as f:
+        if f.read(4) != TJC_MAGIC:
+            raise ValueError(f"{path} is not a TJC file")
+        (size,) = struct.unpack("<I", f.read(4))
+        columns = [tuple(c) for c in json.loads(f.read(size))["columns"]]
+        result = {name: ([] if kind == "utf8" else array(TJC_FORMATS[kind])) for name, kind in columns}
+
+        def read_array(code, n):
+            return struct.unpack(f"<{n}{code}", f.read(n * struct.calcsize(f"<{code}")))
+
+        while True:
+            (rows,) = struct.unpack("<I", f.read(4))
+            if rows == 0:
+                break
+            for name, kind in columns:
+                if kind == "utf8":
+                    offsets = read_array("I", rows + 1)
+                    blob = f.read(offsets[-1])
+                    result[name].extend(blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(rows))
+                else:
+                    result[name].extend(read_array(TJC_FORMATS[kind], rows))
+    return result
@@ -0,0 +1,201 @@
+# imagestore.py
+# Content-addressed screenshot store: images are kept under their SHA-256, copied byte for byte,
+# with a fixed-size thumbnail next to each one. Identical screenshots are stored once.
+# Each journal has its own store beside its database file (see images_dir):
+#
+#   journal-images/ab/abcdef....png          original, exactly as uploaded
+#   journal-images/thumbs/ab/abcdef....png   thumbnail (fits THUMB_SIZE, aspect kept)
+#
+# Unreferenced files are removed with: python -m cli gc-images [--dry-run]
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+import perf
+
+IMAGES_SUFFIX = "-images"
+THUMBS_DIR = "thumbs"
+THUMB_SIZE = (250, 150)
+
+# Decoded thumbnails kept in memory by ThumbnailCache (pixel bytes)
+THUMB_CACHE_BYTES = 32 * 1024 * 1024
+
+# Files younger than this are never collected: they may belong to a trade that is still being entered
+GC_MIN_AGE = 3600
+
+HASH_CHUNK = 1 << 20
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _replace_from(src, dest):
+    # Copy to a temporary name first so a half-written file never appears under its final name
+    tmp = f"{dest}.{os.getpid()}.part"
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def images_dir(db_path):
+    # The store of the journal at db_path: journal.db -> journal-images/. Not shared, so
+    # collect_garbage, which only knows one journal's references, can't delete another's files.
+    return os.path.splitext(db_path)[0] + IMAGES_SUFFIX
+
+
+def image_path(digest, ext, root):
+    return os.path.join(root, digest[:2], digest + ext)
+
+
+def thumbnail_path(path, root):
+    # Where the thumbnail of a stored image lives; derived from the name, so it is known before it exists
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(root, THUMBS_DIR, name[:2], name + ".png")
+
+
+def store_image(src, root):
+    # Copy src into the store unless the same bytes are already there; returns the stored path
+    digest = file_digest(src)
+    ext = os.path.splitext(src)[1].lower() or ".img"
+    dest = image_path(digest, ext, root)
+    if os.path.exists(dest):
+        # Already stored: refresh its age, so collect_garbage doesn't take it from an unsaved trade
+        os.utime(dest)
+    else:
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        _replace_from(src, dest)
+    return dest
+
+
+def decode_thumbnail(path, size=THUMB_SIZE):
+    # Decode an image scaled to fit size, without materializing more pixels than needed:
+    # JPEGs are decoded at 1/2, 1/4 or 1/8 scale by draft(), other formats are box-reduced
+    # by an integer factor before the final resample.
+    from PIL import Image
+
+    with Image.open(path) as img:
+        img.draft("RGB", size)
+        # reduce() doesn't take palette, 1-bit or 16-bit images (common PNG screenshot modes)
+        if img.mode not in ("RGB", "RGBA", "L"):
+            img = img.convert("RGBA")
+        factor = min(img.width // size[0], img.height // size[1])
+        if factor >= 2:
+            img = img.reduce(factor)
+        else:
+            img.load()
+        img.thumbnail(size)
+        return img
+
+
+def make_thumbnail(path, root, size=THUMB_SIZE):
+    # Write the thumbnail of a stored image (only refreshes its age if it exists); returns its path
+    dest = thumbnail_path(path, root)
+    if os.path.exists(dest):
+        os.utime(dest)
+        return dest
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    img = decode_thumbnail(path, size)
+    tmp = f"{dest}.{os.getpid()}.part"
+    try:
+        img.save(tmp, "PNG")
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return dest
+
+
+class ThumbnailCache:
+    """Decoded thumbnails in least-recently-used order, bounded by their total pixel bytes.
+
+    Entries are keyed by (path, mtime), so a file replaced on disk is decoded again.
+    Safe to use from several worker threads.
+    """
+
+    def __init__(self, max_bytes=THUMB_CACHE_BYTES, size=THUMB_SIZE):
+        self.max_bytes = max_bytes
+        self.size = size
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        # The thumbnail of path as a PIL image, or None if the file is missing
+        try:
+            key = (path, os.stat(path).st_mtime_ns)
+        except OSError:
+            return None
+        with self._lock:
+            img = self.entries.get(key)
+            if img is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return img
+            self.misses += 1
+        with perf.span("thumbnail.decode"):
+            img = decode_thumbnail(path, self.size)
+        with self._lock:
+            if key not in self.entries:
+                self.entries[key] = img
+                self.bytes += _image_bytes(img)
+                # Evict from the cold end, but always keep the image just added
+                while self.bytes > self.max_bytes and len(self.entries) > 1:
+                    _, old = self.entries.popitem(last=False)
+                    self.bytes -= _image_bytes(old)
+        return img
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.bytes = 0
+
+
+def _image_bytes(img):
+    return img.width * img.height * len(img.getbands())
+
+
+def _normalized(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def collect_garbage(repo, root=None, dry_run=False, min_age=GC_MIN_AGE):
+    # Delete files under root (the journal's own store by default) that no trade of repo
+    # references. Returns (removed paths, bytes freed).
+    root = root or images_dir(repo.path)
+    referenced = {_normalized(p) for p in repo.image_paths()}
+    cutoff = time.time() - min_age
+    removed, freed = [], 0
+    for folder, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(folder, name)
+            if _normalized(path) in referenced:
+                continue
+            stat = os.stat(path)
+            if stat.st_mtime > cutoff:
+                continue
+            if not dry_run:
+                os.remove(path)
+            removed.append(path)
+            freed += stat.st_size
+    if not dry_run:
+        # Drop the fan-out folders that are now empty
+        for folder, _, _ in os.walk(root, topdown=False):
+            if folder != root and not os.listdir(folder):
+                os.rmdir(folder)
+    return removed, freed
+
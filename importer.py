@@ -0,0 +1,173 @@
+# importer.py
+# Streaming CSV / broker-statement import into the trades table
+
+import csv
+import hashlib
+from collections import Counter
+from itertools import islice
+
+from repository import IMPORT_COLUMNS, TRADE_DEFAULTS
+
+# Rows per executemany() call
+IMPORT_BATCH_SIZE = 10000
+
+# Normalized CSV header -> trades column. Covers the app's own CSV export,
+# the raw column names and the usual broker statement spellings.
+COLUMN_ALIASES = {
+    "date": "date", "time": "date", "datetime": "date", "open time": "date", "close time": "date",
+    "trade date": "date",
+    "pair": "pair", "symbol": "pair", "instrument": "pair", "market": "pair", "ticker": "pair",
+    "direction": "direction", "side": "direction", "type": "direction", "trade type": "direction",
+    "quantity": "quantity", "qty": "quantity", "size": "quantity", "volume": "quantity",
+    "lots": "quantity", "lot size": "quantity",
+    "strategy": "strategy", "setup": "strategy", "strategy name": "strategy",
+    "profit%": "profit_percent", "profit %": "profit_percent", "profit_percent": "profit_percent",
+    "p/l %": "profit_percent", "pnl %": "profit_percent", "pnl%": "profit_percent",
+    "return %": "profit_percent", "profit/loss %": "profit_percent",
+    "notes": "notes", "comment": "notes", "comments": "notes",
+    "pre image": "pre_image_path", "pre_image_path": "pre_image_path",
+    "post image": "post_image_path", "post_image_path": "post_image_path",
+    "pre thumb": "pre_thumb_path", "pre_thumb_path": "pre_thumb_path",
+    "post thumb": "post_thumb_path", "post_thumb_path": "post_thumb_path",
+    "ticket": "import_key", "order id": "import_key", "trade id": "import_key", "deal": "import_key",
+    "deal id": "import_key", "position id": "import_key", "import_key": "import_key",
+    "rules_mask": "rules_mask",
+}
+
+DIRECTIONS = {"buy": "Buy", "long": "Buy", "b": "Buy", "sell": "Sell", "short": "Sell", "s": "Sell"}
+TRUE_VALUES = {"1", "true", "yes", "y", "x", "✓"}
+
+NUMERIC_COLUMNS = ("quantity", "profit_percent")
+
+
+def rule_aliases(rules):
+    # Normalized CSV header -> rule key for the journal's (key, label) rules (key, label, and the
+    # key spelled with spaces, which is how export_csv heads the default rules)
+    aliases = {}
+    for key, label in rules:
+        aliases[key] = aliases[label.lower()] = aliases[key.replace("_", " ")] = key
+    return aliases
+
+
+def map_header(header, rules, rule_bits, column_map=None):
+    # CSV column index -> trades column or rule key, using column_map overrides first. rules and
+    # rule_bits are the journal's, as on TradeRepository.
+    overrides = {k.strip().lower(): v for k, v in (column_map or {}).items()}
+    aliases = dict(COLUMN_ALIASES, **rule_aliases(rules))
+    mapping = {}
+    for index, name in enumerate(header):
+        name = name.strip().lower()
+        column = overrides.get(name) or aliases.get(name)
+        if (column in IMPORT_COLUMNS or column in rule_bits) and column not in mapping.values():
+            mapping[index] = column
+    return mapping
+
+
+def _number(text):
+    text = text.replace(",", "").rstrip("%")
+    return float(text) if text else 0.0
+
+
+def _flag(text):
+    return 1 if text.lower() in TRUE_VALUES else 0
+
+
+def _direction(text):
+    return DIRECTIONS.get(text.lower(), text)
+
+
+def _text(text):
+    return text
+
+
+def _key(text):
+    return text or None
+
+
+def _mask(text):
+    return int(text) if text else 0
+
+
+def _converter(column):
+    if column in NUMERIC_COLUMNS:
+        return _number
+    if column == "rules_mask":
+        return _mask
+    if column == "direction":
+        return _direction
+    if column == "import_key":
+        return _key
+    return _text
+
+
+# Positions in IMPORT_COLUMNS of the fields the content hash is built from
+KEY_FIELDS = tuple(IMPORT_COLUMNS.index(c) for c in ("date", "pair", "direction", "quantity", "strategy", "profit_percent"))
+KEY_POSITION = IMPORT_COLUMNS.index("import_key")
+MASK_POSITION = IMPORT_COLUMNS.index("rules_mask")
+
+
+def natural_key(values, occurrence=1):
+    # Content hash for rows without a broker ticket: the same fill always maps to the same key.
+    # occurrence counts identical fills within one file, so repeated fills (date-only scalps) each
+    # get a key and re-importing the file still skips them all; the first keeps the plain hash.
+    basis = "\x1f".join(str(values[i]) for i in KEY_FIELDS)
+    if occurrence > 1:
+        basis += f"\x1f#{occurrence}"
+    return "sha1:" + hashlib.sha1(basis.encode("utf-8")).hexdigest()
+
+
+def read_trades(path, rules, rule_bits, column_map=None, encoding="utf-8-sig"):
+    # Generator of IMPORT_COLUMNS tuples, one per CSV row; only one row is held in memory at a time
+    # (plus a count per distinct fill without a ticket)
+    with open(path, newline="", encoding=encoding) as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        mapping = map_header(header, rules, rule_bits, column_map)
+        if "date" not in mapping.values() or "profit_percent" not in mapping.values():
+            raise ValueError("CSV needs at least a date and a profit % column")
+
+        # Resolve every column's target position and converter once, not per row.
+        # Rule columns are flags folded into rules_mask.
+        plan = [(IMPORT_COLUMNS.index(column), index, _converter(column))
+                for index, column in mapping.items() if column not in rule_bits]
+        rule_plan = [(index, 1 << rule_bits[column]) for index, column in mapping.items() if column in rule_bits]
+        width = max(mapping) + 1
+        defaults = [TRADE_DEFAULTS.get(c) for c in IMPORT_COLUMNS]
+        occurrences = Counter()
+
+        for line_no, row in enumerate(reader, start=2):
+            if len(row) < width:
+                if not any(cell.strip() for cell in row):
+                    continue
+                row = row + [""] * (width - len(row))
+            values = defaults[:]
+            try:
+                for position, index, convert in plan:
+                    values[position] = convert(row[index].strip())
+                for index, bit in rule_plan:
+                    if _flag(row[index].strip()):
+                        values[MASK_POSITION] |= bit
+            except ValueError as e:
+                raise ValueError(f"{path}, line {line_no}: {e}") from None
+            if values[KEY_POSITION] is None:
+                fill = tuple(values[i] for i in KEY_FIELDS)
+                occurrences[fill] += 1
+                values[KEY_POSITION] = natural_key(values, occurrences[fill])
+            yield tuple(values)
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def import_csv(repo, path, column_map=None, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    # Stream a CSV into the journal in one transaction; returns (inserted, skipped).
+    # progress(inserted, skipped) is called after every batch; raising from it rolls the import back.
+    return repo.insert_trades(batched(read_trades(path, repo.rules, repo.rule_bits, column_map), batch_size), progress)
@@ -1,68 +1,167 @@
 # main.py
 # Trading Journal Desktop App using Tkinter + SQLite
 
+# matplotlib, numpy and PIL are imported where they are first needed, so the Add Trade form
+# comes up without loading them; importing this module has no side effects.
+
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, scrolledtext
 from tkinter import simpledialog
-import sqlite3
 import os
+import sys
 import datetime
-import csv
-from PIL import Image, ImageTk
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-
-# Ensure images directory exists
-os.makedirs("images", exist_ok=True)
-
-# Database setup
-DB_PATH = "journal.db"
-
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS trades (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT,
-            pair TEXT,
-            direction TEXT,
-            quantity REAL,
-            strategy TEXT,
-            waited_4h INTEGER,
-            trend_followed INTEGER,
-            rr_ok INTEGER,
-            emotional INTEGER,
-            followed_plan INTEGER,
-            profit_percent REAL,
-            notes TEXT,
-            pre_image_path TEXT,
-            post_image_path TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-init_db()
-
-# Global checklist rules (easily editable)
-RULES = [
-    ("waited_4h", "Waited for 4H candle close"),
-    ("trend_followed", "Followed trend"),
-    ("rr_ok", "Proper risk-reward"),
-    ("emotional", "No emotional entry"),
-    ("followed_plan", "Entry matched plan")
-]
+import threading
+import exporter
+import imagestore
+import importer
+import migrations
+import perf
+from events import INSERTED
+from repository import DB_PATH, TradeRepository, history_filter_clauses, match_spans, search_query, year_range
+from tasks import TaskScheduler
+
+# Rows fetched above and below the visible History window
+HISTORY_PREFETCH = 200
+
+# Milliseconds the History search waits after the last keystroke
+SEARCH_DELAY = 250
+
+# Trade changes arriving within one frame (milliseconds) are applied to the views together
+CHANGE_FRAME = 16
+
+# Risk view strategy choice that resamples every trade
+ALL_STRATEGIES = "All strategies"
+
+# Calendar heatmap geometry (pixels): cell pitch, room for month labels above and weekday labels left
+HEATMAP_CELL = 14
+HEATMAP_TOP = 18
+HEATMAP_LEFT = 34
+
+# -------------------------- WORKER HELPERS --------------------------
+# These run on the task pool: they may touch the database and files, never Tk.
+
+def read_history_window(pager, top, visible, jump_to=None):
+    # Count, resolve the top row and read the window around it
+    total = pager.count()
+    if jump_to is not None:
+        top = pager.position_of(jump_to)
+    top = max(0, min(top, total - visible))
+    start = max(0, top - HISTORY_PREFETCH)
+    return total, top, start, with_matches(pager, pager.page_at(start, top - start + visible + HISTORY_PREFETCH))
+
+def read_history_page(pager, kind, arg, limit):
+    if kind == "after":
+        return with_matches(pager, pager.page_after(arg, limit))
+    if kind == "before":
+        return with_matches(pager, pager.page_before(arg, limit))
+    return with_matches(pager, pager.page_at(arg, limit))
+
+def read_history_rows(pager, ids):
+    # The History rows of changed trades, for those still passing the filters
+    return with_matches(pager, pager.rows_of(ids))
+
+def with_matches(pager, rows):
+    # While searching, each row gets its marked search match appended (the Match column)
+    if not pager.query:
+        return rows
+    matches = pager.matches([row[0] for row in rows])
+    return [row + (matches.get(row[0], ""),) for row in rows]
+
+def load_calendar(repo, year, period):
+    # Years with dated trades, the year to show (the latest unless year is one of them),
+    # and that year's day rollups and rollups of the chosen period
+    years = repo.rollup_years()
+    if year not in years:
+        year = years[-1] if years else None
+    if year is None:
+        return years, None, [], []
+    return years, year, repo.rollups("day", *year_range(year)), repo.rollups(period, *year_range(year, period))
+
+def heat_color(fraction):
+    # Heatmap fill for a day's P/L as a fraction of the year's scale: green up, red down
+    base = (235, 237, 240)
+    if not fraction:
+        return "#c8ccd2"
+    target = (33, 110, 57) if fraction > 0 else (179, 29, 40)
+    weight = min(1.0, 0.2 + 0.8 * abs(fraction))
+    return "#%02x%02x%02x" % tuple(round(b + (t - b) * weight) for b, t in zip(base, target))
+
+def load_trade_details(repo, pid, thumbnails):
+    # The trade plus its screenshots, decoded and scaled through the thumbnail cache
+    trade = repo.get_trade(pid)
+    images = []
+    if trade:
+        for path, thumb, label in ((trade.pre_image_path, trade.pre_thumb_path, "Pre-Trade Screenshot:"),
+                                   (trade.post_image_path, trade.post_thumb_path, "Post-Trade Screenshot:")):
+            # Screenshots saved before thumbnails existed (or whose thumbnail is still rendering)
+            # fall back to a reduced decode of the original
+            img = thumbnails.get(thumb) if thumb else None
+            if img is None and path:
+                img = thumbnails.get(path)
+            if img is not None:
+                images.append((label, img))
+    return trade, images
+
+def open_repository(path):
+    # Open a journal, migrating it first: an older or large one can take a while
+    repo = TradeRepository(path)
+    try:
+        repo.init_schema()
+    except BaseException:
+        repo.close()
+        raise
+    return repo
+
+def load_portfolio(paths, width):
+    # Aggregate the journals (in a process pool) and reduce each equity curve to the plot width
+    import matplotlib.dates as mdates
+    import equity
+    import portfolio
+
+    result = portfolio.aggregate_journals(paths)
+    curves = []
+    series = [(j.name, j.dates, j.profit) for j in result.journals] + [("Combined", result.dates, result.profit)]
+    for name, dates, profit in series:
+        x, y = portfolio.equity_curve(dates, profit)
+        curves.append((name, *equity.downsample_m4(mdates.date2num(x), y, width)))
+    return result, curves
 
 # -------------------------- MAIN APP --------------------------
 
 class TradingJournalApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, path=DB_PATH):
         super().__init__()
-        self.title("Trading Journal")
         self.geometry("1000x700")
         self.minsize(900, 600)
 
+        self.repo = TradeRepository(path)
+        self.repo.init_schema()
+        self.show_journal_name()
+        self.thumbnails = imagestore.ThumbnailCache()
+        self.tasks = TaskScheduler(self, on_error=self.show_task_error)
+        self.pending_changes = []
+        self.changes_after = None
+        self.change_seq = 0
+        self.watch_repository()
+        self.export_cancels = set()
+        self.opening_journal = None
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Journal menu: switch between journal files, or look at several together
+        menubar = tk.Menu(self)
+        journal_menu = tk.Menu(menubar, tearoff=False)
+        journal_menu.add_command(label="Open Journal...", command=self.choose_journal)
+        journal_menu.add_command(label="New Journal...", command=lambda: self.choose_journal(new=True))
+        journal_menu.add_separator()
+        journal_menu.add_command(label="Portfolio...", command=self.open_portfolio_window)
+        menubar.add_cascade(label="Journal", menu=journal_menu)
+        self.config(menu=menubar)
+        self.portfolio_window = None
+
+        # Status bar for long-running jobs (import/export progress)
+        self.status_var = tk.StringVar()
+        tk.Label(self, textvariable=self.status_var, anchor="w").pack(side="bottom", fill="x", padx=10)
+
         # Notebook for tabs
         self.notebook = ttk.Notebook(self)
         self.notebook.pack(fill="both", expand=True, padx=10, pady=10)
@@ -76,9 +175,205 @@ class TradingJournalApp(tk.Tk):
         self.notebook.add(self.history_tab, text="History")
         self.notebook.add(self.stats_tab, text="Statistics")
 
+        # Only the Add Trade form is built up front; the other tabs are built and
+        # populated the first time they are selected
         self.create_add_trade_tab()
-        self.create_history_tab()
-        self.create_statistics_tab()
+        self.tab_builders = {
+            str(self.history_tab): self.create_history_tab,
+            str(self.stats_tab): self.create_statistics_tab,
+        }
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+        self.bind("<F12>", lambda e: self.open_performance_panel())
+        self.performance_window = None
+
+    def on_tab_changed(self, event):
+        builder = self.tab_builders.pop(self.notebook.select(), None)
+        if builder:
+            builder()
+
+    def tab_built(self, tab):
+        return str(tab) not in self.tab_builders
+
+    def on_close(self):
+        for cancel in list(self.export_cancels):
+            cancel.set()
+        self.tasks.shutdown()
+        self.repo.close()
+        self.destroy()
+
+    def show_task_error(self, error):
+        messagebox.showerror("Error", str(error))
+
+    # -------------------------- JOURNALS --------------------------
+
+    def show_journal_name(self):
+        name = os.path.splitext(os.path.basename(self.repo.path))[0]
+        self.title(f"Trading Journal - {name}")
+
+    def choose_journal(self, new=False):
+        filetypes = [("Journal", "*.db"), ("All files", "*.*")]
+        if new:
+            path = filedialog.asksaveasfilename(defaultextension=".db", filetypes=filetypes, confirmoverwrite=False)
+        else:
+            path = filedialog.askopenfilename(filetypes=filetypes)
+        if path:
+            self.open_journal(path)
+
+    def open_journal(self, path):
+        if os.path.abspath(path) == os.path.abspath(self.repo.path):
+            return
+        if self.export_cancels:
+            messagebox.showinfo("Journal", "Wait for the running export to finish before switching journals.")
+            return
+        if self.opening_journal:
+            messagebox.showinfo("Journal", f"Still opening {self.opening_journal}.")
+            return
+
+        def opened(repo):
+            self.opening_journal = None
+            self.status_var.set("")
+            self.switch_journal(repo)
+
+        def failed(e):
+            self.opening_journal = None
+            self.status_var.set("")
+            messagebox.showerror("Journal", f"Could not open {path}: {e}")
+
+        # Migrated on the pool, so an old or large journal doesn't freeze the window meanwhile
+        self.opening_journal = path
+        self.status_var.set(f"Opening {path}...")
+        self.tasks.submit(open_repository, path, on_done=opened, on_error=failed, name="open_journal")
+
+    def switch_journal(self, repo):
+        # Results still on their way are for the old journal. It is closed (WAL checkpoint,
+        # planner statistics) once the tasks already running against it are done.
+        old = self.repo
+        self.tasks.cancel_all()
+        self.tasks.after_running(old.close, name="close_journal")
+        self.pending_changes = []
+        self.repo = repo
+        self.watch_repository()
+        self.show_journal_name()
+        self.build_checklist()
+        if self.tab_built(self.history_tab):
+            self.history_selected_id = None
+            self.history_pager = repo.history()
+            self.load_history()
+        if self.tab_built(self.stats_tab):
+            self.update_stats()
+
+    def open_portfolio_window(self):
+        # Several journals at once: per-journal and combined statistics and equity curves
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        win = self.portfolio_window
+        if win is not None and win.winfo_exists():
+            win.lift()
+            return
+        win = self.portfolio_window = tk.Toplevel(self)
+        win.title("Portfolio")
+        win.geometry("900x650")
+
+        top = ttk.Frame(win)
+        top.pack(fill="x", padx=10, pady=5)
+        self.portfolio_list = tk.Listbox(top, height=4, selectmode="extended")
+        self.portfolio_list.pack(side="left", fill="x", expand=True)
+        self.portfolio_list.insert("end", os.path.abspath(self.repo.path))
+        buttons = ttk.Frame(top)
+        buttons.pack(side="left", padx=5)
+        tk.Button(buttons, text="Add Journals...", command=self.add_portfolio_journals).pack(fill="x", pady=1)
+        tk.Button(buttons, text="Remove", command=lambda: [self.portfolio_list.delete(i) for i in
+                                                           reversed(self.portfolio_list.curselection())]).pack(fill="x", pady=1)
+        tk.Button(buttons, text="Aggregate", command=self.aggregate_portfolio).pack(fill="x", pady=1)
+
+        self.portfolio_tree = ttk.Treeview(win, columns=("journal", "trades", "winrate", "expectancy", "pf", "total", "drawdown"),
+                                           show="headings", height=6)
+        for col, text, width in (("journal", "Journal", 220), ("trades", "Trades", 70), ("winrate", "Win Rate", 80),
+                                 ("expectancy", "Expectancy", 90), ("pf", "Profit Factor", 90),
+                                 ("total", "Total P/L %", 90), ("drawdown", "Max Drawdown", 100)):
+            self.portfolio_tree.heading(col, text=text)
+            self.portfolio_tree.column(col, width=width, anchor="w" if col == "journal" else "e")
+        self.portfolio_tree.tag_configure("combined", font=("Arial", 10, "bold"))
+        self.portfolio_tree.pack(fill="x", padx=10, pady=5)
+
+        self.portfolio_fig = Figure(figsize=(6, 3))
+        self.portfolio_ax = self.portfolio_fig.add_subplot()
+        self.portfolio_canvas = FigureCanvasTkAgg(self.portfolio_fig, master=win)
+        self.portfolio_canvas.get_tk_widget().pack(fill="both", expand=True, padx=10, pady=(0, 10))
+
+    def add_portfolio_journals(self):
+        known = set(self.portfolio_list.get(0, "end"))
+        for path in filedialog.askopenfilenames(filetypes=[("Journal", "*.db"), ("All files", "*.*")]):
+            if os.path.abspath(path) not in known:
+                self.portfolio_list.insert("end", os.path.abspath(path))
+
+    def aggregate_portfolio(self):
+        paths = list(self.portfolio_list.get(0, "end"))
+        if not paths:
+            return
+        self.status_var.set(f"Aggregating {len(paths)} journals...")
+        width = max(1, int(self.portfolio_ax.bbox.width))
+        self.tasks.submit(load_portfolio, paths, width, on_done=self.show_portfolio, view="portfolio",
+                          name="aggregate_portfolio")
+
+    def show_portfolio(self, result):
+        import matplotlib.dates as mdates
+
+        portfolio, curves = result
+        self.status_var.set("")
+        if not self.portfolio_window or not self.portfolio_window.winfo_exists():
+            return
+        tree = self.portfolio_tree
+        tree.delete(*tree.get_children())
+        rows = [(j.name, j.metrics, ()) for j in portfolio.journals] + [("Combined", portfolio.metrics, ("combined",))]
+        for name, m, tags in rows:
+            tree.insert("", "end", tags=tags, values=(
+                name, m.trades, f"{m.win_rate:.1f}%", f"{m.expectancy:.2f}%", f"{m.profit_factor:.2f}",
+                f"{m.total:.2f}%", f"{m.max_drawdown:.2f}%"))
+
+        ax = self.portfolio_ax
+        ax.clear()
+        locator = mdates.AutoDateLocator()
+        ax.xaxis.set_major_locator(locator)
+        ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+        ax.set_title("Equity Curves")
+        ax.set_ylabel("Cumulative P/L %")
+        for name, x, y in curves:
+            combined = name == "Combined"
+            ax.plot(x, y, label=name, linewidth=2.0 if combined else 1.0, color="black" if combined else None)
+        if curves:
+            ax.legend(loc="upper left", fontsize="small")
+        self.portfolio_canvas.draw_idle()
+
+    # -------------------------- TRADE CHANGES --------------------------
+    # The repository publishes every trade it inserts, updates or deletes; each view patches in
+    # just those trades rather than reloading. Bulk imports reload instead.
+    # Changes are numbered as they arrive (change_seq). A view remembers the number its data was
+    # read at and skips changes up to it; a read that changes arrived during may or may not show
+    # them, so it is read again.
+
+    def watch_repository(self):
+        repo = self.repo
+        # Runs on the worker thread that made the change: queue the event for the Tk thread
+        repo.events.subscribe(lambda event: self.tasks.post(self.queue_change, repo, event))
+
+    def queue_change(self, repo, event):
+        if repo is not self.repo:
+            return
+        self.change_seq += 1
+        self.pending_changes.append((self.change_seq, event))
+        if self.changes_after is None:
+            self.changes_after = self.after(CHANGE_FRAME, self.apply_changes)
+
+    @perf.timed("apply_changes")
+    def apply_changes(self):
+        # Everything that changed during the frame, applied in one pass per view
+        changes, self.pending_changes = self.pending_changes, []
+        self.changes_after = None
+        if changes:
+            self.patch_history(changes)
+            self.patch_statistics(changes)
 
     # -------------------------- ADD TRADE TAB --------------------------
 
@@ -120,12 +415,11 @@ class TradingJournalApp(tk.Tk):
         tk.Label(frame, text="Checklist:", font=("Arial", 10, "bold")).grid(row=row, column=0, sticky="w", padx=5, pady=3)
         row += 1
 
-        self.check_vars = {}
-        for key, label in RULES:
-            var = tk.IntVar(value=0)
-            tk.Checkbutton(frame, text=label, variable=var).grid(row=row, column=0, sticky="w", padx=10, pady=2)
-            self.check_vars[key] = var
-            row += 1
+        # One checkbox per rule of the open journal; rebuilt when another journal is opened
+        self.checklist_frame = tk.Frame(frame)
+        self.checklist_frame.grid(row=row, column=0, sticky="w")
+        self.build_checklist()
+        row += 1
 
         # Result
         tk.Label(frame, text="Profit/Loss %:", font=("Arial", 10, "bold")).grid(row=row, column=0, sticky="w", padx=5, pady=3)
@@ -146,67 +440,78 @@ class TradingJournalApp(tk.Tk):
         # Image uploads
         tk.Label(frame, text="Pre-Trade Screenshot:").grid(row=row, column=0, sticky="w", padx=5, pady=3)
         self.pre_image_path = tk.StringVar()
-        tk.Button(frame, text="Upload", command=lambda: self.upload_image(self.pre_image_path)).grid(row=row, column=1, sticky="w", padx=5, pady=3)
+        self.pre_thumb_path = tk.StringVar()
+        tk.Button(frame, text="Upload", command=lambda: self.upload_image(self.pre_image_path, self.pre_thumb_path)).grid(row=row, column=1, sticky="w", padx=5, pady=3)
         row += 1
 
         tk.Label(frame, text="Post-Trade Screenshot:").grid(row=row, column=0, sticky="w", padx=5, pady=3)
         self.post_image_path = tk.StringVar()
-        tk.Button(frame, text="Upload", command=lambda: self.upload_image(self.post_image_path)).grid(row=row, column=1, sticky="w", padx=5, pady=3)
+        self.post_thumb_path = tk.StringVar()
+        tk.Button(frame, text="Upload", command=lambda: self.upload_image(self.post_image_path, self.post_thumb_path)).grid(row=row, column=1, sticky="w", padx=5, pady=3)
         row += 1
 
         # Save button
-        tk.Button(frame, text="Save Trade", bg="green", fg="white", font=("Arial", 11, "bold"),
-                  command=self.save_trade).grid(row=row, column=0, columnspan=2, pady=15)
+        self.save_button = tk.Button(frame, text="Save Trade", bg="green", fg="white", font=("Arial", 11, "bold"),
+                                     command=self.save_trade)
+        self.save_button.grid(row=row, column=0, columnspan=2, pady=15)
+
+    def build_checklist(self):
+        for child in self.checklist_frame.winfo_children():
+            child.destroy()
+        self.check_vars = {}
+        for row, (key, label) in enumerate(self.repo.rules):
+            var = tk.IntVar(value=0)
+            tk.Checkbutton(self.checklist_frame, text=label, variable=var).grid(row=row, column=0, sticky="w", padx=10, pady=2)
+            self.check_vars[key] = var
 
-    def upload_image(self, path_var):
+    def upload_image(self, path_var, thumb_var):
         file_path = filedialog.askopenfilename(filetypes=[("Images", "*.png *.jpg *.jpeg *.bmp")])
-        if file_path:
-            # Copy image to /images folder
-            filename = os.path.basename(file_path)
-            new_path = os.path.join("images", filename)
-            try:
-                img = Image.open(file_path)
-                img.save(new_path)
-                path_var.set(new_path)
-            except Exception as e:
-                messagebox.showerror("Error", f"Could not save image: {e}")
+        if not file_path:
+            return
+        root = imagestore.images_dir(self.repo.path)
+
+        def stored(path):
+            # The thumbnail's path is known up front; the file itself is rendered in the background
+            path_var.set(path)
+            thumb_var.set(imagestore.thumbnail_path(path, root))
+            self.tasks.submit(imagestore.make_thumbnail, path, root, name="upload_image.thumbnail",
+                              on_error=lambda e: self.status_var.set(f"Could not create thumbnail: {e}"))
+
+        self.tasks.submit(imagestore.store_image, file_path, root, on_done=stored, name="upload_image",
+                          on_error=lambda e: messagebox.showerror("Error", f"Could not save image: {e}"))
 
     def save_trade(self):
         try:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                INSERT INTO trades (
-                    date, pair, direction, quantity, strategy,
-                    waited_4h, trend_followed, rr_ok, emotional, followed_plan,
-                    profit_percent, notes, pre_image_path, post_image_path
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                self.date_var.get(),
-                self.pair_var.get(),
-                self.direction_var.get(),
-                float(self.quantity_var.get() or 0),
-                self.strategy_var.get(),
-                self.check_vars["waited_4h"].get(),
-                self.check_vars["trend_followed"].get(),
-                self.check_vars["rr_ok"].get(),
-                self.check_vars["emotional"].get(),
-                self.check_vars["followed_plan"].get(),
-                float(self.profit_var.get() or 0),
-                self.notes_text.get("1.0", "end-1c"),
-                self.pre_image_path.get(),
-                self.post_image_path.get()
-            ))
-
-            conn.commit()
-            conn.close()
+            fields = dict(
+                rules_mask=self.repo.rule_mask(key for key, var in self.check_vars.items() if var.get()),
+                date=self.date_var.get(),
+                pair=self.pair_var.get(),
+                direction=self.direction_var.get(),
+                quantity=float(self.quantity_var.get() or 0),
+                strategy=self.strategy_var.get(),
+                profit_percent=float(self.profit_var.get() or 0),
+                notes=self.notes_text.get("1.0", "end-1c"),
+                pre_image_path=self.pre_image_path.get(),
+                post_image_path=self.post_image_path.get(),
+                pre_thumb_path=self.pre_thumb_path.get(),
+                post_thumb_path=self.post_thumb_path.get(),
+            )
+        except ValueError as e:
+            messagebox.showerror("Error", f"Could not save trade: {e}")
+            return
 
+        def saved(trade_id):
+            self.save_button.config(state="normal")
             messagebox.showinfo("Success", "Trade saved successfully!")
             self.clear_form()
-        except Exception as e:
+
+        def failed(e):
+            self.save_button.config(state="normal")
             messagebox.showerror("Error", f"Could not save trade: {e}")
 
+        self.save_button.config(state="disabled")
+        self.tasks.submit(self.repo.insert_trade, on_done=saved, on_error=failed, name="save_trade", **fields)
+
     def clear_form(self):
         self.pair_var.set("")
         self.quantity_var.set("")
@@ -216,6 +521,8 @@ class TradingJournalApp(tk.Tk):
         self.notes_text.delete("1.0", "end")
         self.pre_image_path.set("")
         self.post_image_path.set("")
+        self.pre_thumb_path.set("")
+        self.post_thumb_path.set("")
         for var in self.check_vars.values():
             var.set(0)
 
@@ -228,7 +535,15 @@ class TradingJournalApp(tk.Tk):
         filter_frame = ttk.Frame(frame)
         filter_frame.pack(pady=5, padx=5, anchor="w")
 
-        tk.Label(filter_frame, text="Filter:").pack(side="left", padx=3)
+        tk.Label(filter_frame, text="Search:").pack(side="left", padx=3)
+        self.search_var = tk.StringVar()
+        search_entry = tk.Entry(filter_frame, textvariable=self.search_var, width=20)
+        search_entry.pack(side="left", padx=3)
+        search_entry.bind("<Return>", lambda e: self.load_history())
+        self.search_after = None
+        self.search_var.trace_add("write", self.schedule_search)
+
+        tk.Label(filter_frame, text="Filter:").pack(side="left", padx=(10, 3))
         self.filter_var = tk.StringVar(value="All")
         tk.OptionMenu(filter_frame, self.filter_var, "All", "Winning", "Losing", "By Strategy", command=self.load_history).pack(side="left", padx=3)
 
@@ -236,24 +551,85 @@ class TradingJournalApp(tk.Tk):
         tk.Entry(filter_frame, textvariable=self.strategy_filter_var, width=15).pack(side="left", padx=3)
         tk.Button(filter_frame, text="Apply", command=self.load_history).pack(side="left", padx=3)
 
-        tk.Button(filter_frame, text="Export CSV", command=self.export_csv).pack(side="left", padx=10)
+        tk.Button(filter_frame, text="Export CSV", command=self.export_csv).pack(side="left", padx=(10, 3))
+        tk.Button(filter_frame, text="Export Columnar", command=self.export_columnar).pack(side="left", padx=3)
+        tk.Button(filter_frame, text="Import CSV", command=self.import_csv).pack(side="left", padx=3)
+
+        # Date range / pair / direction filters
+        range_frame = ttk.Frame(frame)
+        range_frame.pack(pady=2, padx=5, anchor="w")
+
+        tk.Label(range_frame, text="From:").pack(side="left", padx=3)
+        self.date_from_var = tk.StringVar()
+        tk.Entry(range_frame, textvariable=self.date_from_var, width=12).pack(side="left", padx=3)
+        tk.Label(range_frame, text="To:").pack(side="left", padx=3)
+        self.date_to_var = tk.StringVar()
+        tk.Entry(range_frame, textvariable=self.date_to_var, width=12).pack(side="left", padx=3)
+
+        tk.Label(range_frame, text="Pair:").pack(side="left", padx=3)
+        self.pair_filter_var = tk.StringVar()
+        tk.Entry(range_frame, textvariable=self.pair_filter_var, width=10).pack(side="left", padx=3)
+
+        tk.Label(range_frame, text="Type:").pack(side="left", padx=3)
+        self.direction_filter_var = tk.StringVar(value="Any")
+        tk.OptionMenu(range_frame, self.direction_filter_var, "Any", "Buy", "Sell", command=self.load_history).pack(side="left", padx=3)
+
+        tk.Label(range_frame, text="Go to date:").pack(side="left", padx=(15, 3))
+        self.jump_date_var = tk.StringVar()
+        jump_entry = tk.Entry(range_frame, textvariable=self.jump_date_var, width=12)
+        jump_entry.pack(side="left", padx=3)
+        jump_entry.bind("<Return>", lambda e: self.jump_to_date())
+        tk.Button(range_frame, text="Go", command=self.jump_to_date).pack(side="left", padx=3)
+
+        # Treeview: a fixed pool of rows re-filled from the paged window as it scrolls
+        table_frame = ttk.Frame(frame)
+        table_frame.pack(fill="both", expand=True, padx=5, pady=5)
 
-        # Treeview
-        self.history_tree = ttk.Treeview(frame, columns=(
-            "id", "date", "pair", "direction", "profit", "winloss", "strategy"
-        ), show="headings")
+        self.history_tree = ttk.Treeview(table_frame, columns=(
+            "id", "date", "pair", "direction", "profit", "winloss", "strategy", "match"
+        ), show="headings", selectmode="browse")
 
         for col, text in zip(
-            ("id", "date", "pair", "direction", "profit", "winloss", "strategy"),
-            ("ID", "Date", "Pair", "Type", "P/L %", "Win/Loss", "Strategy")
+            ("id", "date", "pair", "direction", "profit", "winloss", "strategy", "match"),
+            ("ID", "Date", "Pair", "Type", "P/L %", "Win/Loss", "Strategy", "Match")
         ):
-            self.history_tree.heading(col, text=text)
+            self.history_tree.heading(col, text=text, command=lambda c=col: self.sort_history(c))
             self.history_tree.column(col, width=80)
-
-        self.history_tree.pack(fill="both", expand=True, padx=5, pady=5)
+        self.history_tree.column("match", width=260)
+
+        self.history_tree.tag_configure("win", foreground="green")
+        self.history_tree.tag_configure("loss", foreground="red")
+        self.history_tree.tag_configure("breakeven", foreground="gray")
+
+        self.history_scroll = ttk.Scrollbar(table_frame, orient="vertical", command=self.scroll_history)
+        self.history_scroll.pack(side="right", fill="y")
+        self.history_tree.pack(side="left", fill="both", expand=True)
+
+        self.history_items = []
+        self.history_pager = self.repo.history()
+        self.history_total = 0
+        self.history_top = 0
+        self.history_cache_start = 0
+        self.history_cache = []
+        self.history_epoch = 0
+        self.history_selected_id = None
+        # Row each pooled item shows (None once detached), so re-rendering only touches items whose row changed
+        self.history_rendered = {}
+        # Trade changes waiting for their History rows (merge_history_changes)
+        self.history_changes = []
+        self.history_seq = 0
 
         # Bind double click
         self.history_tree.bind("<Double-1>", self.view_trade_details)
+        self.history_tree.bind("<<TreeviewSelect>>", self.on_history_select)
+        self.history_tree.bind("<Configure>", self.on_history_resize)
+        self.history_tree.bind("<MouseWheel>", lambda e: self.scroll_history("scroll", -1 if e.delta > 0 else 1, "units"))
+        self.history_tree.bind("<Button-4>", lambda e: self.scroll_history("scroll", -1, "units"))
+        self.history_tree.bind("<Button-5>", lambda e: self.scroll_history("scroll", 1, "units"))
+        self.history_tree.bind("<Prior>", lambda e: self.scroll_history("scroll", -1, "pages"))
+        self.history_tree.bind("<Next>", lambda e: self.scroll_history("scroll", 1, "pages"))
+        self.history_tree.bind("<Up>", lambda e: self.step_history_selection(-1))
+        self.history_tree.bind("<Down>", lambda e: self.step_history_selection(1))
 
         # Buttons
         btn_frame = ttk.Frame(frame)
@@ -263,33 +639,294 @@ class TradingJournalApp(tk.Tk):
 
         self.load_history()
 
-    def load_history(self, *args):
-        for i in self.history_tree.get_children():
-            self.history_tree.delete(i)
-
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM trades")
-        trades = cursor.fetchall()
-        conn.close()
-
-        filter_type = self.filter_var.get()
-        strategy_filter = self.strategy_filter_var.get().strip().lower()
+    def schedule_search(self, *args):
+        # Search as you type, once typing pauses
+        if self.search_after:
+            self.after_cancel(self.search_after)
+        self.search_after = self.after(SEARCH_DELAY, self.load_history)
 
-        for trade in trades:
-            pid, date, pair, direction, qty, strategy, w4h, trend, rr, emotional, followed, profit, notes, pre, post = trade
-
-            if filter_type == "Winning" and profit <= 0: continue
-            if filter_type == "Losing" and profit >= 0: continue
-            if strategy_filter and strategy.lower().find(strategy_filter) == -1: continue
+    def load_history(self, *args):
+        if not self.tab_built(self.history_tab):
+            return
+        if self.search_after:
+            self.after_cancel(self.search_after)
+            self.search_after = None
+        direction = self.direction_filter_var.get()
+        search = self.search_var.get().strip()
+        try:
+            where, params = history_filter_clauses(
+                outcome=self.filter_var.get(),
+                strategy=self.strategy_filter_var.get().strip(),
+                pair=self.pair_filter_var.get().strip(),
+                direction="" if direction == "Any" else direction,
+                date_from=self.date_from_var.get().strip(),
+                date_to=self.date_to_var.get().strip(),
+                search=search,
+            )
+        except ValueError as e:
+            messagebox.showerror("Filter", str(e))
+            return
 
-            winloss = "Win" if profit > 0 else "Loss" if profit < 0 else "Breakeven"
-            color = "green" if profit > 0 else "red" if profit < 0 else "gray"
+        # A new search starts ranked by match; clearing it goes back to date order
+        pager = self.history_pager
+        sort, descending = pager.sort, pager.descending
+        searching = bool(search_query(search))
+        if searching and not pager.query:
+            sort, descending = "match", False
+        elif sort == "match" and not searching:
+            sort, descending = "date", False
+        self.history_pager = self.repo.history(where, params, sort, descending, search)
+        self.history_top = 0
+        self.refresh_history()
+
+    def refresh_history(self, jump_to=None):
+        # Re-count and re-read the current window in the background, keeping the scroll position.
+        # The re-read includes every change delivered so far, so those needn't be patched in.
+        self.tasks.cancel("history-page")
+        self.tasks.cancel("history-changes")
+        self.history_changes = []
+        seq = self.change_seq
+        self.tasks.submit(read_history_window, self.history_pager, self.history_top, len(self.history_items), jump_to,
+                          on_done=lambda result: self.reset_history_window(result, seq, jump_to), view="history",
+                          name="load_history")
+
+    def reset_history_window(self, result, seq, jump_to=None):
+        if seq != self.change_seq:
+            self.refresh_history(jump_to)
+            return
+        self.history_seq = seq
+        self.history_total, self.history_top, self.history_cache_start, self.history_cache = result
+        self.history_epoch += 1
+        self.show_history_window()
 
-            item = self.history_tree.insert("", "end", values=(
-                pid, date, pair, direction, f"{profit:.2f}%", winloss, strategy
-            ))
-            self.history_tree.tag_configure(item, foreground=color)
+    def patch_history(self, changes):
+        if not self.tab_built(self.history_tab):
+            return
+        self.history_changes += changes
+        # One read at a time, so batches are merged in the order they happened
+        if not self.tasks.is_pending("history-changes"):
+            self.read_history_changes()
+
+    def read_history_changes(self):
+        changes, self.history_changes = self.history_changes, []
+        pager = self.history_pager
+        ids = list(dict.fromkeys(event.trade_id for _, event in changes if event.trade is not None))
+        self.tasks.submit(read_history_rows, pager, ids, view="history-changes", name="apply_changes.history",
+                          on_done=lambda rows: self.merge_history_changes(pager, changes, rows))
+
+    def merge_history_changes(self, pager, changes, rows):
+        # Patch the cached rows: drop each changed trade's old row and put its new one where the
+        # ordering puts it, shifting the window so the rows on screen stay put
+        if pager is not self.history_pager or self.tasks.is_pending("history"):
+            # The re-read on its way covers these changes
+            return
+        events = [event for seq, event in changes if seq > self.history_seq]
+        rows = {row[0]: row for row in rows}
+        cache, start = list(self.history_cache), self.history_cache_start
+        total, top = self.history_total, self.history_top
+        for trade_id in dict.fromkeys(e.trade_id for e in events):
+            index = next((i for i, row in enumerate(cache) if row[0] == trade_id), None)
+            if index is not None:
+                del cache[index]
+                total -= 1
+                top -= start + index < top
+            elif next(e for e in events if e.trade_id == trade_id).kind != INSERTED:
+                # Outside the cached rows, or filtered out: where it was isn't known
+                self.refresh_history()
+                return
+            row = rows.get(trade_id)
+            if row is None:
+                continue
+            key = pager.sort_key(row)
+            position = sum(1 for r in cache if (pager.sort_key(r) > key) == pager.descending)
+            if position == 0 and start > 0:
+                # Somewhere before the cached rows
+                start += 1
+                top += 1
+            elif position < len(cache) or start + len(cache) >= total:
+                cache.insert(position, row)
+                top += start + position < top
+            total += 1
+
+        self.history_cache, self.history_cache_start, self.history_total = cache, start, total
+        self.history_seq = max(self.history_seq, changes[-1][0])
+        self.history_top = max(0, min(top, total - len(self.history_items)))
+        self.history_epoch += 1
+        self.show_history_window()
+        if self.history_changes:
+            self.read_history_changes()
+
+    def sort_history(self, col):
+        pager = self.history_pager
+        if col == "match" and not pager.query:
+            return
+        descending = not pager.descending if pager.sort == col else False
+        self.history_pager = pager.with_sort(col, descending)
+        self.history_top = 0
+        self.refresh_history()
+
+    def jump_to_date(self):
+        value = self.jump_date_var.get().strip()
+        if not value:
+            return
+        pager = self.history_pager
+        if pager.sort != "date":
+            self.history_pager = pager.with_sort("date", pager.descending)
+        self.refresh_history(jump_to=value)
+
+    def on_history_resize(self, event):
+        # Size the row pool to the rows that fit in the widget
+        style = ttk.Style(self)
+        row_height = int(style.lookup("Treeview", "rowheight") or 20)
+        header = 25
+        visible = max(1, (event.height - header) // row_height)
+        if visible == len(self.history_items):
+            return
+        while len(self.history_items) < visible:
+            self.history_items.append(self.history_tree.insert("", "end", values=()))
+        while len(self.history_items) > visible:
+            item = self.history_items.pop()
+            self.history_rendered.pop(item, None)
+            self.history_tree.delete(item)
+        self.show_history_window()
+
+    def scroll_history(self, action, amount=None, unit=None):
+        visible = len(self.history_items)
+        if action == "moveto":
+            top = int(float(amount) * self.history_total)
+        elif unit == "pages":
+            top = self.history_top + int(amount) * max(1, visible - 1)
+        else:
+            top = self.history_top + int(amount)
+        top = max(0, min(top, self.history_total - visible))
+        if top != self.history_top:
+            self.history_top = top
+            self.show_history_window()
+        return "break"
+
+    def step_history_selection(self, step):
+        # Arrow keys past the first/last shown row scroll the window instead
+        selected = self.history_tree.selection()
+        shown = min(len(self.history_items), self.history_total - self.history_top)
+        if not selected or shown <= 0:
+            return None
+        edge = self.history_items[0] if step < 0 else self.history_items[shown - 1]
+        if selected[0] != edge:
+            return None
+        self.scroll_history("scroll", step, "units")
+        return "break"
+
+    def on_history_select(self, event):
+        selected = self.history_tree.selection()
+        if selected:
+            values = self.history_tree.item(selected[0])["values"]
+            if values:
+                self.history_selected_id = values[0]
+
+    def plan_history_fetch(self, top, count):
+        # The query that brings rows [top, top + count) into the cache, or None if they're cached.
+        # Scrolling extends the cache by keyset from its edge; jumps re-read at an offset.
+        cache = self.history_cache
+        start = self.history_cache_start
+        end = start + len(cache)
+        need_end = min(self.history_total, top + count)
+        if start <= top and need_end <= end:
+            return None
+        pager = self.history_pager
+        if cache and start <= top <= end + HISTORY_PREFETCH:
+            return ("after", pager.key(cache[-1]), need_end - end + HISTORY_PREFETCH)
+        if cache and top < start and start - HISTORY_PREFETCH <= need_end <= end:
+            return ("before", pager.key(cache[0]), start - top + HISTORY_PREFETCH)
+        begin = max(0, top - HISTORY_PREFETCH)
+        return ("at", begin, need_end - begin + HISTORY_PREFETCH)
+
+    def merge_history_rows(self, epoch, top, plan, rows):
+        if epoch != self.history_epoch:
+            return
+        kind, arg, limit = plan
+        cache, start = self.history_cache, self.history_cache_start
+        if kind == "after":
+            cache = cache + rows
+            if len(rows) < limit:
+                # Reached the end: trades were deleted since the count
+                self.history_total = start + len(cache)
+        elif kind == "before":
+            if len(rows) < limit:
+                self.refresh_history()
+                return
+            cache = rows + cache
+            start -= len(rows)
+        else:
+            start, cache = arg, rows
+            if len(rows) < limit:
+                self.history_total = start + len(rows)
+
+        # Keep the cache bounded to the window plus a prefetch margin on each side
+        visible = len(self.history_items)
+        self.history_top = max(0, min(self.history_top, self.history_total - visible))
+        keep_from = max(0, self.history_top - start - HISTORY_PREFETCH)
+        keep_to = self.history_top + visible - start + HISTORY_PREFETCH
+        self.history_cache = cache[keep_from:keep_to]
+        self.history_cache_start = start + keep_from
+        self.history_epoch += 1
+
+        if self.history_top == top:
+            self.render_history_rows()
+        else:
+            self.show_history_window()
+
+    def show_history_window(self):
+        visible = len(self.history_items)
+        top = self.history_top
+        if self.history_total:
+            self.history_scroll.set(top / self.history_total, min(1.0, (top + visible) / self.history_total))
+        else:
+            self.history_scroll.set(0, 1)
+
+        plan = self.plan_history_fetch(top, visible)
+        if plan is None:
+            self.render_history_rows()
+            return
+        # The rows on screen stay until the page arrives
+        epoch = self.history_epoch
+        self.tasks.submit(read_history_page, self.history_pager, *plan,
+                          on_done=lambda rows: self.merge_history_rows(epoch, top, plan, rows), view="history-page",
+                          name="load_history.page")
+
+    @perf.timed("load_history.render")
+    def render_history_rows(self):
+        visible = len(self.history_items)
+        offset = self.history_top - self.history_cache_start
+        if offset < 0:
+            return
+        rows = self.history_cache[offset:offset + visible]
+        # The search match, if any, follows the pager's fields (see with_matches)
+        fields = len(self.history_pager.fields)
+
+        tree = self.history_tree
+        rendered = self.history_rendered
+        selected = None
+        for index, item in enumerate(self.history_items):
+            if index < len(rows):
+                row = rows[index]
+                if rendered.get(item) != row:
+                    pid, date, pair, direction, profit, strategy, *_ = row
+                    match = row[fields] if len(row) > fields else ""
+                    winloss = "Win" if profit > 0 else "Loss" if profit < 0 else "Breakeven"
+                    tag = "win" if profit > 0 else "loss" if profit < 0 else "breakeven"
+                    tree.item(item, values=(pid, date, pair, direction, f"{profit:.2f}%", winloss, strategy, match),
+                              tags=(tag,))
+                    if rendered.get(item) is None:
+                        tree.move(item, "", index)
+                    rendered[item] = row
+                if row[0] == self.history_selected_id:
+                    selected = item
+            elif rendered.get(item, ()) is not None:
+                tree.detach(item)
+                rendered[item] = None
+
+        # Selection follows the trade, not the pooled row
+        tree.selection_set(selected) if selected else tree.selection_remove(tree.selection())
 
     def view_trade_details(self, event):
         selected = self.history_tree.selection()
@@ -299,55 +936,89 @@ class TradingJournalApp(tk.Tk):
         pid = item["values"][0]
         self.open_trade_detail_window(pid)
 
-    def open_trade_detail_window(self, pid):
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM trades WHERE id=?", (pid,))
-        trade = cursor.fetchone()
-        conn.close()
+    def open_trade_detail_window(self, pid, detail=None):
+        self.tasks.submit(load_trade_details, self.repo, pid, self.thumbnails, name="open_trade_detail_window",
+                          on_done=lambda result: self.show_trade_details(pid, *result, detail=detail))
+
+    def history_neighbours(self, pid):
+        # Ids of the trades before and after pid in the History list, as far as the cache reaches
+        ids = [row[0] for row in self.history_cache]
+        if pid not in ids:
+            return None, None
+        index = ids.index(pid)
+        return (ids[index - 1] if index > 0 else None,
+                ids[index + 1] if index + 1 < len(ids) else None)
+
+    def show_trade_details(self, pid, trade, images, detail=None):
+        from PIL import ImageTk
 
         if not trade:
             return
 
-        detail = tk.Toplevel(self)
+        if detail is None or not detail.winfo_exists():
+            detail = tk.Toplevel(self)
+            detail.geometry("700x500")
+        for child in detail.winfo_children():
+            child.destroy()
         detail.title(f"Trade #{pid} Details")
-        detail.geometry("700x500")
 
         labels = [
-            ("Date", trade[1]), ("Pair", trade[2]), ("Direction", trade[3]),
-            ("Quantity", trade[4]), ("Strategy", trade[5]),
-            ("Profit/Loss %", f"{trade[11]:.2f}%"), ("Notes", trade[12])
+            ("Date", trade.date), ("Pair", trade.pair), ("Direction", trade.direction),
+            ("Quantity", trade.quantity), ("Strategy", trade.strategy),
+            ("Profit/Loss %", f"{trade.profit_percent:.2f}%"), ("Notes", trade.notes)
         ]
 
         row = 0
+        search = self.history_pager.search if self.history_pager.query else ""
         for label, value in labels:
             tk.Label(detail, text=f"{label}:").grid(row=row, column=0, sticky="w", padx=5, pady=3)
-            tk.Label(detail, text=str(value)).grid(row=row, column=1, sticky="w", padx=5, pady=3)
+            spans = match_spans(str(value), search) if label in ("Pair", "Strategy", "Notes") else []
+            if spans:
+                # Highlight the History search terms
+                value = str(value)
+                lines = min(6, len(value) // 60 + value.count("\n") + 1)
+                text = tk.Text(detail, height=lines, width=60, wrap="word", relief="flat",
+                               background=detail.cget("background"))
+                text.insert("1.0", value)
+                text.tag_configure("match", background="#fff176")
+                for start, end in spans:
+                    text.tag_add("match", f"1.0 + {start} chars", f"1.0 + {end} chars")
+                text.configure(state="disabled")
+                text.grid(row=row, column=1, sticky="w", padx=5, pady=3)
+            else:
+                tk.Label(detail, text=str(value)).grid(row=row, column=1, sticky="w", padx=5, pady=3)
             row += 1
 
         # Checklist
         tk.Label(detail, text="Checklist:", font=("Arial", 10, "bold")).grid(row=row, column=0, sticky="w", padx=5, pady=3)
         row += 1
-        bools = [trade[6], trade[7], trade[8], trade[9], trade[10]]
-        for key, label in RULES:
-            status = "✓" if bools[[r[0] for r in RULES].index(key)] else "✗"
+        for key, label in self.repo.rules:
+            status = "✓" if trade.followed(self.repo.rule_bits[key]) else "✗"
             tk.Label(detail, text=f"{label}: {status}").grid(row=row, column=0, sticky="w", padx=10, pady=2)
             row += 1
 
-        # Images
-        def show_image(path, label):
-            if path and os.path.exists(path):
-                img = Image.open(path)
-                img = img.resize((250, 150))
-                photo = ImageTk.PhotoImage(img)
-                tk.Label(detail, text=label).grid(row=row, column=0, sticky="w", padx=5, pady=3)
-                lbl = tk.Label(detail, image=photo)
-                lbl.image = photo
-                lbl.grid(row=row, column=1, sticky="w", padx=5, pady=3)
-                row += 1
-
-        show_image(trade[13], "Pre-Trade Screenshot:")
-        show_image(trade[14], "Post-Trade Screenshot:")
+        # Images (decoded on the worker; only the PhotoImage is made here)
+        for label, img in images:
+            photo = ImageTk.PhotoImage(img)
+            tk.Label(detail, text=label).grid(row=row, column=0, sticky="w", padx=5, pady=3)
+            lbl = tk.Label(detail, image=photo)
+            lbl.image = photo
+            lbl.grid(row=row, column=1, sticky="w", padx=5, pady=3)
+            row += 1
+
+        # Step through the History list in the same window
+        prev_id, next_id = self.history_neighbours(pid)
+        nav = ttk.Frame(detail)
+        nav.grid(row=row, column=0, columnspan=2, pady=5)
+        for text, target in (("< Previous", prev_id), ("Next >", next_id)):
+            tk.Button(nav, text=text, state="normal" if target else "disabled",
+                      command=lambda t=target: self.open_trade_detail_window(t, detail)).pack(side="left", padx=5)
+
+        # Warm the thumbnail cache for the neighbours so stepping to them is instant
+        for target in (prev_id, next_id):
+            if target:
+                self.tasks.submit(load_trade_details, self.repo, target, self.thumbnails,
+                                  name="open_trade_detail_window.prefetch")
 
     def edit_selected_trade(self):
         selected = self.history_tree.selection()
@@ -357,15 +1028,12 @@ class TradingJournalApp(tk.Tk):
 
         item = self.history_tree.item(selected[0])
         pid = item["values"][0]
+        self.tasks.submit(self.repo.get_trade, pid, on_done=self.show_edit_window)
 
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM trades WHERE id=?", (pid,))
-        trade = cursor.fetchone()
-        conn.close()
-
+    def show_edit_window(self, trade):
         if not trade:
             return
+        pid = trade.id
 
         # Open edit window
         edit_win = tk.Toplevel(self)
@@ -374,14 +1042,14 @@ class TradingJournalApp(tk.Tk):
 
         # Basic fields
         fields = [
-            ("Date", tk.StringVar(value=trade[1])),
-            ("Pair", tk.StringVar(value=trade[2])),
-            ("Direction", tk.StringVar(value=trade[3])),
-            ("Quantity", tk.StringVar(value=str(trade[4]))),
-            ("Strategy", tk.StringVar(value=trade[5])),
-            ("Profit %", tk.StringVar(value=str(trade[11]))),
+            ("Date", tk.StringVar(value=trade.date)),
+            ("Pair", tk.StringVar(value=trade.pair)),
+            ("Direction", tk.StringVar(value=trade.direction)),
+            ("Quantity", tk.StringVar(value=str(trade.quantity))),
+            ("Strategy", tk.StringVar(value=trade.strategy)),
+            ("Profit %", tk.StringVar(value=str(trade.profit_percent))),
             ("Risk–Reward", tk.StringVar(value="")),
-            ("Notes", tk.StringVar(value=trade[12])),
+            ("Notes", tk.StringVar(value=trade.notes)),
         ]
 
         row = 0
@@ -390,7 +1058,7 @@ class TradingJournalApp(tk.Tk):
             if label == "Notes":
                 txt = scrolledtext.ScrolledText(edit_win, width=40, height=4)
                 txt.grid(row=row, column=1, sticky="w", padx=5, pady=3)
-                txt.insert("1.0", trade[12])
+                txt.insert("1.0", trade.notes)
                 fields[row] = (label, txt)
             else:
                 tk.Entry(edit_win, textvariable=var, width=20).grid(row=row, column=1, sticky="w", padx=5, pady=3)
@@ -399,27 +1067,23 @@ class TradingJournalApp(tk.Tk):
         # Save edit
         def save_edit():
             try:
-                conn = sqlite3.connect(DB_PATH)
-                cursor = conn.cursor()
-                cursor.execute("""
-                    UPDATE trades SET
-                    date=?, pair=?, direction=?, quantity=?, strategy=?,
-                    profit_percent=?, notes=?
-                    WHERE id=?
-                """, (
-                    fields[0][1].get(), fields[1][1].get(), fields[2][1].get(),
-                    float(fields[3][1].get() or 0), fields[4][1].get(),
-                    float(fields[5][1].get() or 0),
-                    fields[7][1].get("1.0", "end-1c"),
-                    pid
-                ))
-                conn.commit()
-                conn.close()
+                changes = dict(
+                    date=fields[0][1].get(), pair=fields[1][1].get(), direction=fields[2][1].get(),
+                    quantity=float(fields[3][1].get() or 0), strategy=fields[4][1].get(),
+                    profit_percent=float(fields[5][1].get() or 0),
+                    notes=fields[7][1].get("1.0", "end-1c"),
+                )
+            except ValueError as e:
+                messagebox.showerror("Error", f"Could not update trade: {e}")
+                return
+
+            def saved(_):
                 messagebox.showinfo("Success", "Trade updated.")
                 edit_win.destroy()
-                self.load_history()
-            except Exception as e:
-                messagebox.showerror("Error", f"Could not update trade: {e}")
+
+            self.tasks.submit(self.repo.update_trade, pid, on_done=saved,
+                              on_error=lambda e: messagebox.showerror("Error", f"Could not update trade: {e}"),
+                              **changes)
 
         tk.Button(edit_win, text="Save Changes", bg="green", fg="white", command=save_edit).grid(row=row, column=0, columnspan=2, pady=10)
 
@@ -433,16 +1097,18 @@ class TradingJournalApp(tk.Tk):
         pid = item["values"][0]
 
         if messagebox.askyesno("Confirm Delete", "Delete this trade permanently?"):
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM trades WHERE id=?", (pid,))
-            conn.commit()
-            conn.close()
-            self.load_history()
+            self.tasks.submit(self.repo.delete_trade, pid)
 
     # -------------------------- STATISTICS TAB --------------------------
 
     def create_statistics_tab(self):
+        import analytics
+        import equity
+        import matplotlib.dates as mdates
+        import numpy as np
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
         frame = self.stats_tab
 
         self.stats_labels = {}
@@ -457,88 +1123,651 @@ class TradingJournalApp(tk.Tk):
             self.stats_labels[metric] = tk.Label(summary_frame, text="")
             self.stats_labels[metric].grid(row=i, column=1, sticky="w", padx=10, pady=3)
 
-        # Equity Curve
-        self.fig, self.ax = plt.subplots(figsize=(6, 3))
-        self.canvas = FigureCanvasTkAgg(self.fig, master=frame)
-        self.canvas.get_tk_widget().pack(fill="both", expand=True, padx=10, pady=10)
-
-        self.update_stats()
-
-    def update_stats(self):
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM trades")
-        trades = cursor.fetchall()
-        conn.close()
-
-        total = len(trades)
-        wins = sum(1 for t in trades if t[11] > 0)
-        losses = sum(1 for t in trades if t[11] < 0)
-
-        win_rate = (wins / total * 100) if total else 0
-        avg_win = (sum(t[11] for t in trades if t[11] > 0) / wins) if wins else 0
-        avg_loss = (sum(t[11] for t in trades if t[11] < 0) / losses) if losses else 0
-
-        # Most broken rule
-        rule_counts = [0, 0, 0, 0, 0]
-        for t in trades:
-            rule_counts[0] += t[6]
-            rule_counts[1] += t[7]
-            rule_counts[2] += t[8]
-            rule_counts[3] += t[9]
-            rule_counts[4] += t[10]
-
-        most_broken = RULES[rule_counts.index(max(rule_counts))][1]
-
-        # Update labels
-        self.stats_labels["Total Trades"].config(text=str(total))
-        self.stats_labels["Win Rate"].config(text=f"{win_rate:.1f}%")
-        self.stats_labels["Avg Win %"].config(text=f"{avg_win:.2f}%")
-        self.stats_labels["Avg Loss %"].config(text=f"{avg_loss:.2f}%")
-        self.stats_labels["Most Broken Rule"].config(text=most_broken)
-
-        # Equity curve
-        self.ax.clear()
-        equity = 0
-        x, y = [], []
-        for t in trades:
-            equity += t[11]
-            x.append(t[1])
-            y.append(equity)
-        self.ax.plot(x, y, marker="o")
+        # Performance metrics (analytics.py), beside the summary
+        self.performance_labels = {}
+        performance = ["Expectancy", "Profit Factor", "Max Drawdown", "Drawdown Duration",
+                       "Sharpe / Sortino", "Rolling Win Rate"]
+        for i, metric in enumerate(performance):
+            text = f"Win Rate (last {analytics.ROLLING_WINDOW})" if metric == "Rolling Win Rate" else metric
+            tk.Label(summary_frame, text=f"{text}:", font=("Arial", 10, "bold")).grid(row=i, column=2, sticky="w", padx=(30, 5), pady=3)
+            self.performance_labels[metric] = tk.Label(summary_frame, text="")
+            self.performance_labels[metric].grid(row=i, column=3, sticky="w", padx=10, pady=3)
+
+        # Breakdown by strategy, pair or checklist rule
+        breakdown_frame = ttk.Frame(frame)
+        breakdown_frame.pack(fill="x", padx=10)
+        self.breakdown_var = tk.StringVar(value="By Strategy")
+        tk.OptionMenu(breakdown_frame, self.breakdown_var, "By Strategy", "By Pair", "By Rule",
+                      command=lambda _: self.show_breakdown()).pack(anchor="w")
+        self.breakdown_tree = ttk.Treeview(breakdown_frame, columns=("group", "trades", "winrate", "expectancy", "pf", "total"),
+                                           show="headings", height=5)
+        for col, text, width in (("group", "Group", 260), ("trades", "Trades", 70), ("winrate", "Win Rate", 80),
+                                 ("expectancy", "Expectancy", 90), ("pf", "Profit Factor", 90), ("total", "Total P/L %", 90)):
+            self.breakdown_tree.heading(col, text=text)
+            self.breakdown_tree.column(col, width=width, anchor="w" if col == "group" else "e")
+        self.breakdown_tree.pack(fill="x")
+        self.analytics_report = None
+
+        # Equity Curve: one animated line, redrawn by blitting when trades are appended
+        self.fig = Figure(figsize=(6, 3))
+        self.ax = self.fig.add_subplot()
         self.ax.set_title("Equity Curve")
         self.ax.set_xlabel("Date")
         self.ax.set_ylabel("Cumulative P/L %")
-        self.fig.autofmt_xdate()
-        self.canvas.draw()
+        locator = mdates.AutoDateLocator()
+        self.ax.xaxis.set_major_locator(locator)
+        self.ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+        self.equity_line, = self.ax.plot([], [], animated=True)
+        self.equity_curve = equity.EquityCurve(np.empty(0), np.empty(0, dtype=np.int64), np.empty(0))
+        self.equity_seq = 0
+        self.equity_background = None
+        self.summary_stats = None
+        self.summary_seq = 0
+
+        # The equity curve, the calendar and the risk simulation share the rest of the tab
+        views = ttk.Notebook(frame)
+        views.pack(fill="both", expand=True, padx=10, pady=10)
+        equity_frame = ttk.Frame(views)
+        calendar_frame = ttk.Frame(views)
+        risk_frame = ttk.Frame(views)
+        views.add(equity_frame, text="Equity Curve")
+        views.add(calendar_frame, text="Calendar")
+        views.add(risk_frame, text="Risk")
+        # The simulation runs when its view is shown (from cache if no trade changed since)
+        views.bind("<<NotebookTabChanged>>",
+                   lambda e: self.update_simulation() if views.select() == str(risk_frame) else None)
+
+        self.canvas = FigureCanvasTkAgg(self.fig, master=equity_frame)
+        # Full redraws (draw_idle ends up here) are where matplotlib's time goes
+        self.canvas.draw = perf.timed("update_stats.equity_draw")(self.canvas.draw)
+        self.canvas.get_tk_widget().pack(fill="both", expand=True)
+        self.canvas.mpl_connect("draw_event", self.on_equity_draw)
+        self.canvas.mpl_connect("resize_event", lambda e: self.draw_equity_curve(reload=False))
+
+        tools = ttk.Frame(frame)
+        tools.pack(pady=5)
+        tk.Button(tools, text="Check Aggregates", command=self.check_aggregates).pack(side="left", padx=5)
+        tk.Button(tools, text="Clean Up Images", command=self.clean_up_images).pack(side="left", padx=5)
+        tk.Button(tools, text="Performance", command=self.open_performance_panel).pack(side="left", padx=5)
+
+        self.create_calendar_view(calendar_frame)
+        self.create_risk_view(risk_frame)
+        self.update_stats()
 
-    # -------------------------- CSV EXPORT --------------------------
+    def update_summary(self):
+        # O(1): reads the trigger-maintained aggregates, not the trades table
+        if not self.tab_built(self.stats_tab):
+            return
+        seq = self.change_seq
+        self.tasks.submit(self.repo.stats, on_done=lambda stats: self.set_summary(stats, seq), view="summary",
+                          name="update_stats.summary")
+
+    def set_summary(self, stats, seq):
+        if seq != self.change_seq:
+            self.update_summary()
+            return
+        self.summary_stats, self.summary_seq = stats, seq
+        self.show_summary(stats)
+
+    def show_summary(self, stats):
+        self.stats_labels["Total Trades"].config(text=str(stats.total))
+        self.stats_labels["Win Rate"].config(text=f"{stats.win_rate:.1f}%")
+        self.stats_labels["Avg Win %"].config(text=f"{stats.avg_win:.2f}%")
+        self.stats_labels["Avg Loss %"].config(text=f"{stats.avg_loss:.2f}%")
+        self.stats_labels["Most Broken Rule"].config(text=stats.most_broken_rule(self.repo.rules) or "None")
+
+    def check_aggregates(self):
+        self.tasks.submit(self.repo.check_stats, on_done=self.show_aggregate_check)
+
+    def show_aggregate_check(self, problems):
+        if not problems:
+            messagebox.showinfo("Aggregates", "Stored statistics match the trades table.")
+            return
+        details = "\n".join(problems[:10])
+        if messagebox.askyesno("Aggregates", f"Stored statistics are out of sync:\n\n{details}\n\nRebuild them now?"):
+            self.tasks.submit(self.repo.check_stats, rebuild=True, on_done=lambda _: self.update_summary())
+
+    def clean_up_images(self):
+        def done(result):
+            removed, freed = result
+            self.status_var.set(f"Removed {len(removed)} unreferenced images ({freed / 1048576:.1f} MB)")
+
+        if messagebox.askyesno("Clean Up Images", "Delete screenshots and thumbnails that no trade uses?"):
+            self.tasks.submit(imagestore.collect_garbage, self.repo, on_done=done)
+
+    def update_stats(self):
+        self.update_summary()
+        self.update_analytics()
+        self.draw_equity_curve()
+        self.update_calendar()
+
+    def patch_statistics(self, changes):
+        if not self.tab_built(self.stats_tab):
+            return
+        # The totals are adjusted by each change; a load on its way re-reads if it missed some
+        stats = self.summary_stats
+        if stats is None:
+            if not self.tasks.is_pending("summary"):
+                self.update_summary()
+        elif not self.tasks.is_pending("summary"):
+            for seq, event in changes:
+                if seq > self.summary_seq:
+                    stats = stats.changed(self.repo.rule_bits, event.old, event.trade)
+            self.set_summary(stats, self.change_seq)
+        self.patch_equity_curve(changes)
+        # Ratios, drawdowns, breakdowns and period P/L depend on the trades around the changed
+        # ones, so those are re-read, once per batch
+        self.update_analytics()
+        self.update_calendar()
+
+    def update_analytics(self):
+        import analytics
+
+        if not self.tab_built(self.stats_tab):
+            return
+        self.tasks.submit(analytics.load_report, self.repo, on_done=self.show_analytics, view="analytics",
+                          name="update_stats.analytics")
+
+    def show_analytics(self, report):
+        m = report.metrics
+        labels = self.performance_labels
+        labels["Expectancy"].config(text=f"{m.expectancy:.2f}% per trade")
+        labels["Profit Factor"].config(text="∞" if m.profit_factor == float("inf") else f"{m.profit_factor:.2f}")
+        if m.max_drawdown < 0:
+            labels["Max Drawdown"].config(text=f"{m.max_drawdown:.2f}% ({m.drawdown_start} → {m.drawdown_end})")
+        else:
+            labels["Max Drawdown"].config(text="None")
+        underwater = "" if m.recovered else ", still below peak"
+        labels["Drawdown Duration"].config(text=f"{m.drawdown_days:.0f} days{underwater}")
+        if m.annual_sharpe is not None:
+            labels["Sharpe / Sortino"].config(text=f"{m.annual_sharpe:.2f} / {m.annual_sortino:.2f} (annualized)")
+        else:
+            labels["Sharpe / Sortino"].config(text=f"{m.sharpe:.2f} / {m.sortino:.2f} (per trade)")
+        rolling = report.rolling_win_rate
+        labels["Rolling Win Rate"].config(
+            text=f"{rolling[-1]:.0f}% (range {rolling.min():.0f}–{rolling.max():.0f}%)" if len(rolling) else "n/a")
+        self.analytics_report = report
+        self.show_breakdown()
+        self.risk_strategy_box.config(values=[ALL_STRATEGIES] + sorted(g.label for g in report.by_strategy))
+
+    def show_breakdown(self):
+        report = self.analytics_report
+        if report is None:
+            return
+        groups = {"By Strategy": report.by_strategy, "By Pair": report.by_pair, "By Rule": report.by_rule}[self.breakdown_var.get()]
+        tree = self.breakdown_tree
+        tree.delete(*tree.get_children())
+        for g in groups:
+            pf = "∞" if g.profit_factor == float("inf") else f"{g.profit_factor:.2f}"
+            tree.insert("", "end", values=(g.label, g.trades, f"{g.win_rate:.1f}%", f"{g.expectancy:.2f}%", pf, f"{g.total:.2f}%"))
+
+    def draw_equity_curve(self, reload=True):
+        import equity
+
+        if not self.tab_built(self.stats_tab):
+            return
+        if reload:
+            seq = self.change_seq
+            self.tasks.submit(equity.load_equity_curve, self.repo, view="equity", name="update_stats.equity",
+                              on_done=lambda curve: self.set_equity_curve(curve, seq))
+            return
+
+        # Reduce to what the axes can show at their current pixel width
+        width = max(1, int(self.ax.bbox.width))
+        x, y = equity.downsample_m4(self.equity_curve.x, self.equity_curve.y, width)
+        self.equity_line.set_data(x, y)
+        self.equity_line.set_marker("o" if len(x) <= 100 else "")
+        self.set_equity_limits()
+        self.canvas.draw_idle()
+
+    def set_equity_curve(self, curve, seq):
+        if seq != self.change_seq:
+            self.draw_equity_curve()
+            return
+        self.equity_curve, self.equity_seq = curve, seq
+        self.draw_equity_curve(reload=False)
+
+    def set_equity_limits(self):
+        import matplotlib.dates as mdates
+
+        # Leave headroom to the right and above/below so new trades usually fit without a full redraw
+        curve = self.equity_curve
+        if not len(curve.x):
+            today = mdates.date2num(datetime.datetime.now())
+            self.ax.set_xlim(today - 30, today + 1)
+            self.ax.set_ylim(-1, 1)
+            return
+        x0, x1 = curve.x[0], curve.x[-1]
+        y0, y1 = min(0.0, curve.y.min()), max(0.0, curve.y.max())
+        x_pad = max(7.0, (x1 - x0) * 0.05)
+        y_pad = max(1.0, (y1 - y0) * 0.1)
+        self.ax.set_xlim(x0 - 1, x1 + x_pad)
+        self.ax.set_ylim(y0 - y_pad, y1 + y_pad)
+
+    def on_equity_draw(self, event):
+        # After every full draw: remember the static background, then paint the animated line over it
+        self.equity_background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.equity_line)
+
+    def patch_equity_curve(self, changes):
+        if self.tasks.is_pending("equity"):
+            # The load on its way re-reads if it missed any of these
+            return
+        curve = self.equity_curve
+        appended = 0
+        extends = True
+        for seq, event in changes:
+            if seq <= self.equity_seq:
+                continue
+            if event.old is not None:
+                curve.remove(event.old)
+                extends = False
+            if event.trade is not None:
+                # A back-dated or undated trade shifts every later point
+                extends = curve.add(event.trade) and extends
+                appended += 1
+        self.equity_seq = self.change_seq
+        if extends and appended:
+            self.extend_equity_line(appended)
+        elif not extends:
+            self.draw_equity_curve(reload=False)
+
+    def extend_equity_line(self, count):
+        import numpy as np
+
+        # The last count points are new and after all the others: blit them over the saved
+        # background, unless they fall outside the axes or the line has grown past downsampling
+        curve = self.equity_curve
+        x, y = curve.x[-count:], curve.y[-count:]
+        shown_x, shown_y = self.equity_line.get_data()
+        x0, x1 = self.ax.get_xlim()
+        y0, y1 = self.ax.get_ylim()
+        if (self.equity_background is None or len(shown_x) + count > 4 * max(1, int(self.ax.bbox.width))
+                or not (x0 <= x.min() and x.max() <= x1 and y0 <= y.min() and y.max() <= y1)):
+            self.draw_equity_curve(reload=False)
+            return
+
+        self.equity_line.set_data(np.append(shown_x, x), np.append(shown_y, y))
+        self.canvas.restore_region(self.equity_background)
+        self.ax.draw_artist(self.equity_line)
+        self.canvas.blit(self.ax.bbox)
+
+    # -------------------------- CALENDAR --------------------------
+    # Reads only the period rollups, so it costs the same on any size of journal
+
+    def create_calendar_view(self, frame):
+        controls = ttk.Frame(frame)
+        controls.pack(fill="x", pady=5)
+        tk.Label(controls, text="Year:").pack(side="left", padx=3)
+        self.calendar_year_var = tk.StringVar()
+        self.calendar_year_box = ttk.Combobox(controls, textvariable=self.calendar_year_var, width=6, state="readonly")
+        self.calendar_year_box.pack(side="left", padx=3)
+        self.calendar_year_box.bind("<<ComboboxSelected>>", lambda e: self.update_calendar())
+        tk.Label(controls, text="Table:").pack(side="left", padx=(15, 3))
+        self.calendar_period_var = tk.StringVar(value="month")
+        tk.OptionMenu(controls, self.calendar_period_var, *migrations.PERIODS,
+                      command=lambda _: self.update_calendar()).pack(side="left", padx=3)
+        self.calendar_hover_var = tk.StringVar()
+        tk.Label(controls, textvariable=self.calendar_hover_var, anchor="w").pack(side="left", padx=15)
+
+        # One cell per day: a column per ISO week, Monday on top
+        self.heatmap = tk.Canvas(frame, height=HEATMAP_TOP + 7 * HEATMAP_CELL + 4, background="white",
+                                 highlightthickness=0)
+        self.heatmap.pack(fill="x")
+        self.heatmap.bind("<Motion>", self.on_heatmap_motion)
+        self.heatmap.bind("<Leave>", lambda e: self.calendar_hover_var.set(""))
+        self.heatmap_cells = {}
+
+        table_frame = ttk.Frame(frame)
+        table_frame.pack(fill="both", expand=True, pady=5)
+        self.period_tree = ttk.Treeview(table_frame, columns=("period", "trades", "winrate", "profit", "drawdown"),
+                                        show="headings")
+        for col, text, width in (("period", "Period", 120), ("trades", "Trades", 70), ("winrate", "Win Rate", 80),
+                                 ("profit", "P/L %", 90), ("drawdown", "Max Drawdown %", 110)):
+            self.period_tree.heading(col, text=text)
+            self.period_tree.column(col, width=width, anchor="w" if col == "period" else "e")
+        self.period_tree.tag_configure("win", foreground="green")
+        self.period_tree.tag_configure("loss", foreground="red")
+        scroll = ttk.Scrollbar(table_frame, orient="vertical", command=self.period_tree.yview)
+        self.period_tree.configure(yscrollcommand=scroll.set)
+        scroll.pack(side="right", fill="y")
+        self.period_tree.pack(side="left", fill="both", expand=True)
+
+    def update_calendar(self):
+        if not self.tab_built(self.stats_tab):
+            return
+        year = self.calendar_year_var.get()
+        self.tasks.submit(load_calendar, self.repo, int(year) if year else None, self.calendar_period_var.get(),
+                          on_done=self.show_calendar, view="calendar", name="update_stats.calendar")
+
+    def show_calendar(self, result):
+        years, year, days, periods = result
+        self.calendar_year_box.config(values=years)
+        self.calendar_year_var.set(year or "")
+        self.draw_heatmap(year, days)
+
+        tree = self.period_tree
+        tree.delete(*tree.get_children())
+        for r in periods:
+            tag = "win" if r.profit > 0 else "loss" if r.profit < 0 else ""
+            tree.insert("", "end", values=(r.label, r.trades, f"{r.win_rate:.1f}%", f"{r.profit:.2f}%",
+                                           f"{r.drawdown:.2f}%"), tags=(tag,))
+
+    def draw_heatmap(self, year, days):
+        canvas = self.heatmap
+        canvas.delete("all")
+        self.heatmap_cells = {}
+        if year is None:
+            return
+        by_start = {r.start: r for r in days}
+        # Scale colours to the 95th percentile so one outlier day doesn't wash out the rest
+        sizes = sorted(abs(r.profit) for r in days)
+        scale = (sizes[int(0.95 * (len(sizes) - 1))] if sizes else 0) or 1.0
+
+        first = datetime.date(year, 1, 1)
+        monday = first - datetime.timedelta(days=first.weekday())
+        start = year_range(year)[0]
+        for row, name in ((0, "Mon"), (2, "Wed"), (4, "Fri")):
+            canvas.create_text(HEATMAP_LEFT - 4, HEATMAP_TOP + row * HEATMAP_CELL + HEATMAP_CELL // 2,
+                               text=name, anchor="e", font=("Arial", 8))
+        day = first
+        while day.year == year:
+            column = (day - monday).days // 7
+            x = HEATMAP_LEFT + column * HEATMAP_CELL
+            y = HEATMAP_TOP + day.weekday() * HEATMAP_CELL
+            if day.day == 1:
+                canvas.create_text(x, HEATMAP_TOP - 2, text=day.strftime("%b"), anchor="sw", font=("Arial", 8))
+            r = by_start.get(start + (day - first).days * 86400)
+            item = canvas.create_rectangle(x, y, x + HEATMAP_CELL - 2, y + HEATMAP_CELL - 2, outline="",
+                                           fill=heat_color(r.profit / scale) if r else "#ebedf0")
+            if r:
+                self.heatmap_cells[item] = (f"{day:%a %Y-%m-%d}: {r.profit:+.2f}% over {r.trades} trades "
+                                            f"({r.win_rate:.0f}% won, max drawdown {r.drawdown:.2f}%)")
+            else:
+                self.heatmap_cells[item] = f"{day:%a %Y-%m-%d}: no trades"
+            day += datetime.timedelta(days=1)
+
+    def on_heatmap_motion(self, event):
+        item = self.heatmap.find_withtag("current")
+        self.calendar_hover_var.set(self.heatmap_cells.get(item[0], "") if item else "")
+
+    # -------------------------- RISK SIMULATION --------------------------
+    # Bootstrap equity paths resampled from the journal's own trades (montecarlo.py), simulated in
+    # a process pool and cached until a trade changes
+
+    def create_risk_view(self, frame):
+        import montecarlo
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        controls = ttk.Frame(frame)
+        controls.pack(fill="x", pady=5)
+        tk.Label(controls, text="Trades:").pack(side="left", padx=3)
+        self.risk_strategy_var = tk.StringVar(value=ALL_STRATEGIES)
+        self.risk_strategy_box = ttk.Combobox(controls, textvariable=self.risk_strategy_var, values=[ALL_STRATEGIES],
+                                              width=18, state="readonly")
+        self.risk_strategy_box.pack(side="left", padx=3)
+        self.risk_rules_var = tk.IntVar()
+        tk.Checkbutton(controls, text="Every rule followed", variable=self.risk_rules_var).pack(side="left", padx=3)
+        self.risk_paths_var = tk.StringVar(value=str(montecarlo.DEFAULT_PATHS))
+        self.risk_horizon_var = tk.StringVar()
+        self.risk_ruin_var = tk.StringVar(value=f"{montecarlo.DEFAULT_RUIN:g}")
+        for text, var, width in (("Paths:", self.risk_paths_var, 7), ("Trades ahead:", self.risk_horizon_var, 6),
+                                 ("Ruin at -%:", self.risk_ruin_var, 5)):
+            tk.Label(controls, text=text).pack(side="left", padx=(10, 3))
+            tk.Entry(controls, textvariable=var, width=width).pack(side="left", padx=3)
+        tk.Button(controls, text="Simulate", command=self.update_simulation).pack(side="left", padx=10)
+        self.risk_status_var = tk.StringVar()
+        tk.Label(frame, textvariable=self.risk_status_var, anchor="w").pack(fill="x", padx=3)
+
+        body = ttk.Frame(frame)
+        body.pack(fill="both", expand=True, pady=5)
+        self.risk_tree = ttk.Treeview(body, columns=("percentile", "final", "drawdown"), show="headings",
+                                      height=len(montecarlo.PERCENTILES))
+        for col, text, width in (("percentile", "Percentile", 80), ("final", "Final P/L %", 90),
+                                 ("drawdown", "Max Drawdown %", 110)):
+            self.risk_tree.heading(col, text=text)
+            self.risk_tree.column(col, width=width, anchor="e")
+        self.risk_tree.pack(side="left", anchor="n", padx=(0, 10))
+
+        self.risk_fig = Figure(figsize=(5, 3))
+        self.risk_ax = self.risk_fig.add_subplot()
+        self.risk_canvas = FigureCanvasTkAgg(self.risk_fig, master=body)
+        self.risk_canvas.get_tk_widget().pack(side="left", fill="both", expand=True)
+        self.simulations = montecarlo.SimulationCache()
+
+    def update_simulation(self):
+        import montecarlo
+
+        try:
+            paths = int(self.risk_paths_var.get())
+            horizon = int(self.risk_horizon_var.get()) if self.risk_horizon_var.get().strip() else None
+            ruin = float(self.risk_ruin_var.get())
+        except ValueError as e:
+            messagebox.showerror("Simulation", f"Not a number: {e}")
+            return
+        strategy = self.risk_strategy_var.get()
+        self.risk_status_var.set("Simulating...")
+        self.tasks.submit(montecarlo.simulate_journal, self.repo, "" if strategy == ALL_STRATEGIES else strategy,
+                          bool(self.risk_rules_var.get()), paths, horizon, ruin, cache=self.simulations,
+                          on_done=self.show_simulation, on_error=lambda e: self.risk_status_var.set(str(e)),
+                          view="simulation", name="update_simulation")
+
+    def show_simulation(self, result):
+        import numpy as np
+        import montecarlo
+
+        self.risk_status_var.set(
+            f"{result.paths:,} paths of {result.horizon} trades, resampled from {result.trades} trades. "
+            f"Probability of ruin (down {result.ruin:g}%): {result.ruin_probability * 100:.1f}%")
+        tree = self.risk_tree
+        tree.delete(*tree.get_children())
+        for percentile, final, drawdown in zip(montecarlo.PERCENTILES, result.final, result.max_drawdown):
+            tree.insert("", "end", values=(f"{percentile}%", f"{final:.2f}%", f"{drawdown:.2f}%"))
+
+        # Fan chart: nested percentile bands around the median path, from the flat start
+        ax = self.risk_ax
+        ax.clear()
+        x = np.concatenate(([0], result.steps))
+        fan = np.hstack((np.zeros((len(result.fan), 1)), result.fan))
+        bands = len(fan) // 2
+        for i in range(bands):
+            low, high = montecarlo.PERCENTILES[i], montecarlo.PERCENTILES[-1 - i]
+            ax.fill_between(x, fan[i], fan[-1 - i], color="tab:blue", alpha=0.15 + 0.2 * i, linewidth=0,
+                            label=f"{low}–{high}%")
+        ax.plot(x, fan[bands], color="tab:blue", label="Median")
+        ax.axhline(-result.ruin, color="red", linestyle="--", linewidth=1, label="Ruin")
+        ax.set_title("Simulated Equity")
+        ax.set_xlabel("Trades ahead")
+        ax.set_ylabel("Cumulative P/L %")
+        ax.legend(loc="upper left", fontsize="small")
+        self.risk_canvas.draw_idle()
+
+    # -------------------------- EXPORT --------------------------
 
     def export_csv(self):
         path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv")])
+        if path:
+            self.run_export(exporter.export_csv, path)
+
+    def export_columnar(self):
+        ext = exporter.columnar_extension()
+        filetypes = [("Trading Journal Columnar", "*.tjc")]
+        if ext == ".parquet":
+            filetypes = [("Parquet", "*.parquet"), ("Arrow IPC", "*.arrow")] + filetypes
+        path = filedialog.asksaveasfilename(defaultextension=ext, filetypes=filetypes)
+        if path:
+            self.run_export(exporter.export_columnar, path)
+
+    def run_export(self, export, path):
+        # Export the trades matching the active History filters on the task pool,
+        # with a progress window that can cancel it
+        pager = self.history_pager
+        cancel = threading.Event()
+        self.export_cancels.add(cancel)
+
+        win = tk.Toplevel(self)
+        win.title("Exporting")
+        win.resizable(False, False)
+        win.transient(self)
+        label = tk.Label(win, text=f"Exporting to {os.path.basename(path)}...")
+        label.pack(padx=15, pady=(15, 5))
+        bar = ttk.Progressbar(win, length=300, mode="determinate")
+        bar.pack(padx=15, pady=5)
+        tk.Button(win, text="Cancel", command=cancel.set).pack(pady=(5, 15))
+        win.protocol("WM_DELETE_WINDOW", cancel.set)
+
+        def show_progress(done, total):
+            if total and win.winfo_exists():
+                bar["value"] = done * 100 / total
+                label.config(text=f"Exported {done} of {total} trades")
+
+        def progress(done, total):
+            self.tasks.post(show_progress, done, total)
+
+        def finished(count):
+            self.export_cancels.discard(cancel)
+            win.destroy()
+            messagebox.showinfo("Export", f"Exported {count} trades to {path}")
+
+        def failed(e):
+            self.export_cancels.discard(cancel)
+            win.destroy()
+            if isinstance(e, exporter.ExportCancelled):
+                self.status_var.set("Export cancelled")
+            else:
+                messagebox.showerror("Export", f"Could not export to {path}: {e}")
+
+        self.tasks.submit(export, self.repo, path, pager.where, pager.params, progress=progress, cancel=cancel,
+                          on_done=finished, on_error=failed)
+
+    # -------------------------- CSV IMPORT --------------------------
+
+    def import_csv(self):
+        path = filedialog.askopenfilename(filetypes=[("CSV", "*.csv"), ("All files", "*.*")])
         if not path:
             return
+        name = os.path.basename(path)
+
+        def progress(inserted, skipped):
+            self.tasks.post(self.status_var.set, f"Importing {name}: {inserted} new, {skipped} already imported")
+
+        def finished(result):
+            inserted, skipped = result
+            self.status_var.set(f"Imported {inserted} trades from {name} ({skipped} already imported)")
+            self.load_history()
+            self.update_stats()
 
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM trades")
-        rows = cursor.fetchall()
-        conn.close()
+        def failed(e):
+            self.status_var.set("")
+            messagebox.showerror("Import", f"Could not import {path}: {e}")
+
+        self.tasks.submit(importer.import_csv, self.repo, path, progress=progress, on_done=finished, on_error=failed)
+
+    # -------------------------- PERFORMANCE --------------------------
+
+    def open_performance_panel(self):
+        # Latency percentiles per operation and per SQL statement, recorded while profiling is on
+        win = self.performance_window
+        if win is not None and win.winfo_exists():
+            win.lift()
+            return
+        win = self.performance_window = tk.Toplevel(self)
+        win.title("Performance")
+        win.geometry("900x600")
+
+        top = ttk.Frame(win)
+        top.pack(fill="x", padx=10, pady=5)
+        record_var = tk.BooleanVar(value=perf.enabled)
+
+        def toggle():
+            perf.enable() if record_var.get() else perf.disable()
+
+        tk.Checkbutton(top, text="Record timings and SQL", variable=record_var, command=toggle).pack(side="left")
+        tk.Button(top, text="Save Report", command=self.save_performance_report).pack(side="right", padx=5)
+        tk.Button(top, text="Reset", command=lambda: (perf.reset(), self.show_performance())).pack(side="right", padx=5)
+
+        columns = ("count", "p50", "p95", "max")
+        self.perf_span_tree = ttk.Treeview(win, columns=("operation",) + columns, show="headings", height=8)
+        self.perf_sql_tree = ttk.Treeview(win, columns=columns + ("rows", "statement"), show="headings", height=10)
+        for tree in (self.perf_span_tree, self.perf_sql_tree):
+            for col in columns + ("rows",):
+                if col in tree["columns"]:
+                    tree.heading(col, text=col if col in ("count", "rows") else f"{col} ms")
+                    tree.column(col, width=70, anchor="e", stretch=False)
+        self.perf_span_tree.heading("operation", text="Operation")
+        self.perf_sql_tree.heading("statement", text="Statement (slow ones in red: select for the query plan)")
+        self.perf_sql_tree.column("statement", width=500)
+        self.perf_sql_tree.tag_configure("slow", foreground="red")
+        self.perf_span_tree.pack(fill="x", padx=10, pady=5)
+        self.perf_sql_tree.pack(fill="both", expand=True, padx=10, pady=5)
+        self.perf_sql_tree.bind("<<TreeviewSelect>>", lambda e: self.explain_selected_query())
+
+        self.perf_plan = scrolledtext.ScrolledText(win, height=6)
+        self.perf_plan.pack(fill="x", padx=10, pady=(0, 10))
+        self.perf_queries = {}
+
+        def refresh():
+            if win.winfo_exists():
+                self.show_performance()
+                win.after(1000, refresh)
+
+        refresh()
+
+    def show_performance(self):
+        tree = self.perf_span_tree
+        tree.delete(*tree.get_children())
+        for name, count, p50, p95, top in perf.span_report():
+            tree.insert("", "end", values=(name, count, f"{p50:.1f}", f"{p95:.1f}", f"{top:.1f}"))
+
+        # Statements are updated in place so a selected one stays selected across refreshes
+        tree = self.perf_sql_tree
+        items = {sql: item for item, (sql, _) in self.perf_queries.items()}
+        queries = {}
+        for index, (sql, count, p50, p95, top, rows, params) in enumerate(perf.query_report()):
+            values = (count, f"{p50:.1f}", f"{p95:.1f}", f"{top:.1f}", f"{rows:.0f}", sql)
+            tags = ("slow",) if p95 >= perf.SLOW_QUERY_MS else ()
+            item = items.pop(sql, None)
+            if item is None:
+                item = tree.insert("", "end", values=values, tags=tags)
+            else:
+                tree.item(item, values=values, tags=tags)
+            tree.move(item, "", index)
+            queries[item] = (sql, params)
+        for item in items.values():
+            tree.delete(item)
+        self.perf_queries = queries
+
+    def explain_selected_query(self):
+        selected = self.perf_sql_tree.selection()
+        if not selected or selected[0] not in self.perf_queries:
+            return
+        sql, params = self.perf_queries[selected[0]]
+
+        def show(plan):
+            if self.performance_window is None or not self.performance_window.winfo_exists():
+                return
+            self.perf_plan.delete("1.0", "end")
+            self.perf_plan.insert("end", sql + "\n\n" + "\n".join(plan or ["(no query plan for this statement)"]))
+
+        self.tasks.submit(perf.explain, self.repo.query_plan, sql, params, on_done=show, view="explain")
+
+    def save_performance_report(self):
+        path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text", "*.txt")])
+        if not path:
+            return
 
-        with open(path, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                "ID", "Date", "Pair", "Direction", "Quantity", "Strategy",
-                "Waited 4H", "Trend Followed", "RR OK", "Emotional", "Followed Plan",
-                "Profit%", "Notes", "Pre Image", "Post Image"
-            ])
-            for row in rows:
-                writer.writerow(row)
+        def write():
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(perf.format_report(self.repo.query_plan) + "\n")
 
-        messagebox.showinfo("Export", f"Exported {len(rows)} trades to {path}")
+        self.tasks.submit(write, on_done=lambda _: self.status_var.set(f"Saved performance report to {path}"),
+                          on_error=lambda e: messagebox.showerror("Performance", f"Could not save report: {e}"))
 
 # -------------------------- RUN APP --------------------------
 
 if __name__ == "__main__":
-    app = TradingJournalApp()
-    app.mainloop()
\ No newline at end of file
+    perf.enable_from_environment()
+    # python main.py [journal.db]
+    app = TradingJournalApp(sys.argv[1] if len(sys.argv) > 1 else DB_PATH)
+    app.mainloop()
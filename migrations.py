@@ -0,0 +1,458 @@
+# migrations.py
+# Versioned schema migrations for the journal database, tracked in PRAGMA user_version.
+# migrate() runs every pending step inside one transaction, so a database is either fully
+# migrated or left exactly as it was. Steps are frozen once released: never edit one, add a new one.
+#
+#   1  text schema: dates as text, pair/strategy strings, one INTEGER column per checklist rule
+#   2  typed schema: epoch timestamps, pair/strategy lookup tables, a rules table and a
+#      per-trade rules_mask bitmask; trade_view gives the text columns back for reading
+#   3  period_stats: P/L rollups per day, ISO week and month, kept current by triggers
+#   4  trades_fts: full-text index over notes, strategy and pair, kept current by triggers
+
+import calendar
+import datetime
+
+# Sort position of trades whose date can't be parsed: 0001-01-01, before any real date
+MISSING_TS = -62135596800
+
+# Rules a database gets when it is created; bit i of rules_mask is rule i
+DEFAULT_RULES = (
+    ("waited_4h", "Waited for 4H candle close"),
+    ("trend_followed", "Followed trend"),
+    ("rr_ok", "Proper risk-reward"),
+    ("emotional", "No emotional entry"),
+    ("followed_plan", "Entry matched plan"),
+)
+
+# rules_mask is a signed 64-bit integer
+MAX_RULE_BITS = 63
+
+
+# -------------------------- DATES --------------------------
+# Trades store seconds since 1970-01-01 in ts (times without a zone are taken as UTC, so the
+# wall-clock time written is the one read back). date_text keeps the original text only when it
+# isn't the canonical form of ts, e.g. "2024.01.05" or "2024-01-05T10:00:00+02:00".
+
+def date_to_ts(text):
+    # Trade date text -> epoch seconds, or None if it isn't a date
+    try:
+        dt = datetime.datetime.fromisoformat(text.strip())
+    except (AttributeError, TypeError, ValueError):
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return calendar.timegm(dt.timetuple())
+
+
+def ts_to_date(ts):
+    # Canonical text of a timestamp: the date alone at midnight, minutes unless there are seconds
+    dt = datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=ts)
+    if ts % 86400 == 0:
+        return dt.strftime("%Y-%m-%d")
+    if ts % 60 == 0:
+        return dt.strftime("%Y-%m-%d %H:%M")
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def date_range_end(text):
+    # First timestamp after the period a date names: the whole day for a date, the minute for HH:MM
+    ts = date_to_ts(text)
+    if ts is None:
+        return None
+    length = len(text.strip())
+    return ts + (86400 if length <= 10 else 60 if length <= 16 else 1)
+
+
+def trade_ts(text):
+    ts = date_to_ts(text)
+    return MISSING_TS if ts is None else ts
+
+
+def trade_date_text(text):
+    ts = date_to_ts(text)
+    if ts is not None and ts_to_date(ts) == text:
+        return None
+    return "" if text is None else text
+
+
+# ts_to_date in SQL, for trade_view
+DATE_SQL = """CASE
+    WHEN t.ts % 86400 = 0 THEN date(t.ts, 'unixepoch')
+    WHEN t.ts % 60 = 0 THEN strftime('%Y-%m-%d %H:%M', t.ts, 'unixepoch')
+    ELSE datetime(t.ts, 'unixepoch')
+END"""
+
+
+def register_functions(conn):
+    # SQL functions the inserts and migrations use to turn date text into ts/date_text
+    conn.create_function("trade_ts", 1, trade_ts, deterministic=True)
+    conn.create_function("trade_date_text", 1, trade_date_text, deterministic=True)
+
+
+# -------------------------- STEPS --------------------------
+
+def _add_column(cursor, table, column, decl):
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _text_schema(cursor):
+    # 1: the schema as it stood before versioning. Databases from any earlier release are brought
+    # to its final layout here (the columns later releases added), so step 2 sees one shape.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS trades (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT,
+            pair TEXT,
+            direction TEXT,
+            quantity REAL,
+            strategy TEXT,
+            waited_4h INTEGER,
+            trend_followed INTEGER,
+            rr_ok INTEGER,
+            emotional INTEGER,
+            followed_plan INTEGER,
+            profit_percent REAL,
+            notes TEXT,
+            pre_image_path TEXT,
+            post_image_path TEXT
+        )
+    """)
+    _add_column(cursor, "trades", "import_key", "TEXT")
+    _add_column(cursor, "trades", "pre_thumb_path", "TEXT")
+    _add_column(cursor, "trades", "post_thumb_path", "TEXT")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS trade_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total INTEGER NOT NULL DEFAULT 0,
+            wins INTEGER NOT NULL DEFAULT 0,
+            losses INTEGER NOT NULL DEFAULT 0,
+            win_sum REAL NOT NULL DEFAULT 0,
+            loss_sum REAL NOT NULL DEFAULT 0,
+            profit_sum REAL NOT NULL DEFAULT 0
+        )
+    """)
+
+
+def _stats_delta_sql(row, sign):
+    # SQL applying one trade row (NEW or OLD) to the aggregates with the given sign.
+    # Rule counts are keyed by bit, so adding or renaming a rule never touches the triggers.
+    profit = f"COALESCE({row}.profit_percent, 0)"
+    return f"""
+        UPDATE trade_stats SET
+            total = total {sign} 1,
+            wins = wins {sign} ({profit} > 0),
+            losses = losses {sign} ({profit} < 0),
+            win_sum = win_sum {sign} (CASE WHEN {profit} > 0 THEN {profit} ELSE 0 END),
+            loss_sum = loss_sum {sign} (CASE WHEN {profit} < 0 THEN {profit} ELSE 0 END),
+            profit_sum = profit_sum {sign} {profit}
+        WHERE id = 1;
+        UPDATE rule_stats SET followed = followed {sign} 1 WHERE ({row}.rules_mask >> bit) & 1;
+    """
+
+
+def _typed_schema(cursor):
+    # 2: epoch timestamps, dictionary-encoded pairs and strategies, rules as bits of rules_mask.
+    # Lookup names are unique case-insensitively, matching how the History filters and the
+    # analytics already grouped them; the first spelling in the journal names the group.
+    for table, column in (("pairs", "pair"), ("strategies", "strategy")):
+        cursor.execute(f"""
+            CREATE TABLE {table} (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE COLLATE NOCASE
+            )
+        """)
+        cursor.execute(f"INSERT OR IGNORE INTO {table} (name) SELECT COALESCE({column}, '') FROM trades ORDER BY id")
+
+    cursor.execute(f"""
+        CREATE TABLE rules (
+            bit INTEGER PRIMARY KEY CHECK (bit BETWEEN 0 AND {MAX_RULE_BITS - 1}),
+            key TEXT NOT NULL UNIQUE,
+            label TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            active INTEGER NOT NULL DEFAULT 1
+        )
+    """)
+    # The text schema had one column per default rule, in this order
+    cursor.executemany("INSERT INTO rules (bit, key, label, position) VALUES (?, ?, ?, ?)",
+                       [(bit, key, label, bit) for bit, (key, label) in enumerate(DEFAULT_RULES)])
+
+    cursor.execute("""
+        CREATE TABLE trades_typed (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts INTEGER NOT NULL,
+            date_text TEXT,
+            pair_id INTEGER NOT NULL REFERENCES pairs (id),
+            direction TEXT,
+            quantity REAL,
+            strategy_id INTEGER NOT NULL REFERENCES strategies (id),
+            rules_mask INTEGER NOT NULL DEFAULT 0,
+            profit_percent REAL,
+            notes TEXT,
+            pre_image_path TEXT,
+            post_image_path TEXT,
+            pre_thumb_path TEXT,
+            post_thumb_path TEXT,
+            import_key TEXT
+        )
+    """)
+    mask = " | ".join(f"((COALESCE(t.{key}, 0) != 0) << {bit})" for bit, (key, _) in enumerate(DEFAULT_RULES))
+    cursor.execute(f"""
+        INSERT INTO trades_typed
+        SELECT t.id, trade_ts(t.date), trade_date_text(t.date),
+               (SELECT id FROM pairs WHERE name = COALESCE(t.pair, '')), t.direction, t.quantity,
+               (SELECT id FROM strategies WHERE name = COALESCE(t.strategy, '')), {mask},
+               t.profit_percent, t.notes, t.pre_image_path, t.post_image_path,
+               t.pre_thumb_path, t.post_thumb_path, t.import_key
+        FROM trades t
+    """)
+    # Keep AUTOINCREMENT from reusing ids of trades deleted before the migration
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'trades'")
+    row = cursor.fetchone()
+    cursor.execute("DROP TABLE trades")
+    cursor.execute("ALTER TABLE trades_typed RENAME TO trades")
+    if row:
+        cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'trades'", row)
+
+    # History is paged in (ts, id) order and filtered in SQL; every filter has an index.
+    # pair/strategy carry ts so a filtered, date-ordered page needs no sort step.
+    cursor.execute("CREATE INDEX idx_trades_ts ON trades (ts)")
+    cursor.execute("CREATE INDEX idx_trades_pair ON trades (pair_id, ts)")
+    cursor.execute("CREATE INDEX idx_trades_strategy ON trades (strategy_id, ts)")
+    cursor.execute("CREATE INDEX idx_trades_profit ON trades (profit_percent)")
+    # Rule counts are computed per distinct checklist (GROUP BY rules_mask), read off this index
+    cursor.execute("CREATE INDEX idx_trades_rules ON trades (rules_mask)")
+    # Natural key of imported trades (broker ticket or content hash), so re-imports skip known rows
+    cursor.execute("CREATE UNIQUE INDEX idx_trades_import_key ON trades (import_key) WHERE import_key IS NOT NULL")
+
+    # The trade columns as the app reads them
+    cursor.execute(f"""
+        CREATE VIEW trade_view AS
+        SELECT t.id, COALESCE(t.date_text, {DATE_SQL}) AS date, p.name AS pair, t.direction, t.quantity,
+               s.name AS strategy, t.rules_mask, t.profit_percent, t.notes,
+               t.pre_image_path, t.post_image_path, t.pre_thumb_path, t.post_thumb_path,
+               t.ts, t.pair_id, t.strategy_id
+        FROM trades t
+        JOIN pairs p ON p.id = t.pair_id
+        JOIN strategies s ON s.id = t.strategy_id
+    """)
+
+    # Running totals kept in step with trades by triggers; trade_stats carries over unchanged and
+    # the repository seeds rule_stats (see rebuild_stats) the first time it opens the database
+    cursor.execute("DROP TABLE IF EXISTS rule_stats")
+    cursor.execute("""
+        CREATE TABLE rule_stats (
+            bit INTEGER PRIMARY KEY REFERENCES rules (bit),
+            followed INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute(f"CREATE TRIGGER trades_stats_insert AFTER INSERT ON trades BEGIN {_stats_delta_sql('NEW', '+')} END")
+    cursor.execute(f"CREATE TRIGGER trades_stats_delete AFTER DELETE ON trades BEGIN {_stats_delta_sql('OLD', '-')} END")
+    cursor.execute(f"""
+        CREATE TRIGGER trades_stats_update AFTER UPDATE ON trades BEGIN
+            {_stats_delta_sql('OLD', '-')}
+            {_stats_delta_sql('NEW', '+')}
+        END
+    """)
+
+
+# -------------------------- PERIODS --------------------------
+# Period boundaries as SQL over an epoch-seconds expression. Days and ISO weeks are plain
+# arithmetic (1970-01-01 was a Thursday, so Monday is 3 days before it); months need the calendar.
+
+def _day_start(ts):
+    return f"({ts} - (({ts} % 86400) + 86400) % 86400)"
+
+
+def _week_start(ts):
+    day = _day_start(ts)
+    return f"({day} - ((({day} / 86400 + 3) % 7) + 7) % 7 * 86400)"
+
+
+def _month_start(ts, shift=""):
+    return f"CAST(strftime('%s', {ts}, 'unixepoch', 'start of month'{shift}) AS INTEGER)"
+
+
+def period_bounds(ts):
+    # [(period, start SQL, end SQL)] of the periods containing the timestamp expression ts
+    return [
+        ("day", _day_start(ts), f"{_day_start(ts)} + 86400"),
+        ("week", _week_start(ts), f"{_week_start(ts)} + 604800"),
+        ("month", _month_start(ts), _month_start(ts, ", '+1 month'")),
+    ]
+
+
+PERIODS = tuple(period for period, _, _ in period_bounds("ts"))
+
+
+def _period_match(ts):
+    # Spelled out as ORed key equalities: SQLite scans the table for a row-value IN (VALUES ...)
+    return " OR ".join(f"(period = '{period}' AND start_ts = {start})" for period, start, _ in period_bounds(ts))
+
+
+def _rollup_remove_sql(row):
+    # Take one trade out of its periods. Its place in the running P/L is unknown from here, so
+    # peak/drawdown go stale (NULL) and are recomputed when read (TradeRepository.rollups).
+    profit = f"COALESCE({row}.profit_percent, 0)"
+    match = _period_match(f"{row}.ts")
+    return f"""
+        UPDATE period_stats SET
+            trades = trades - 1,
+            wins = wins - ({profit} > 0),
+            profit = profit - {profit},
+            peak = NULL,
+            drawdown = NULL
+        WHERE {row}.ts != {MISSING_TS} AND ({match});
+        DELETE FROM period_stats WHERE trades <= 0 AND ({match});
+    """
+
+
+def _rollup_add_sql(row):
+    # Add one trade to its periods. A trade after the period's last one extends the running
+    # peak and drawdown in place; anything else leaves them stale (MAX/MIN of NULL is NULL).
+    profit = f"COALESCE({row}.profit_percent, 0)"
+    periods = " UNION ALL ".join(f"SELECT '{period}' AS period, {start} AS start_ts, {end} AS end_ts"
+                                 for period, start, end in period_bounds(f"{row}.ts"))
+    after = "(excluded.last_ts, excluded.last_id) > (last_ts, last_id)"
+    return f"""
+        INSERT INTO period_stats (period, start_ts, end_ts, trades, wins, profit, peak, drawdown, last_ts, last_id)
+        SELECT period, start_ts, end_ts, 1, {profit} > 0, {profit}, MAX({profit}, 0), MIN({profit}, 0), {row}.ts, {row}.id
+        FROM ({periods})
+        WHERE {row}.ts != {MISSING_TS}
+        ON CONFLICT (period, start_ts) DO UPDATE SET
+            trades = trades + 1,
+            wins = wins + excluded.wins,
+            profit = profit + excluded.profit,
+            peak = CASE WHEN {after} THEN MAX(peak, profit + excluded.profit) END,
+            drawdown = CASE WHEN {after}
+                THEN MIN(drawdown, profit + excluded.profit - MAX(peak, profit + excluded.profit)) END,
+            last_id = CASE WHEN {after} THEN excluded.last_id ELSE last_id END,
+            last_ts = CASE WHEN {after} THEN excluded.last_ts ELSE last_ts END;
+    """
+
+
+def _period_rollups(cursor):
+    # 3: per-period rollups for the calendar heatmap and period table. Undated trades
+    # (MISSING_TS) are left out. The repository fills the table the first time it opens the
+    # database (see rebuild_rollups).
+    cursor.execute("""
+        CREATE TABLE period_stats (
+            period TEXT NOT NULL,
+            start_ts INTEGER NOT NULL,
+            end_ts INTEGER NOT NULL,
+            trades INTEGER NOT NULL,
+            wins INTEGER NOT NULL,
+            profit REAL NOT NULL,
+            peak REAL,
+            drawdown REAL,
+            last_ts INTEGER,
+            last_id INTEGER,
+            PRIMARY KEY (period, start_ts)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX idx_period_stats_stale ON period_stats (period, start_ts) WHERE drawdown IS NULL")
+    cursor.execute(f"CREATE TRIGGER period_stats_insert AFTER INSERT ON trades BEGIN {_rollup_add_sql('NEW')} END")
+    cursor.execute(f"CREATE TRIGGER period_stats_delete AFTER DELETE ON trades BEGIN {_rollup_remove_sql('OLD')} END")
+    # Only date and P/L changes move a trade between or within periods
+    cursor.execute(f"""
+        CREATE TRIGGER period_stats_update AFTER UPDATE OF ts, profit_percent ON trades
+        WHEN OLD.ts IS NOT NEW.ts OR OLD.profit_percent IS NOT NEW.profit_percent
+        BEGIN
+            {_rollup_remove_sql('OLD')}
+            {_rollup_add_sql('NEW')}
+        END
+    """)
+
+
+# The text trades_fts indexes for one trade row (NEW or OLD), in its column order
+def _fts_values(row):
+    return (f"{row}.notes, (SELECT name FROM strategies WHERE id = {row}.strategy_id), "
+            f"(SELECT name FROM pairs WHERE id = {row}.pair_id)")
+
+
+def _notes_search(cursor):
+    # 4: FTS5 index for the History search box. It is external-content over trade_view, so the
+    # text is stored once (in trades) and highlight/snippet read it back through the view. The
+    # prefix indexes serve search-as-you-type queries ("brea"*) without scanning the term list.
+    # rank is bm25 with strategy and pair hits weighted above notes hits.
+    cursor.execute("""
+        CREATE VIRTUAL TABLE trades_fts USING fts5 (
+            notes, strategy, pair,
+            content = 'trade_view', content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        )
+    """)
+    cursor.execute("INSERT INTO trades_fts (trades_fts, rank) VALUES ('rank', 'bm25(1.0, 2.0, 2.0)')")
+    cursor.execute("INSERT INTO trades_fts (trades_fts) VALUES ('rebuild')")
+    # An external-content index must be told the old text of a row to forget it
+    cursor.execute(f"""
+        CREATE TRIGGER trades_fts_insert AFTER INSERT ON trades BEGIN
+            INSERT INTO trades_fts (rowid, notes, strategy, pair) VALUES (NEW.id, {_fts_values('NEW')});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trades_fts_delete AFTER DELETE ON trades BEGIN
+            INSERT INTO trades_fts (trades_fts, rowid, notes, strategy, pair) VALUES ('delete', OLD.id, {_fts_values('OLD')});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trades_fts_update AFTER UPDATE OF notes, strategy_id, pair_id ON trades
+        WHEN OLD.notes IS NOT NEW.notes OR OLD.strategy_id != NEW.strategy_id OR OLD.pair_id != NEW.pair_id
+        BEGIN
+            INSERT INTO trades_fts (trades_fts, rowid, notes, strategy, pair) VALUES ('delete', OLD.id, {_fts_values('OLD')});
+            INSERT INTO trades_fts (rowid, notes, strategy, pair) VALUES (NEW.id, {_fts_values('NEW')});
+        END
+    """)
+
+
+def _change_counter(cursor):
+    # 5: a counter every insert, update and delete of a trade bumps, so results derived from the
+    # whole journal (Monte Carlo simulations) can be cached against it and reused until it moves
+    cursor.execute("""
+        CREATE TABLE journal_changes (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            changes INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("INSERT INTO journal_changes (id, changes) VALUES (1, 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cursor.execute(f"""
+            CREATE TRIGGER trades_changes_{event.lower()} AFTER {event} ON trades BEGIN
+                UPDATE journal_changes SET changes = changes + 1 WHERE id = 1;
+            END
+        """)
+
+
+# Step i + 1 takes a database from version i to version i + 1
+STEPS = (_text_schema, _typed_schema, _period_rollups, _notes_search, _change_counter)
+SCHEMA_VERSION = len(STEPS)
+
+
+def schema_version(cursor):
+    cursor.execute("PRAGMA user_version")
+    return cursor.fetchone()[0]
+
+
+def migrate(conn):
+    # Bring the database to SCHEMA_VERSION in one transaction; returns the version it started at.
+    # The trade_ts/trade_date_text functions must be registered on conn (register_functions).
+    cursor = conn.cursor()
+    version = schema_version(cursor)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema version {version} is newer than this app ({SCHEMA_VERSION})")
+    if version == SCHEMA_VERSION:
+        return version
+
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        # Another process may have migrated between the check and the lock
+        start = schema_version(cursor)
+        for step in STEPS[start:]:
+            step(cursor)
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        cursor.execute("COMMIT")
+    except BaseException:
+        cursor.execute("ROLLBACK")
+        raise
+    return version
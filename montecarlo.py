@@ -0,0 +1,155 @@
+# montecarlo.py
+# Bootstrap risk simulation: the P/L of the journal's trades (all of them, one strategy's, or only
+# those that followed every checklist rule) is resampled with replacement into many equity paths.
+# Paths are simulated in chunks, each vectorized with NumPy, spread over a process pool. The result
+# is a distribution: percentiles of final P/L and max drawdown, probability of ruin, and the
+# percentile bands of a fan chart. Needs numpy; no GUI.
+
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+import analytics
+
+DEFAULT_PATHS = 20000
+# Trades per path when not given: as many as were resampled, up to this
+DEFAULT_HORIZON = 1000
+# A path is ruined once its cumulative P/L falls to -ruin (%)
+DEFAULT_RUIN = 50.0
+# Fixed, so the same journal and options always give the same (cacheable) result
+DEFAULT_SEED = 0
+
+# Resampled trades per chunk (paths x horizon), which bounds each worker's arrays to a few MB.
+# Chunks don't depend on the number of workers, so neither does the result.
+CHUNK_TRADES = 1 << 21
+
+# Percentiles reported for final P/L, max drawdown and the fan chart bands (low = bad outcome)
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Points along the horizon the fan chart is sampled at
+FAN_POINTS = 100
+
+# Simulations kept by SimulationCache
+CACHE_ENTRIES = 8
+
+
+class Simulation(namedtuple("Simulation", "trades paths horizon ruin ruin_probability steps fan final max_drawdown")):
+    """Outcome distribution of paths bootstrap paths of horizon trades each, resampled from trades P/L values.
+
+    final and max_drawdown hold the PERCENTILES of the paths' final P/L and deepest fall from a
+    peak; fan is a (len(PERCENTILES), len(steps)) array of the paths' P/L percentiles after each
+    of steps trades. ruin_probability is the share of paths that fell to -ruin at some point.
+    """
+
+
+def load_sample(repo, strategy="", rules_followed=False):
+    # P/L of the trades to resample, in date order. strategy is matched case-insensitively, as the
+    # strategy breakdown groups names; rules_followed keeps trades that followed every rule.
+    trades = analytics.load_trades(repo)
+    keep = np.ones(len(trades.profit), dtype=bool)
+    if strategy:
+        labels = [label.lower() for label in trades.strategies]
+        name = strategy.strip().lower()
+        keep &= trades.strategy == (labels.index(name) if name in labels else -1)
+    if rules_followed:
+        keep &= trades.rules.all(axis=1)
+    return trades.profit[keep]
+
+
+def simulate_chunk(profit, paths, horizon, ruin, steps, seed):
+    # Runs in a pool process: paths paths of horizon trades drawn from profit. Returns each path's
+    # final P/L, max drawdown (from the flat start, as analytics.drawdown measures it), whether it
+    # was ruined, and its P/L after each of steps trades.
+    rng = np.random.default_rng(seed)
+    equity = np.cumsum(profit[rng.integers(0, len(profit), size=(paths, horizon))], axis=1)
+    peaks = np.maximum.accumulate(np.maximum(equity, 0.0), axis=1)
+    drawdown = np.minimum((equity - peaks).min(axis=1), 0.0)
+    ruined = equity.min(axis=1) <= -ruin
+    return equity[:, -1], drawdown, ruined, equity[:, steps - 1].astype(np.float32)
+
+
+def fan_steps(horizon):
+    return np.unique(np.linspace(1, horizon, min(FAN_POINTS, horizon)).round().astype(np.int64))
+
+
+def run_simulation(profit, paths=DEFAULT_PATHS, horizon=None, ruin=DEFAULT_RUIN, seed=DEFAULT_SEED, workers=None):
+    # Simulate in chunks, in separate processes when there are several (spawned, not forked: the
+    # GUI calls this from a thread), and reduce the paths to a Simulation
+    profit = np.asarray(profit, dtype=float)
+    if not len(profit):
+        raise ValueError("No trades to resample")
+    if paths < 1:
+        raise ValueError(f"Need at least one path, got {paths}")
+    if horizon is not None and horizon < 0:
+        raise ValueError(f"Trades ahead can't be negative, got {horizon}")
+    if ruin <= 0:
+        raise ValueError(f"The ruin level is a loss, give it as a positive percentage, got {ruin:g}")
+    horizon = horizon or min(len(profit), DEFAULT_HORIZON)
+    steps = fan_steps(horizon)
+    per_chunk = max(1, CHUNK_TRADES // horizon)
+    sizes = [min(per_chunk, paths - start) for start in range(0, paths, per_chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(profit, size, horizon, ruin, steps, chunk_seed) for size, chunk_seed in zip(sizes, seeds)]
+
+    workers = min(len(tasks), workers or os.cpu_count() or 1)
+    if workers <= 1:
+        parts = [simulate_chunk(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+            parts = list(pool.map(simulate_chunk, *zip(*tasks)))
+    final, drawdown, ruined, fan = (np.concatenate(column) for column in zip(*parts))
+    return Simulation(
+        trades=len(profit),
+        paths=paths,
+        horizon=horizon,
+        ruin=ruin,
+        ruin_probability=float(ruined.mean()),
+        steps=steps,
+        fan=np.percentile(fan, PERCENTILES, axis=0),
+        final=np.percentile(final, PERCENTILES),
+        max_drawdown=np.percentile(drawdown, PERCENTILES),
+    )
+
+
+class SimulationCache:
+    """Simulations in least-recently-used order, keyed by journal file, the journal's change
+    counter and the options. Any trade change moves the counter, so a hit is always current.
+    Safe to use from several worker threads.
+    """
+
+    def __init__(self, entries=CACHE_ENTRIES):
+        self.entries = OrderedDict()
+        self.max_entries = entries
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+            return result
+
+    def put(self, key, result):
+        with self._lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+def simulate_journal(repo, strategy="", rules_followed=False, paths=DEFAULT_PATHS, horizon=None, ruin=DEFAULT_RUIN,
+                     seed=DEFAULT_SEED, workers=None, cache=None):
+    # The journal's Simulation as it stands: from cache when nothing changed since it was run
+    # (counter read first, so a change during the run only makes the entry miss next time)
+    key = (os.path.abspath(repo.path), repo.change_counter(), tuple(rule for rule, _ in repo.rules),
+           strategy.strip().lower(), rules_followed, paths, horizon, ruin, seed)
+    result = cache.get(key) if cache is not None else None
+    if result is None:
+        result = run_simulation(load_sample(repo, strategy, rules_followed), paths, horizon, ruin, seed, workers)
+        if cache is not None:
+            cache.put(key, result)
+    return result
@@ -0,0 +1,295 @@
+# perf.py
+# Opt-in performance instrumentation: timing spans around the app's hot paths and a profile of
+# every SQL statement (duration, rows, and the statements triggers run, via set_trace_callback).
+#
+# Off by default; enable() turns it on (JOURNAL_PROFILE=1 does so at startup, and
+# JOURNAL_PROFILE_LOG=<path> additionally appends one line per span/statement to a log file).
+# Disabled, a span costs one flag check and connections behave like plain sqlite3 ones.
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import wraps
+
+# Samples kept per operation / statement for the percentiles
+SAMPLES = 2000
+# Statements whose p95 is slower than this (ms) are flagged and shown with their query plan
+SLOW_QUERY_MS = 50.0
+# Statements kept in the recent-statement trace
+TRACE_SIZE = 500
+
+enabled = False
+
+_lock = threading.Lock()
+_spans = OrderedDict()
+_queries = OrderedDict()
+_trace = deque(maxlen=TRACE_SIZE)
+_log = None
+
+
+class QueryStats:
+    """Samples of one SQL statement (keyed by its whitespace-normalized text)."""
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.samples = deque(maxlen=SAMPLES)
+        self.params = ()
+
+    def new_sample(self, ms, rows, params):
+        # [ms, rows] is updated in place as the cursor is fetched
+        sample = [ms, rows]
+        self.samples.append(sample)
+        if params is not None:
+            self.params = params
+        return sample
+
+
+def enable(log_path=None):
+    global enabled, _log
+    if log_path and _log is None:
+        _log = open(log_path, "a", buffering=1, encoding="utf-8")
+    enabled = True
+
+
+def disable():
+    # Stops recording; collected samples and the log file stay
+    global enabled
+    enabled = False
+
+
+def enable_from_environment():
+    log_path = os.environ.get("JOURNAL_PROFILE_LOG")
+    if log_path or os.environ.get("JOURNAL_PROFILE"):
+        enable(log_path)
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _queries.clear()
+        _trace.clear()
+
+
+def _write_log(kind, name, ms, rows=""):
+    log = _log
+    if log is not None:
+        stamp = time.strftime("%H:%M:%S")
+        log.write(f"{stamp}\t{threading.current_thread().name}\t{kind}\t{ms:.3f}\t{rows}\t{name}\n")
+
+
+# -------------------------- SPANS --------------------------
+
+def record(name, ms):
+    with _lock:
+        samples = _spans.get(name)
+        if samples is None:
+            samples = _spans[name] = deque(maxlen=SAMPLES)
+        samples.append(ms)
+    _write_log("span", name, ms)
+
+
+@contextmanager
+def span(name):
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - start) * 1000)
+
+
+def timed(name):
+    # Decorator form of span()
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# -------------------------- SQL --------------------------
+
+_SPACES = re.compile(r"\s+")
+
+
+def _query(sql, ms, rows, params):
+    key = _SPACES.sub(" ", sql).strip()
+    with _lock:
+        stats = _queries.get(key)
+        if stats is None:
+            stats = _queries[key] = QueryStats(key)
+        sample = stats.new_sample(ms, rows, params)
+    return sample
+
+
+def _trace_statement(sql):
+    # set_trace_callback hook: sees every statement SQLite runs, including those inside triggers
+    _trace.append((time.time(), threading.current_thread().name, sql))
+    _write_log("trace", _SPACES.sub(" ", sql).strip(), 0.0)
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that times execute and every fetch, and counts the rows it returns."""
+
+    _sample = None
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            self._sample = _query(sql, ms, max(self.rowcount, 0), parameters)
+            _write_log("sql", sql, ms, max(self.rowcount, 0))
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            self._sample = _query(sql, ms, max(self.rowcount, 0), None)
+            _write_log("sql", sql, ms, max(self.rowcount, 0))
+
+    def _fetched(self, start, count):
+        sample = self._sample
+        if sample is not None:
+            sample[0] += (time.perf_counter() - start) * 1000
+            sample[1] += count
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(start, 0)
+            raise
+        self._fetched(start, 1)
+        return row
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """sqlite3 connection that profiles its statements while instrumentation is enabled."""
+
+    _traced = False
+
+    def _sync_trace(self):
+        # Install or remove the statement trace from the thread using the connection
+        if enabled != self._traced:
+            self.set_trace_callback(_trace_statement if enabled else None)
+            self._traced = enabled
+
+    def cursor(self, factory=None):
+        self._sync_trace()
+        if factory is None:
+            factory = ProfiledCursor if enabled else sqlite3.Cursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if not enabled and not self._traced:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not enabled and not self._traced:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# -------------------------- REPORTS --------------------------
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def span_report():
+    # [(name, count, p50, p95, max)] for every recorded operation
+    with _lock:
+        spans = [(name, sorted(samples)) for name, samples in _spans.items()]
+    return [(name, len(s), _percentile(s, 0.5), _percentile(s, 0.95), s[-1]) for name, s in spans if s]
+
+
+def query_report():
+    # [(sql, count, p50, p95, max, average rows, params)], slowest p95 first
+    with _lock:
+        queries = [(q.sql, list(q.samples), q.params) for q in _queries.values()]
+    report = []
+    for sql, samples, params in queries:
+        if not samples:
+            continue
+        times = sorted(ms for ms, _ in samples)
+        rows = sum(r for _, r in samples) / len(samples)
+        report.append((sql, len(times), _percentile(times, 0.5), _percentile(times, 0.95), times[-1], rows, params))
+    report.sort(key=lambda q: q[3], reverse=True)
+    return report
+
+
+def recent_statements():
+    return list(_trace)
+
+
+def explain(query_plan, sql, params=()):
+    # EXPLAIN QUERY PLAN steps of a read statement via query_plan(sql, params)
+    # (TradeRepository.query_plan), or None for statements it doesn't apply to
+    if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+        return None
+    try:
+        return query_plan(sql, params or ())
+    except sqlite3.Error as e:
+        return [f"(no plan: {e})"]
+
+
+def _shorten(sql, width=160):
+    sql = _SPACES.sub(" ", sql).strip()
+    return sql if len(sql) <= width else sql[:width - 3] + "..."
+
+
+def format_report(query_plan=None, slow_ms=SLOW_QUERY_MS, recent=50):
+    # Plain-text report: operation latencies, statements with plans for the slow ones, recent trace
+    lines = ["Operations (ms)", f"  {'operation':<44} {'count':>7} {'p50':>9} {'p95':>9} {'max':>9}"]
+    for name, count, p50, p95, top in span_report():
+        lines.append(f"  {name:<44} {count:>7} {p50:>9.2f} {p95:>9.2f} {top:>9.2f}")
+    lines += ["", "SQL statements (ms), slowest p95 first",
+              f"  {'count':>7} {'p50':>9} {'p95':>9} {'max':>9} {'rows':>9}  statement"]
+    for sql, count, p50, p95, top, rows, params in query_report():
+        flag = "SLOW " if p95 >= slow_ms else ""
+        lines.append(f"  {count:>7} {p50:>9.2f} {p95:>9.2f} {top:>9.2f} {rows:>9.1f}  {flag}{_shorten(sql)}")
+        if flag and query_plan is not None:
+            for step in explain(query_plan, sql, params) or ():
+                lines.append(f"  {'':>47}  plan: {step}")
+    statements = recent_statements()[-recent:] if recent else []
+    if statements:
+        lines += ["", "Recent statements (including trigger bodies)"]
+        for stamp, thread, sql in statements:
+            lines.append(f"  {time.strftime('%H:%M:%S', time.localtime(stamp))} {thread:<16} {_shorten(sql)}")
+    return "\n".join(lines)
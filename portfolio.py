@@ -0,0 +1,132 @@
+# portfolio.py
+# Several journals (accounts, prop-firm challenges) seen as one portfolio. Each journal is
+# summarized in its own pool process; the summaries are merged into combined totals, metrics
+# and an equity curve. attach_journals() opens them side by side for cross-journal SQL.
+# Needs numpy; no GUI.
+
+import os
+import sqlite3
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from urllib.request import pathname2url
+
+import numpy as np
+
+import analytics
+from migrations import MISSING_TS
+from repository import Stats, TradeRepository
+
+
+class JournalSummary(namedtuple("JournalSummary", "path name stats metrics dates profit")):
+    """One journal's aggregates plus its trades' dates (datetime64, NaT if undated) and P/L in date order."""
+
+
+Portfolio = namedtuple("Portfolio", "journals stats metrics dates profit")
+
+
+def journal_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _trade_arrays(dates, profit):
+    # A TradeArrays with only the date and P/L columns, which is all analytics.metrics reads
+    empty = np.empty(0, dtype=np.int32)
+    return analytics.TradeArrays(dates, profit, empty, [], empty, [], np.empty((0, 0), dtype=bool), [])
+
+
+def summarize_journal(path):
+    # Runs in a pool process: open (and migrate) one journal and reduce it to a JournalSummary
+    repo = TradeRepository(path)
+    try:
+        repo.init_schema()
+        stats = repo.stats()
+        trades = repo.equity_series()
+    finally:
+        repo.close()
+    ts = np.fromiter((t[0] for t in trades), dtype=np.int64, count=len(trades))
+    profit = np.fromiter((t[1] for t in trades), dtype=float, count=len(trades))
+    dates = ts.astype("datetime64[s]")
+    dates[ts == MISSING_TS] = np.datetime64("NaT")
+    return JournalSummary(path, journal_name(path), stats, analytics.metrics(_trade_arrays(dates, profit)),
+                          dates, profit)
+
+
+def merge_stats(stats):
+    # Journal-wide Stats summed over journals; rule counts are matched by rule key
+    followed = Counter()
+    for s in stats:
+        followed.update(s.followed)
+    totals = [sum(values) for values in zip(*(s[:6] for s in stats))] or [0, 0, 0, 0.0, 0.0, 0.0]
+    return Stats(*totals, dict(followed))
+
+
+def combine(journals):
+    # Interleave the journals' trades by date into one stream. Undated trades go first, as they
+    # do within a journal; trades at the same moment keep the order the journals were given in.
+    dates = np.concatenate([j.dates for j in journals]) if journals else np.empty(0, dtype="datetime64[s]")
+    profit = np.concatenate([j.profit for j in journals]) if journals else np.empty(0)
+    # NaT is the smallest int64, so sorting the raw values puts undated trades first
+    order = np.argsort(dates.view(np.int64), kind="stable")
+    dates, profit = dates[order], profit[order]
+    return Portfolio(journals, merge_stats([j.stats for j in journals]),
+                     analytics.metrics(_trade_arrays(dates, profit)), dates, profit)
+
+
+def aggregate_journals(paths, workers=None):
+    # Summarize every journal, in parallel when there are several, and combine them. Journals
+    # are summarized in separate processes (spawned, not forked: the GUI calls this from a
+    # thread) so a dozen large ones take about as long as the largest per core.
+    paths = list(paths)
+    workers = min(len(paths), workers or os.cpu_count() or 1)
+    if workers <= 1:
+        return combine([summarize_journal(path) for path in paths])
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        return combine(list(pool.map(summarize_journal, paths)))
+
+
+def equity_curve(dates, profit):
+    # (dates, cumulative P/L) of the dated trades; undated ones still count toward the total
+    equity = np.cumsum(profit)
+    dated = ~np.isnat(dates)
+    return dates[dated], equity[dated]
+
+
+# -------------------------- CROSS-JOURNAL SQL --------------------------
+
+PORTFOLIO_COLUMNS = ("journal", "id", "date", "pair", "direction", "profit_percent", "strategy")
+
+
+def attach_journals(paths):
+    # In-memory connection with each journal ATTACHed read-only, and a TEMP view portfolio_trades
+    # over all their trades (trade_view columns plus journal). Journals are migrated first, since
+    # a read-only attach can't. SQLite caps attached databases (10 by default).
+    conn = sqlite3.connect(":memory:", uri=True)
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    if len(paths) > limit:
+        conn.close()
+        raise ValueError(f"At most {limit} journals can be attached at once, got {len(paths)}")
+    for path in paths:
+        repo = TradeRepository(path)
+        try:
+            repo.init_schema()
+        finally:
+            repo.close()
+    selects = []
+    for i, path in enumerate(paths):
+        conn.execute(f"ATTACH DATABASE ? AS j{i}", (f"file:{pathname2url(os.path.abspath(path))}?mode=ro",))
+        # Views can't take parameters, so the journal name is a quoted literal
+        name = journal_name(path).replace("'", "''")
+        selects.append(f"SELECT '{name}' AS journal, v.* FROM j{i}.trade_view v")
+    conn.execute(f"CREATE TEMP VIEW portfolio_trades AS {' UNION ALL '.join(selects)}")
+    return conn
+
+
+def iter_portfolio_trades(conn, chunk_size=1000):
+    # Every trade of the attached journals in date order, as PORTFOLIO_COLUMNS tuples
+    cursor = conn.execute(f"SELECT {', '.join(PORTFOLIO_COLUMNS)} FROM portfolio_trades ORDER BY ts, journal, id")
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
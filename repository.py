@@ -0,0 +1,922 @@
+# repository.py
+# Data access layer for the trading journal: owns the SQLite connections and every SQL statement.
+# Nothing here imports tkinter, so it can be used (and benchmarked) without the GUI.
+
+import datetime
+import re
+import sqlite3
+import string
+import threading
+import unicodedata
+from collections import namedtuple
+
+import migrations
+import perf
+from events import DELETED, INSERTED, UPDATED, EventBus, TradeEvent
+
+DB_PATH = "journal.db"
+
+# Columns of a trade as the app reads and writes them (import_key is only used by imports).
+# date/pair/strategy are text here; the trades table stores ts/pair_id/strategy_id (see migrations.py).
+TRADE_COLUMNS = (
+    "id", "date", "pair", "direction", "quantity", "strategy", "rules_mask",
+    "profit_percent", "notes", "pre_image_path", "post_image_path",
+    "pre_thumb_path", "post_thumb_path",
+)
+
+
+class Trade(namedtuple("Trade", TRADE_COLUMNS)):
+    """One trade as read through trade_view; followed(bit) reads its checklist."""
+
+    __slots__ = ()
+
+    def followed(self, bit):
+        return bool((self.rules_mask or 0) >> bit & 1)
+
+
+def export_columns(rules):
+    # Trade columns with rules_mask replaced by one 0/1 column per rule (see iter_export_chunks)
+    i = TRADE_COLUMNS.index("rules_mask")
+    return TRADE_COLUMNS[:i] + tuple(key for key, _ in rules) + TRADE_COLUMNS[i + 1:]
+
+
+# Columns written by bulk imports: every trade column plus the natural key
+IMPORT_COLUMNS = TRADE_COLUMNS[1:] + ("import_key",)
+
+# Values used for columns a caller leaves out when inserting
+TRADE_DEFAULTS = {
+    "date": "", "pair": "", "direction": "", "quantity": 0.0, "strategy": "", "rules_mask": 0,
+    "profit_percent": 0.0, "notes": "", "pre_image_path": "", "post_image_path": "",
+    "pre_thumb_path": "", "post_thumb_path": "",
+}
+
+# Applied to every connection: WAL lets readers run beside a writer, NORMAL sync is safe under WAL,
+# and a larger page cache plus memory-mapped reads keep hot pages out of the read() path
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+)
+
+# Refresh planner statistics. PRAGMA optimize analyzes only the tables a connection queried
+# heavily (trades); without stats for the small lookup tables SQLite takes them for large ones
+# and sorts every trade for a pair/strategy ordering instead of walking the name index.
+OPTIMIZE = (
+    "ANALYZE pairs",
+    "ANALYZE strategies",
+    "PRAGMA optimize",
+)
+
+
+class Stats(namedtuple("Stats", "total wins losses win_sum loss_sum profit_sum followed")):
+    """Journal-wide aggregates; followed maps each rule key to the trades that followed it."""
+
+    @property
+    def win_rate(self):
+        return (self.wins / self.total * 100) if self.total else 0
+
+    @property
+    def avg_win(self):
+        return (self.win_sum / self.wins) if self.wins else 0
+
+    @property
+    def avg_loss(self):
+        return (self.loss_sum / self.losses) if self.losses else 0
+
+    def most_broken_rule(self, rules):
+        # Label of the rule (of the journal's (key, label) rules) left unchecked on the most
+        # trades, or None if no rule was ever broken
+        broken = [self.total - self.followed.get(key, 0) for key, _ in rules]
+        if not broken or max(broken) <= 0:
+            return None
+        return rules[broken.index(max(broken))][1]
+
+    def changed(self, rule_bits, old=None, new=None):
+        # The aggregates after one trade goes from old to new (None for an insert or a delete),
+        # counted as the triggers count them; rule_bits is the journal's key -> bit map
+        totals = list(self[:6])
+        followed = dict(self.followed)
+        for trade, sign in ((old, -1), (new, 1)):
+            if trade is None:
+                continue
+            profit = trade.profit_percent or 0
+            for i, value in enumerate((1, profit > 0, profit < 0, max(profit, 0), min(profit, 0), profit)):
+                totals[i] += sign * value
+            for key in followed:
+                if key in rule_bits:
+                    followed[key] += sign * trade.followed(rule_bits[key])
+        return Stats(*totals, followed)
+
+
+class Rollup(namedtuple("Rollup", "period start trades wins profit drawdown")):
+    """P/L of one day, ISO week or month; start is the epoch second the period begins at."""
+
+    @property
+    def win_rate(self):
+        return (self.wins / self.trades * 100) if self.trades else 0
+
+    @property
+    def label(self):
+        return period_label(self.period, self.start)
+
+
+def year_range(year, period="day"):
+    # [start, end) epoch seconds within which the periods of a year begin: the calendar year,
+    # or for weeks the ISO year (from the Monday of the week holding 4 January)
+    if period == "week":
+        first, last = (datetime.date.fromisocalendar(y, 1, 1) for y in (year, year + 1))
+    else:
+        first, last = datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1)
+    return migrations.date_to_ts(first.isoformat()), migrations.date_to_ts(last.isoformat())
+
+
+def period_label(period, start):
+    day = datetime.date(1970, 1, 1) + datetime.timedelta(seconds=start)
+    if period == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    return day.strftime("%Y-%m" if period == "month" else "%Y-%m-%d")
+
+
+# -------------------------- SCHEMA --------------------------
+
+def load_rules(cursor):
+    # The rules table as (rules, rule_bits): the active rules as (key, label) in display order,
+    # and key -> bit of rules_mask for every rule the database knows (removed ones included)
+    cursor.execute("SELECT bit, key, label, active FROM rules ORDER BY position, bit")
+    rows = cursor.fetchall()
+    return [(key, label) for _, key, label, active in rows if active], {key: bit for bit, key, _, _ in rows}
+
+
+def rule_key(label):
+    # Column-safe key for a new rule's label
+    key = re.sub(r"[^a-z0-9]+", "_", label.lower()).strip("_")
+    return key if key and not key[0].isdigit() else "rule_" + key
+
+
+# How each written trade column is stored: date as ts + date_text, pair/strategy as lookup ids
+def _stored(column, param):
+    if column == "date":
+        return [("ts", f"trade_ts({param})"), ("date_text", f"trade_date_text({param})")]
+    if column == "pair":
+        return [("pair_id", f"(SELECT id FROM pairs WHERE name = COALESCE({param}, ''))")]
+    if column == "strategy":
+        return [("strategy_id", f"(SELECT id FROM strategies WHERE name = COALESCE({param}, ''))")]
+    return [(column, param)]
+
+
+def _stored_columns(columns, placeholder):
+    return [pair for column in columns for pair in _stored(column, placeholder(column))]
+
+
+def _insert_sql(columns, placeholder, verb="INSERT"):
+    stored = _stored_columns(columns, placeholder)
+    return (f"{verb} INTO trades ({', '.join(c for c, _ in stored)}) "
+            f"VALUES ({', '.join(v for _, v in stored)})")
+
+
+INSERT_TRADE_SQL = _insert_sql(TRADE_COLUMNS[1:], lambda c: ":" + c)
+IMPORT_TRADES_SQL = _insert_sql(IMPORT_COLUMNS, lambda c: f"?{IMPORT_COLUMNS.index(c) + 1}", "INSERT OR IGNORE")
+
+
+def add_symbols(cursor, pairs=(), strategies=()):
+    # Make sure the lookup tables have every pair and strategy name about to be written
+    for table, names in (("pairs", pairs), ("strategies", strategies)):
+        names = {name or "" for name in names}
+        if names:
+            cursor.executemany(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", [(name,) for name in names])
+
+
+# -------------------------- AGGREGATES --------------------------
+
+def compute_stats(cursor):
+    # Aggregates computed from scratch over the trades table
+    cursor.execute("""
+        SELECT
+            COUNT(*),
+            COALESCE(SUM(profit_percent > 0), 0),
+            COALESCE(SUM(profit_percent < 0), 0),
+            COALESCE(SUM(CASE WHEN profit_percent > 0 THEN profit_percent ELSE 0 END), 0),
+            COALESCE(SUM(CASE WHEN profit_percent < 0 THEN profit_percent ELSE 0 END), 0),
+            COALESCE(SUM(profit_percent), 0)
+        FROM trades
+    """)
+    totals = cursor.fetchone()
+    # One pass counts each distinct checklist; per-rule counts are bit tests over those few rows
+    cursor.execute("SELECT rules_mask, COUNT(*) FROM trades GROUP BY rules_mask")
+    masks = cursor.fetchall()
+    cursor.execute("SELECT bit, key FROM rules")
+    followed = {key: sum(n for mask, n in masks if mask >> bit & 1) for bit, key in cursor.fetchall()}
+    return Stats(*totals, followed)
+
+
+def read_stats(cursor):
+    # Stored aggregates, as maintained by the triggers
+    cursor.execute("SELECT total, wins, losses, win_sum, loss_sum, profit_sum FROM trade_stats WHERE id = 1")
+    totals = cursor.fetchone() or (0, 0, 0, 0.0, 0.0, 0.0)
+    cursor.execute("SELECT r.key, s.followed FROM rule_stats s JOIN rules r ON r.bit = s.bit")
+    return Stats(*totals, dict(cursor.fetchall()))
+
+
+def rebuild_stats(cursor):
+    stats = compute_stats(cursor)
+    cursor.execute("DELETE FROM trade_stats")
+    cursor.execute("""
+        INSERT INTO trade_stats (id, total, wins, losses, win_sum, loss_sum, profit_sum)
+        VALUES (1, ?, ?, ?, ?, ?, ?)
+    """, stats[:6])
+    cursor.execute("DELETE FROM rule_stats")
+    cursor.executemany("INSERT INTO rule_stats (bit, followed) SELECT bit, ? FROM rules WHERE key = ?",
+                       [(n, key) for key, n in stats.followed.items()])
+
+
+# -------------------------- PERIOD ROLLUPS --------------------------
+
+ROLLUP_COLUMNS = "period, start_ts, end_ts, trades, wins, profit, peak, drawdown, last_ts, last_id"
+
+
+def _rollup_sql(source):
+    # period_stats rows computed from source, which yields (period, start_ts, end_ts, ts, id, profit)
+    # for every trade in each period it belongs to. The drawdown is the deepest fall of the running
+    # P/L (from 0 at the start of the period) below its running peak.
+    return f"""
+        SELECT period, start_ts, end_ts, COUNT(*) AS trades, SUM(profit > 0) AS wins, SUM(profit) AS profit,
+               MAX(MAX(peak), 0) AS peak, MIN(MIN(cum - MAX(peak, 0)), 0) AS drawdown,
+               MAX(ts) AS last_ts, MAX(CASE WHEN rn = 1 THEN id END) AS last_id
+        FROM (
+            SELECT *, MAX(cum) OVER w AS peak,
+                   ROW_NUMBER() OVER (PARTITION BY period, start_ts ORDER BY ts DESC, id DESC) AS rn
+            FROM (
+                SELECT *, SUM(profit) OVER w AS cum FROM ({source})
+                WINDOW w AS (PARTITION BY period, start_ts ORDER BY ts, id)
+            )
+            WINDOW w AS (PARTITION BY period, start_ts ORDER BY ts, id)
+        )
+        GROUP BY period, start_ts
+    """
+
+
+# The trades of the periods whose drawdown the triggers left stale
+STALE_PERIODS_SQL = f"""
+    SELECT s.period, s.start_ts, s.end_ts, t.ts, t.id, COALESCE(t.profit_percent, 0) AS profit
+    FROM period_stats s JOIN trades t ON t.ts >= s.start_ts AND t.ts < s.end_ts
+    WHERE s.drawdown IS NULL AND t.ts != {migrations.MISSING_TS}
+"""
+
+
+def _day_bounds(day):
+    # [(period, start, end)] of the periods containing the day starting at epoch second day;
+    # the same bounds migrations.period_bounds computes in SQL
+    week = day - (day // 86400 + 3) % 7 * 86400
+    date = datetime.date(1970, 1, 1) + datetime.timedelta(days=day // 86400)
+    month = datetime.datetime(date.year, date.month, 1) - datetime.datetime(1970, 1, 1)
+    month_end = datetime.datetime(date.year + date.month // 12, date.month % 12 + 1, 1) - datetime.datetime(1970, 1, 1)
+    return [("day", day, day + 86400), ("week", week, week + 604800),
+            ("month", int(month.total_seconds()), int(month_end.total_seconds()))]
+
+
+def compute_rollups(cursor):
+    # Every period_stats row (ROLLUP_COLUMNS) from one pass over the trades in (ts, id) order, which
+    # idx_trades_ts yields without sorting. A period's trades are consecutive in that order, so
+    # each period needs one running row, emitted when the next period starts.
+    cursor.execute(f"SELECT ts, id, COALESCE(profit_percent, 0) FROM trades "
+                   f"WHERE ts != {migrations.MISSING_TS} ORDER BY ts, id")
+    rows, current, day, bounds = [], {}, None, ()
+    for ts, trade_id, profit in cursor:
+        if ts - ts % 86400 != day:
+            day = ts - ts % 86400
+            bounds = _day_bounds(day)
+        for period, start, end in bounds:
+            # [start, end, trades, wins, profit, peak, drawdown, last_ts, last_id]
+            acc = current.get(period)
+            if acc is None or acc[0] != start:
+                if acc is not None:
+                    rows.append((period, *acc))
+                acc = current[period] = [start, end, 0, 0, 0.0, 0.0, 0.0, ts, trade_id]
+            acc[2] += 1
+            acc[3] += profit > 0
+            acc[4] += profit
+            acc[5] = max(acc[5], acc[4])
+            acc[6] = min(acc[6], acc[4] - acc[5])
+            acc[7], acc[8] = ts, trade_id
+    rows.extend((period, *acc) for period, acc in current.items())
+    return rows
+
+
+def rebuild_rollups(cursor):
+    rows = compute_rollups(cursor)
+    cursor.execute("DELETE FROM period_stats")
+    cursor.executemany(f"INSERT INTO period_stats ({ROLLUP_COLUMNS}) VALUES ({', '.join('?' * 10)})", rows)
+
+
+def refresh_rollups(cursor):
+    # Recompute the periods an edit, a delete or a back-dated trade left stale; only their trades are read
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM period_stats WHERE drawdown IS NULL)")
+    if cursor.fetchone()[0]:
+        cursor.execute(f"INSERT OR REPLACE INTO period_stats ({ROLLUP_COLUMNS}) {_rollup_sql(STALE_PERIODS_SQL)}")
+
+
+def compare_rollups(cursor):
+    # Differences between the stored rollups and a full recompute, one line per period kind.
+    # Stale drawdowns are expected (they are filled in when read) and not reported.
+    cursor.execute("SELECT period, start_ts, trades, wins, profit, drawdown FROM period_stats")
+    stored = {(row[0], row[1]): row[2:] for row in cursor.fetchall()}
+    fresh = {(row[0], row[1]): (row[3], row[4], row[5], row[7]) for row in compute_rollups(cursor)}
+
+    def same(a, b):
+        if a is None or b is None:
+            return False
+        return (a[0], a[1]) == (b[0], b[1]) and all(
+            x is None or abs(x - y) <= 1e-6 * max(1.0, abs(y)) for x, y in zip(a[2:], b[2:]))
+
+    problems = []
+    for period in migrations.PERIODS:
+        wrong = sorted(key[1] for key in stored.keys() | fresh.keys()
+                       if key[0] == period and not same(stored.get(key), fresh.get(key)))
+        if wrong:
+            problems.append(f"{period} rollups: {len(wrong)} differ, first {period_label(period, wrong[0])}")
+    return problems
+
+
+def compare_stats(stored, fresh):
+    # Differences between stored and recomputed aggregates, as readable strings
+    problems = []
+    for name in ("total", "wins", "losses", "win_sum", "loss_sum", "profit_sum"):
+        a, b = getattr(stored, name), getattr(fresh, name)
+        # Sums drift by float rounding as deltas pile up; counts must match exactly
+        if abs(a - b) > 1e-6 * max(1.0, abs(b)):
+            problems.append(f"{name}: stored {a}, actual {b}")
+    for key, b in fresh.followed.items():
+        if stored.followed.get(key) != b:
+            problems.append(f"rule {key}: stored {stored.followed.get(key)}, actual {b}")
+    return problems
+
+
+# -------------------------- HISTORY QUERIES --------------------------
+
+# Columns read for each History row
+HISTORY_FIELDS = ("id", "date", "pair", "direction", "profit_percent", "strategy")
+
+# Treeview column -> trade_view columns the History list is ordered by (id always breaks ties).
+# Dates sort by ts; pair/strategy sort with their ts so the composite indexes serve the ORDER BY.
+HISTORY_SORT_KEYS = {
+    "id": (),
+    "date": ("ts",),
+    "pair": ("pair", "ts"),
+    "direction": ("direction",),
+    "profit": ("profit_percent",),
+    "winloss": ("profit_percent",),
+    "strategy": ("strategy", "ts"),
+    # Best match first (bm25 rank, lower is better); only while searching
+    "match": ("score",),
+}
+
+# The History filter of a search (see history_filter_clauses)
+SEARCH_CLAUSE = "id IN (SELECT rowid FROM trades_fts WHERE trades_fts MATCH ?)"
+
+# Markers put around the search terms found in a trade's text (HistoryPager.matches)
+MATCH_START, MATCH_END = "\u00ab", "\u00bb"
+
+# Text columns compared case-insensitively (their indexes use COLLATE NOCASE)
+NOCASE_COLUMNS = ("pair", "strategy")
+
+# NOCASE folds ASCII letters only
+NOCASE_FOLD = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def column_expr(column):
+    return f"{column} COLLATE NOCASE" if column in NOCASE_COLUMNS else column
+
+
+def _timestamp(value, convert):
+    ts = convert(value)
+    if ts is None:
+        raise ValueError(f"Not a date: {value}")
+    return ts
+
+
+def search_query(text):
+    # FTS5 query for search box text: every word must appear, the last ones typed as a prefix.
+    # Words are quoted, so operators and punctuation in the text are never query syntax.
+    words = re.findall(r"\w+", text or "")
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def _fold(word):
+    # Case and accents dropped, as the unicode61 tokenizer (remove_diacritics 2) compares words
+    decomposed = unicodedata.normalize("NFKD", word.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def match_spans(text, search):
+    # (start, end) of every word of text a search for search matches: words starting with one of
+    # its words, ignoring case and accents
+    words = [_fold(word) for word in re.findall(r"\w+", search or "")]
+    return [m.span() for m in re.finditer(r"\w+", text or "") if any(_fold(m.group()).startswith(w) for w in words)]
+
+
+def mark_matches(text, search, context=8):
+    # text with the words matching search wrapped in MATCH_START/MATCH_END, cut to context words
+    # either side of the first one; "" if nothing matches
+    spans = match_spans(text, search)
+    if not spans:
+        return ""
+    tokens = [m.span() for m in re.finditer(r"\w+", text)]
+    first = tokens.index(spans[0])
+    start, end = tokens[max(0, first - context)][0], tokens[min(len(tokens) - 1, first + context)][1]
+    parts, pos = [], start
+    for span_start, span_end in spans:
+        if span_end > end:
+            break
+        parts += [text[pos:span_start], MATCH_START, text[span_start:span_end], MATCH_END]
+        pos = span_end
+    parts.append(text[pos:end])
+    return ("\u2026" if start > 0 else "") + "".join(parts) + ("\u2026" if end < len(text) else "")
+
+
+def history_filter_clauses(outcome="All", strategy="", pair="", direction="", date_from="", date_to="", search=""):
+    # Build parameterized WHERE clauses for the History filters; each one is served by an index.
+    # They name trades columns only, so they apply to the trades table and to trade_view alike.
+    where, params = [], []
+    query = search_query(search)
+    if query:
+        # Ids straight from the full-text index; trades is only read for the matching rows.
+        # Kept first: the "match" sort replaces it with a join (HistoryPager._filters).
+        where.append(SEARCH_CLAUSE)
+        params.append(query)
+    if outcome == "Winning":
+        where.append("profit_percent > 0")
+    elif outcome == "Losing":
+        where.append("profit_percent < 0")
+    if strategy:
+        # Case-insensitive prefix match over the strategy names, then idx_trades_strategy per match
+        escaped = strategy.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        where.append("strategy_id IN (SELECT id FROM strategies WHERE name LIKE ? ESCAPE '\\')")
+        params.append(escaped + "%")
+    if pair:
+        # The pairs name column is NOCASE, so this is the case-insensitive match
+        where.append("pair_id = (SELECT id FROM pairs WHERE name = ?)")
+        params.append(pair)
+    if direction:
+        where.append("direction = ?")
+        params.append(direction)
+    if date_from:
+        where.append("ts >= ?")
+        params.append(_timestamp(date_from, migrations.date_to_ts))
+    if date_to:
+        # A date without a time covers the whole day
+        where.append("ts < ?")
+        params.append(_timestamp(date_to, migrations.date_range_end))
+    return where, params
+
+
+class HistoryPager:
+    """Keyset-paginated reader over the filtered and ordered trades.
+
+    Rows are the HISTORY_FIELDS values followed by any sort column not among them (ts, score),
+    which the keyset needs to continue from a row. search is the search box text; the filters
+    (history_filter_clauses) do the matching, it only serves the "match" sort and matches().
+    """
+
+    def __init__(self, repo, where=(), params=(), sort="date", descending=False, search=""):
+        self.repo = repo
+        self.where = list(where)
+        self.params = list(params)
+        self.sort = sort
+        self.columns = HISTORY_SORT_KEYS[sort] + ("id",)
+        self.fields = HISTORY_FIELDS + tuple(c for c in self.columns if c not in HISTORY_FIELDS)
+        self.descending = descending
+        self.search = search
+        self.query = search_query(search)
+        if sort == "match" and not self.query:
+            raise ValueError("Sorting by match needs a search")
+
+    def with_sort(self, sort, descending):
+        return HistoryPager(self.repo, self.where, self.params, sort, descending, self.search)
+
+    def key(self, row):
+        # Position of a row in the ordering: its sort column values followed by id
+        return tuple(row[self.fields.index(c)] for c in self.columns)
+
+    def sort_key(self, row):
+        # key() made comparable in Python the way SQLite orders it: NULLs first, pair and
+        # strategy names with NOCASE. Ascending; a descending list runs the other way.
+        return tuple((value is not None, value.translate(NOCASE_FOLD) if c in NOCASE_COLUMNS and value else value)
+                     for c, value in zip(self.columns, self.key(row)))
+
+    def _filters(self, rows=True):
+        # (clauses, params) of the filters. The "match" sort's row queries join the index hits, so
+        # they drop the search clause rather than run the full-text query twice.
+        if rows and self.sort == "match" and self.where[:1] == [SEARCH_CLAUSE]:
+            return self.where[1:], [self.query] + self.params[1:]
+        return self.where, ([self.query] if rows and self.sort == "match" else []) + self.params
+
+    def _where(self, extra=(), rows=True):
+        clauses = self._filters(rows)[0] + list(extra)
+        return ("WHERE " + " AND ".join(clauses)) if clauses else ""
+
+    def _order(self, reverse=False):
+        direction = "DESC" if self.descending != reverse else "ASC"
+        return "ORDER BY " + ", ".join(f"{column_expr(c)} {direction}" for c in self.columns)
+
+    def _sql(self, extra=(), reverse=False, count=False, limit="LIMIT ?"):
+        if count:
+            # The filters name trades columns only; a bound on a pair/strategy name needs the view
+            table = "trade_view" if extra and self.columns[0] in NOCASE_COLUMNS else "trades"
+            return f"SELECT COUNT(*) FROM {table} {self._where(extra, rows=False)}"
+        fields, order = ", ".join(self.fields), self._order(reverse)
+        if self.sort == "match":
+            # rank exists only inside a MATCH query; its parameter comes before the filters'
+            hits = "SELECT rowid AS hit, rank AS score FROM trades_fts WHERE trades_fts MATCH ?"
+            return f"SELECT {fields} FROM trade_view JOIN ({hits}) ON hit = id {self._where(extra)} {order} {limit}"
+        if self.columns[0] in NOCASE_COLUMNS:
+            # Always true, but a range on the lookup name makes SQLite walk the pairs/strategies
+            # index in name order and the trades index per name, instead of sorting every trade
+            extra = [f"{column_expr(self.columns[0])} >= ''"] + list(extra)
+            return f"SELECT {fields} FROM trade_view {self._where(extra)} {order} {limit}"
+        # Sort and skip over the trades table alone, then read just the page through the view,
+        # so skipped and sorted rows never pay for the joins and the date formatting
+        return (f"SELECT {fields} FROM trade_view WHERE id IN "
+                f"(SELECT id FROM trades {self._where(extra)} {order} {limit}) {order}")
+
+    def _params(self):
+        # Parameters of the row queries before any keyset and limit ones
+        return self._filters()[1]
+
+    def count(self):
+        return self.repo.select(self._sql(count=True), self.params)[0][0]
+
+    def page_at(self, offset, limit):
+        # Random access for scrollbar jumps; scrolling uses page_after/page_before
+        return self.repo.select(self._sql(limit="LIMIT ? OFFSET ?"), self._params() + [limit, offset])
+
+    def page_after(self, key, limit):
+        return self._page_from(key, "<" if self.descending else ">", limit, reverse=False)
+
+    def page_before(self, key, limit):
+        return self._page_from(key, ">" if self.descending else "<", limit, reverse=True)[::-1]
+
+    def _keyset(self, key, op):
+        exprs = [column_expr(c) for c in self.columns]
+        if len(exprs) == 1:
+            return [f"{exprs[0]} {op} ?"], [key[0]]
+        # The leading bound lets SQLite turn the row-value comparison into an index range
+        return ([f"{exprs[0]} {op}= ?", f"({', '.join(exprs)}) {op} ({', '.join('?' * len(exprs))})"],
+                [key[0]] + list(key))
+
+    def _page_from(self, key, op, limit, reverse):
+        extra, key_params = self._keyset(key, op)
+        return self.repo.select(self._sql(extra, reverse), self._params() + key_params + [limit])
+
+    def rows_of(self, ids):
+        # The rows of the given trades that pass the filters, in order (to patch a loaded window)
+        if not ids:
+            return []
+        extra = [f"id IN ({', '.join('?' * len(ids))})"]
+        return self.repo.select(self._sql(extra, limit=""), self._params() + list(ids))
+
+    def matches(self, ids):
+        # {id: fragment of the trade's text with the search terms marked} for the given rows; empty
+        # when not searching. Marked here rather than with snippet(): every FTS5 query pays for
+        # loading the prefix terms' whole doclists, so a per-page snippet query costs as much as
+        # the search itself, while these are a handful of primary-key reads.
+        if not self.query or not ids:
+            return {}
+        rows = self.repo.select(f"SELECT id, notes, strategy, pair FROM trade_view "
+                                f"WHERE id IN ({', '.join('?' * len(ids))})", list(ids))
+        return {row[0]: next(filter(None, (mark_matches(text, self.search) for text in row[1:])), "")
+                for row in rows}
+
+    def iter_rows(self, chunk_size=1000):
+        # Every row in order, read page by page by keyset so memory stays at one page
+        rows = self.page_at(0, chunk_size)
+        while rows:
+            yield from rows
+            if len(rows) < chunk_size:
+                return
+            rows = self.page_after(self.key(rows[-1]), chunk_size)
+
+    def position_of(self, value):
+        # Number of rows ordered before the first row whose leading sort value is >= value (<= when descending).
+        # Dates are given as text.
+        if self.columns[0] == "ts":
+            value = _timestamp(value, migrations.date_to_ts)
+        op = ">" if self.descending else "<"
+        sql = self._sql([f"{column_expr(self.columns[0])} {op} ?"], count=True)
+        return self.repo.select(sql, self.params + [value])[0][0]
+
+    def query_plan(self):
+        # EXPLAIN QUERY PLAN for the count, jump and scroll queries of the current filters
+        plans = {}
+        key = [None] * len(self.columns)
+        extra, key_params = self._keyset(key, ">")
+        for name, sql, params in (
+            ("count", self._sql(count=True), self.params),
+            ("page", self._sql(limit="LIMIT ? OFFSET ?"), self._params() + [1, 0]),
+            ("scroll", self._sql(extra), self._params() + key_params + [1]),
+        ):
+            plans[name] = [r[3] for r in self.repo.select("EXPLAIN QUERY PLAN " + sql, params)]
+        return plans
+
+
+# -------------------------- REPOSITORY --------------------------
+
+class TradeRepository:
+    """Typed queries and mutations over one journal database, with one connection per thread."""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        # Every committed insert, update and delete of a single trade (bulk imports aren't published)
+        self.events = EventBus()
+        # Checklist rules of this journal, as load_rules returns them. Defaults until init_schema
+        # reads the rules table; edit them there (add_rule/rename_rule/remove_rule, or
+        # python -m cli rules), no schema change needed. Each journal has its own.
+        self.rules = list(migrations.DEFAULT_RULES)
+        self.rule_bits = {key: bit for bit, (key, _) in enumerate(migrations.DEFAULT_RULES)}
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Each thread keeps its own connection; check_same_thread is off only so close() can reap them.
+            # Constant SQL text hits the per-connection prepared statement cache on every call.
+            # ProfiledConnection is a plain connection unless perf instrumentation is switched on.
+            conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256,
+                                   factory=perf.ProfiledConnection)
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            migrations.register_functions(conn)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                try:
+                    for statement in OPTIMIZE:
+                        conn.execute(statement)
+                except sqlite3.OperationalError:
+                    # Locked by another process, or never initialized; statistics can wait
+                    pass
+                conn.close()
+            except sqlite3.ProgrammingError:
+                pass
+        self._local = threading.local()
+
+    def init_schema(self):
+        # Migrate to the current schema (one transaction), then load the rules and seed the aggregates
+        conn = self.conn
+        migrations.migrate(conn)
+        with conn:
+            cursor = conn.cursor()
+            self.rules, self.rule_bits = load_rules(cursor)
+            cursor.execute("SELECT (SELECT COUNT(*) FROM trade_stats), (SELECT COUNT(*) FROM rule_stats), "
+                           "(SELECT COUNT(*) FROM rules)")
+            totals, counted, rules = cursor.fetchone()
+            if totals != 1 or counted != rules:
+                rebuild_stats(cursor)
+            cursor.execute("SELECT NOT EXISTS (SELECT 1 FROM period_stats) "
+                           "AND EXISTS (SELECT 1 FROM trades WHERE ts > ?)", (migrations.MISSING_TS,))
+            if cursor.fetchone()[0]:
+                rebuild_rollups(cursor)
+
+    def select(self, sql, params=()):
+        return self.conn.execute(sql, params).fetchall()
+
+    # Reads
+
+    def get_trade(self, trade_id):
+        row = self.conn.execute(f"SELECT {', '.join(TRADE_COLUMNS)} FROM trade_view WHERE id = ?", (trade_id,)).fetchone()
+        return Trade(*row) if row else None
+
+    def iter_export_chunks(self, where=(), params=(), chunk_size=1000, typed=False):
+        # Lists of at most chunk_size export_columns(self.rules) tuples in id order, matching the
+        # given filter clauses; only one chunk is held in memory at a time. The checklist is split
+        # into one 0/1 column per rule in SQL. typed reads the date as epoch seconds (None
+        # for undated trades) instead of text.
+        clause = ("WHERE " + " AND ".join(where)) if where else ""
+        bits = self.rule_bits
+        exprs = [f"(rules_mask >> {bits[c]}) & 1" if c in bits else c for c in export_columns(self.rules)]
+        if typed:
+            exprs[exprs.index("date")] = f"NULLIF(ts, {migrations.MISSING_TS})"
+        cursor = self.conn.execute(f"SELECT {', '.join(exprs)} FROM trade_view {clause} ORDER BY id", list(params))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+    def count_trades(self, where=(), params=()):
+        clause = ("WHERE " + " AND ".join(where)) if where else ""
+        return self.select(f"SELECT COUNT(*) FROM trades {clause}", list(params))[0][0]
+
+    def stats(self):
+        return read_stats(self.conn.cursor())
+
+    def check_stats(self, rebuild=False):
+        # Compare the stored aggregates with a full recompute; returns a list of mismatch descriptions
+        with self.conn as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN")
+            problems = compare_stats(read_stats(cursor), compute_stats(cursor)) + compare_rollups(cursor)
+            if problems and rebuild:
+                rebuild_stats(cursor)
+                rebuild_rollups(cursor)
+        return problems
+
+    def rollups(self, period, start=None, end=None):
+        # Rollups of one kind of period ("day", "week" or "month") beginning in [start, end), oldest first
+        if period not in migrations.PERIODS:
+            raise ValueError(f"Unknown period: {period}")
+        with self.conn as conn:
+            cursor = conn.cursor()
+            refresh_rollups(cursor)
+            cursor.execute(
+                "SELECT period, start_ts, trades, wins, profit, drawdown FROM period_stats "
+                "WHERE period = ? AND start_ts >= ? AND start_ts < ? ORDER BY start_ts",
+                (period, -(1 << 63) if start is None else start, (1 << 63) - 1 if end is None else end),
+            )
+            return [Rollup(*row) for row in cursor.fetchall()]
+
+    def rollup_years(self):
+        # Calendar years that have dated trades
+        return [row[0] for row in self.select(
+            "SELECT DISTINCT CAST(strftime('%Y', start_ts, 'unixepoch') AS INTEGER) FROM period_stats "
+            "WHERE period = 'month' ORDER BY 1")]
+
+    def rebuild_rollups(self):
+        with self.conn as conn:
+            rebuild_rollups(conn.cursor())
+
+    def equity_series(self):
+        # (ts, profit, id) for every trade in date order
+        return self.select("SELECT ts, COALESCE(profit_percent, 0), id FROM trades ORDER BY ts, id")
+
+    def change_counter(self):
+        # Bumped by a trigger on every trade insert, update and delete; only ever grows
+        return self.select("SELECT changes FROM journal_changes WHERE id = 1")[0][0]
+
+    def image_paths(self):
+        # Every screenshot and thumbnail path some trade refers to
+        paths = set()
+        for row in self.conn.execute("SELECT pre_image_path, post_image_path, pre_thumb_path, post_thumb_path FROM trades"):
+            paths.update(p for p in row if p)
+        return paths
+
+    def symbols(self, table):
+        # {id: name} of the "pairs" or "strategies" lookup table
+        if table not in ("pairs", "strategies"):
+            raise ValueError(f"Unknown lookup table: {table}")
+        return dict(self.select(f"SELECT id, name FROM {table}"))
+
+    def iter_analytics_chunks(self, where=(), params=(), chunk_size=50000):
+        # (ts, profit, strategy_id, pair_id, rules_mask) tuples in date order, for analytics.py
+        clause = ("WHERE " + " AND ".join(where)) if where else ""
+        cursor = self.conn.execute(
+            f"SELECT ts, COALESCE(profit_percent, 0), strategy_id, pair_id, rules_mask "
+            f"FROM trades {clause} ORDER BY ts, id",
+            list(params),
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+    def history(self, where=(), params=(), sort="date", descending=False, search=""):
+        return HistoryPager(self, where, params, sort, descending, search)
+
+    def rule_mask(self, keys):
+        # rules_mask with the given rules followed
+        mask = 0
+        for key in keys:
+            mask |= 1 << self.rule_bits[key]
+        return mask
+
+    # Mutations
+
+    def insert_trade(self, **fields):
+        values = dict(TRADE_DEFAULTS, **fields)
+        with self.conn as conn:
+            add_symbols(conn.cursor(), [values["pair"]], [values["strategy"]])
+            cursor = conn.execute(INSERT_TRADE_SQL, values)
+            trade = self.get_trade(cursor.lastrowid) if self.events.active else None
+        if trade is not None:
+            self.events.publish(TradeEvent(INSERTED, trade.id, trade, None))
+        return cursor.lastrowid
+
+    def update_trade(self, trade_id, **fields):
+        unknown = set(fields) - set(TRADE_COLUMNS[1:])
+        if unknown:
+            raise ValueError(f"Unknown trade fields: {', '.join(sorted(unknown))}")
+        if not fields:
+            return
+        assignments = ", ".join(f"{c} = {v}" for c, v in _stored_columns(sorted(fields), lambda c: ":" + c))
+        publish = self.events.active
+        with self.conn as conn:
+            if publish:
+                # Read inside the transaction, so old is exactly the row the change replaces
+                conn.execute("BEGIN")
+            old = self.get_trade(trade_id) if publish else None
+            add_symbols(conn.cursor(), [fields["pair"]] if "pair" in fields else (),
+                        [fields["strategy"]] if "strategy" in fields else ())
+            conn.execute(f"UPDATE trades SET {assignments} WHERE id = :id", dict(fields, id=trade_id))
+            trade = self.get_trade(trade_id) if old else None
+        if old is not None:
+            self.events.publish(TradeEvent(UPDATED, trade_id, trade, old))
+
+    def insert_trades(self, batches, progress=None):
+        # Bulk insert: each batch is a list of IMPORT_COLUMNS tuples, all in one transaction.
+        # Rows whose import_key already exists are skipped. Returns (inserted, skipped).
+        pair, strategy = IMPORT_COLUMNS.index("pair"), IMPORT_COLUMNS.index("strategy")
+        inserted = skipped = 0
+        with self.conn as conn:
+            for batch in batches:
+                add_symbols(conn.cursor(), {row[pair] for row in batch}, {row[strategy] for row in batch})
+                cursor = conn.executemany(IMPORT_TRADES_SQL, batch)
+                inserted += cursor.rowcount
+                skipped += len(batch) - cursor.rowcount
+                if progress:
+                    progress(inserted, skipped)
+        return inserted, skipped
+
+    def delete_trade(self, trade_id):
+        publish = self.events.active
+        with self.conn as conn:
+            if publish:
+                conn.execute("BEGIN")
+            old = self.get_trade(trade_id) if publish else None
+            conn.execute("DELETE FROM trades WHERE id = ?", (trade_id,))
+        if old is not None:
+            self.events.publish(TradeEvent(DELETED, trade_id, None, old))
+
+    # Checklist rules
+
+    def add_rule(self, label, key=None):
+        # New rule on the next unused bit (every trade starts with it unchecked); adding a key that
+        # was removed brings it back with its old checkmarks. Returns the key.
+        key = key or rule_key(label)
+        if key in TRADE_COLUMNS or key in IMPORT_COLUMNS:
+            raise ValueError(f"Rule key {key} is a trade column")
+        with self.conn as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT active FROM rules WHERE key = ?", (key,))
+            row = cursor.fetchone()
+            if row and row[0]:
+                raise ValueError(f"Rule {key} already exists")
+            cursor.execute("SELECT COALESCE(MAX(bit) + 1, 0), COALESCE(MAX(position) + 1, 0) FROM rules")
+            bit, position = cursor.fetchone()
+            if row:
+                cursor.execute("UPDATE rules SET active = 1, label = ?, position = ? WHERE key = ?", (label, position, key))
+            elif bit >= migrations.MAX_RULE_BITS:
+                raise ValueError(f"A journal can have at most {migrations.MAX_RULE_BITS} rules")
+            else:
+                cursor.execute("INSERT INTO rules (bit, key, label, position) VALUES (?, ?, ?, ?)", (bit, key, label, position))
+                cursor.execute("INSERT INTO rule_stats (bit, followed) VALUES (?, 0)", (bit,))
+            self.rules, self.rule_bits = load_rules(cursor)
+        return key
+
+    def rename_rule(self, key, label):
+        with self.conn as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE rules SET label = ? WHERE key = ? AND active", (label, key))
+            if not cursor.rowcount:
+                raise ValueError(f"No rule {key}")
+            self.rules, self.rule_bits = load_rules(cursor)
+
+    def remove_rule(self, key):
+        # Hides the rule; its bit stays reserved so the trades' checkmarks survive a later add_rule
+        with self.conn as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE rules SET active = 0 WHERE key = ? AND active", (key,))
+            if not cursor.rowcount:
+                raise ValueError(f"No rule {key}")
+            self.rules, self.rule_bits = load_rules(cursor)
+
+    # Maintenance
+
+    def vacuum(self):
+        # Merge the full-text index into one segment, rebuild the file without free pages, fold the
+        # WAL back into it and refresh planner statistics
+        conn = self.conn
+        with conn:
+            conn.execute("INSERT INTO trades_fts (trades_fts) VALUES ('optimize')")
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        for statement in OPTIMIZE:
+            conn.execute(statement)
+
+    def query_plan(self, sql, params=()):
+        # EXPLAIN QUERY PLAN steps of a statement, for the perf diagnostics; a plain cursor keeps
+        # the EXPLAIN itself out of the statement profile
+        cursor = self.conn.cursor(sqlite3.Cursor)
+        return [row[3] for row in cursor.execute("EXPLAIN QUERY PLAN " + sql, params)]
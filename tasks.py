@@ -0,0 +1,134 @@
+# tasks.py
+# Background task scheduler for the GUI: database and image I/O run on a thread pool and
+# their results are handed back to the Tk thread through a queue that after() drains.
+
+import queue
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import perf
+
+# How often the Tk thread checks for finished tasks, and how long one check may run
+POLL_INTERVAL_MS = 10
+POLL_BUDGET = 0.008
+
+
+class TaskScheduler:
+    """Runs callables off the Tk thread and calls on_done/on_error back on it.
+
+    Tasks submitted with a view name supersede earlier tasks of the same view: the older
+    ones are cancelled if they haven't started and their results are dropped if they have,
+    so a stale query can never overwrite a newer one.
+
+    With perf instrumentation on, each task is timed under its name (the function name unless
+    name= is given): "<name>" from submit until the result reaches the Tk thread (queueing
+    included), "<name>.worker" for the thread-pool part and "<name>.ui" for on_done.
+    """
+
+    def __init__(self, root, max_workers=4, on_error=None):
+        self.root = root
+        self.on_error = on_error
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="journal-io")
+        self.results = queue.SimpleQueue()
+        self.generations = {}
+        self.pending = {}
+        # Every submitted future until its result has been handled on the Tk thread
+        self.running = set()
+        self.closed = False
+        self.root.after(POLL_INTERVAL_MS, self._poll)
+
+    def submit(self, fn, *args, on_done=None, on_error=None, view=None, name=None, **kwargs):
+        token = None
+        if view is not None:
+            self.cancel(view)
+            token = self.generations[view]
+        if perf.enabled:
+            name = name or getattr(fn, "__name__", "task")
+            fn = perf.timed(name + ".worker")(fn)
+            on_done = self._timed_done(name, on_done)
+        future = self.executor.submit(fn, *args, **kwargs)
+        if view is not None:
+            self.pending[view] = future
+        self.running.add(future)
+        future.add_done_callback(lambda f: self.results.put((self._finish, (f, view, token, on_done, on_error))))
+        return future
+
+    @staticmethod
+    def _timed_done(name, on_done):
+        submitted = time.perf_counter()
+
+        def done(result):
+            perf.record(name, (time.perf_counter() - submitted) * 1000)
+            if on_done:
+                with perf.span(name + ".ui"):
+                    on_done(result)
+        return done
+
+    def cancel(self, view):
+        # Invalidate everything submitted for the view so far
+        self.generations[view] = self.generations.get(view, 0) + 1
+        future = self.pending.pop(view, None)
+        if future is not None:
+            future.cancel()
+
+    def cancel_all(self):
+        # Invalidate every view, e.g. when the app switches to another journal
+        for view in list(self.generations):
+            self.cancel(view)
+
+    def is_pending(self, view):
+        return view in self.pending
+
+    def after_running(self, fn, *args, name=None):
+        # Run fn(*args) on the pool once every task submitted so far has finished, e.g. to close a
+        # repository those tasks may still be using. Tasks are started in order, so the ones
+        # waited for are running or done by the time this one starts and can't be starved by it.
+        return self.submit(_after, list(self.running), fn, args, name=name or getattr(fn, "__name__", "task"))
+
+    def post(self, fn, *args):
+        # Thread-safe: run fn(*args) on the Tk thread at the next poll (e.g. progress updates)
+        self.results.put((fn, args))
+
+    def shutdown(self):
+        self.closed = True
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def _poll(self):
+        # Drain finished work for at most POLL_BUDGET seconds so a burst can't stall the event loop
+        deadline = time.perf_counter() + POLL_BUDGET
+        while time.perf_counter() < deadline:
+            try:
+                fn, args = self.results.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                fn(*args)
+            except Exception:
+                # Report like any Tk callback error, but keep polling
+                self.root.report_callback_exception(*sys.exc_info())
+        if not self.closed:
+            self.root.after(POLL_INTERVAL_MS, self._poll)
+
+    def _finish(self, future, view, token, on_done, on_error):
+        self.running.discard(future)
+        if view is not None:
+            if self.generations.get(view) != token:
+                return
+            if self.pending.get(view) is future:
+                del self.pending[view]
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            handler = on_error or self.on_error
+            if handler:
+                handler(error)
+            return
+        if on_done:
+            on_done(future.result())
+
+
+def _after(futures, fn, args):
+    wait(futures)
+    return fn(*args)
@@ -0,0 +1,76 @@
+# tests/test_exporter.py
+# The TJC columnar format: what write_tjc writes, read_tjc reads back, byte for byte as documented.
+
+import json
+import math
+import struct
+
+import migrations
+from exporter import TJC_MAGIC, TJC_NULL_TIMESTAMP, column_types, export_columnar, read_tjc, write_tjc
+from repository import TradeRepository
+
+COLUMNS = (("id", "int64"), ("date", "timestamp"), ("pair", "utf8"), ("profit_percent", "float64"),
+           ("rr_ok", "int8"))
+
+CHUNKS = [
+    [(1, 1704153600, "EURUSD", 1.5, 1), (2, None, "€/¥ cross", None, 0)],
+    [(3, -86400, None, -0.25, 1)],
+    [(4, (1 << 62), "日本語 notes", 0.0, 0)],
+]
+
+
+def test_tjc_round_trip(tmp_path):
+    path = str(tmp_path / "trades.tjc")
+    assert write_tjc(path, CHUNKS, COLUMNS) == 4
+    data = read_tjc(path)
+
+    assert list(data) == [name for name, _ in COLUMNS]
+    assert data["id"].typecode == "q" and list(data["id"]) == [1, 2, 3, 4]
+    # Undated trades come back as the null timestamp, dates before 1970 stay negative
+    assert list(data["date"]) == [1704153600, TJC_NULL_TIMESTAMP, -86400, 1 << 62]
+    assert data["pair"] == ["EURUSD", "€/¥ cross", "", "日本語 notes"]
+    profits = list(data["profit_percent"])
+    assert profits[0] == 1.5 and math.isnan(profits[1]) and profits[2:] == [-0.25, 0.0]
+    assert data["rr_ok"].typecode == "b" and list(data["rr_ok"]) == [1, 0, 1, 0]
+
+
+def test_tjc_layout_is_fixed_size_little_endian(tmp_path):
+    path = str(tmp_path / "trades.tjc")
+    write_tjc(path, CHUNKS[:1], COLUMNS)
+    with open(path, "rb") as f:
+        data = f.read()
+
+    assert data[:4] == TJC_MAGIC
+    (size,) = struct.unpack_from("<I", data, 4)
+    assert json.loads(data[8:8 + size]) == {"columns": [list(c) for c in COLUMNS]}
+    pos = 8 + size
+    strings = ["EURUSD", "€/¥ cross"]
+    blob = "".join(strings).encode("utf-8")
+    expected = (
+        struct.pack("<I", 2)
+        + struct.pack("<2q", 1, 2)
+        + struct.pack("<2q", 1704153600, -(1 << 63))
+        + struct.pack("<3I", 0, 6, len(blob)) + blob
+        + struct.pack("<2d", 1.5, float("nan"))
+        + struct.pack("<2b", 1, 0)
+        + struct.pack("<I", 0)
+    )
+    assert data[pos:] == expected
+
+
+def test_export_columnar_writes_typed_dates(tmp_path):
+    repo = TradeRepository(str(tmp_path / "journal.db"))
+    try:
+        repo.init_schema()
+        repo.insert_trade(date="2024-01-02 09:30", pair="EURUSD", profit_percent=1.0)
+        repo.insert_trade(date="", pair="GBPUSD", profit_percent=-1.0, notes="no date")
+        path = str(tmp_path / "trades.tjc")
+        assert export_columnar(repo, path) == 2
+        data = read_tjc(path)
+    finally:
+        repo.close()
+
+    assert [kind for _, kind in column_types(repo.rules)].count("timestamp") == 1
+    assert list(data["date"]) == [migrations.date_to_ts("2024-01-02 09:30"), TJC_NULL_TIMESTAMP]
+    assert data["pair"] == ["EURUSD", "GBPUSD"]
+    assert data["notes"] == ["", "no date"]
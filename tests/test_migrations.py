@@ -0,0 +1,220 @@
+# tests/test_migrations.py
+# In-place migrations from older journal files, and the triggers that keep the aggregates, period
+# rollups and full-text index in step with trades: each must match a full recompute.
+
+import sqlite3
+
+import pytest
+
+import migrations
+from repository import TradeRepository, history_filter_clauses
+
+RULE_COLUMNS = [key for key, _ in migrations.DEFAULT_RULES]
+
+# (date, pair, direction, quantity, strategy, rules followed, profit %, notes)
+TRADES = [
+    ("2024-01-02", "EURUSD", "Buy", 1.0, "Breakout", ("waited_4h", "rr_ok"), 1.5, "clean breakout"),
+    ("2024-01-02 14:30", "eurusd", "Sell", 0.5, "breakout", (), -0.8, "news spike"),
+    ("2024-02-10", "XAUUSD", "Buy", 2.0, "Pullback", tuple(RULE_COLUMNS), 0.0, ""),
+    ("not a date", "GBPUSD", "Sell", 1.0, "", ("emotional",), -2.25, None),
+    ("2024-03-31 23:59:59", "GBPUSD", "Buy", 1.0, "Range", ("followed_plan",), 3.0, "month end"),
+]
+
+# The trades table as the first release created it, with no version, aggregates or indexes
+BASELINE_SCHEMA = """
+    CREATE TABLE trades (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT, pair TEXT, direction TEXT, quantity REAL, strategy TEXT,
+        waited_4h INTEGER, trend_followed INTEGER, rr_ok INTEGER, emotional INTEGER, followed_plan INTEGER,
+        profit_percent REAL, notes TEXT, pre_image_path TEXT, post_image_path TEXT
+    )
+"""
+
+
+def _pre_typed_schema():
+    # The text schema as it stood right before the typed one: import keys, thumbnails, and
+    # trigger-maintained aggregates with rule counts keyed by rule name
+    def delta(row, sign):
+        profit = f"COALESCE({row}.profit_percent, 0)"
+        cases = " ".join(f"WHEN '{key}' THEN COALESCE({row}.{key}, 0)" for key in RULE_COLUMNS)
+        return f"""
+            UPDATE trade_stats SET
+                total = total {sign} 1,
+                wins = wins {sign} ({profit} > 0),
+                losses = losses {sign} ({profit} < 0),
+                win_sum = win_sum {sign} (CASE WHEN {profit} > 0 THEN {profit} ELSE 0 END),
+                loss_sum = loss_sum {sign} (CASE WHEN {profit} < 0 THEN {profit} ELSE 0 END),
+                profit_sum = profit_sum {sign} {profit}
+            WHERE id = 1;
+            UPDATE rule_stats SET followed = followed {sign} (CASE rule {cases} ELSE 0 END);
+        """
+
+    return BASELINE_SCHEMA + f""";
+        ALTER TABLE trades ADD COLUMN import_key TEXT;
+        ALTER TABLE trades ADD COLUMN pre_thumb_path TEXT;
+        ALTER TABLE trades ADD COLUMN post_thumb_path TEXT;
+        CREATE INDEX idx_trades_date ON trades (date);
+        CREATE INDEX idx_trades_strategy ON trades (strategy COLLATE NOCASE, date);
+        CREATE INDEX idx_trades_pair ON trades (pair COLLATE NOCASE, date);
+        CREATE INDEX idx_trades_profit ON trades (profit_percent);
+        CREATE UNIQUE INDEX idx_trades_import_key ON trades (import_key) WHERE import_key IS NOT NULL;
+        CREATE TABLE trade_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total INTEGER NOT NULL DEFAULT 0, wins INTEGER NOT NULL DEFAULT 0, losses INTEGER NOT NULL DEFAULT 0,
+            win_sum REAL NOT NULL DEFAULT 0, loss_sum REAL NOT NULL DEFAULT 0, profit_sum REAL NOT NULL DEFAULT 0
+        );
+        INSERT INTO trade_stats (id) VALUES (1);
+        CREATE TABLE rule_stats (rule TEXT PRIMARY KEY, followed INTEGER NOT NULL DEFAULT 0);
+        INSERT INTO rule_stats (rule) VALUES {', '.join(f"('{key}')" for key in RULE_COLUMNS)};
+        CREATE TRIGGER trades_stats_insert AFTER INSERT ON trades BEGIN {delta('NEW', '+')} END;
+        CREATE TRIGGER trades_stats_delete AFTER DELETE ON trades BEGIN {delta('OLD', '-')} END;
+        CREATE TRIGGER trades_stats_update AFTER UPDATE ON trades BEGIN {delta('OLD', '-')} {delta('NEW', '+')} END;
+    """
+
+
+def _old_journal(path, schema, extra_columns=()):
+    conn = sqlite3.connect(path)
+    conn.executescript(schema)
+    columns = ["date", "pair", "direction", "quantity", "strategy"] + RULE_COLUMNS + ["profit_percent", "notes"]
+    columns += list(extra_columns)
+    for i, (date, pair, direction, quantity, strategy, followed, profit, notes) in enumerate(TRADES):
+        values = [date, pair, direction, quantity, strategy] + [int(key in followed) for key in RULE_COLUMNS]
+        values += [profit, notes] + [f"{column}-{i}" for column in extra_columns]
+        conn.execute(f"INSERT INTO trades ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", values)
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = TradeRepository(str(tmp_path / "journal.db"))
+    repo.init_schema()
+    yield repo
+    repo.close()
+
+
+def search(repo, text):
+    return [row[0] for row in repo.history(*history_filter_clauses(search=text)).iter_rows()]
+
+
+def assert_consistent(repo):
+    # Aggregates and rollups match a recompute (reading the rollups fills in stale drawdowns, so
+    # those are compared too), the full-text index matches trade_view, and a search finds notes
+    for period in migrations.PERIODS:
+        repo.rollups(period)
+    assert repo.select("SELECT COUNT(*) FROM period_stats WHERE drawdown IS NULL") == [(0,)]
+    assert repo.check_stats() == []
+    repo.select("INSERT INTO trades_fts (trades_fts, rank) VALUES ('integrity-check', 1)")
+    for trade_id, notes in repo.select("SELECT id, notes FROM trade_view WHERE notes != ''"):
+        assert trade_id in search(repo, notes.split()[0])
+
+
+def assert_migrated(repo):
+    assert repo.select("PRAGMA user_version") == [(migrations.SCHEMA_VERSION,)]
+    rows = repo.select("SELECT date, pair, strategy, rules_mask, profit_percent FROM trade_view ORDER BY id")
+    expected = []
+    for date, pair, _, _, strategy, followed, profit, _ in TRADES:
+        mask = sum(1 << bit for bit, key in enumerate(RULE_COLUMNS) if key in followed)
+        expected.append((date, pair, strategy, mask, profit))
+    # Pairs and strategies are grouped case-insensitively under their first spelling
+    expected[1] = ("2024-01-02 14:30", "EURUSD", "Breakout", 0, -0.8)
+    assert rows == expected
+    assert repo.select("SELECT ts FROM trades WHERE id = 4") == [(migrations.MISSING_TS,)]
+    assert_consistent(repo)
+
+
+def test_migrates_baseline_journal(tmp_path):
+    path = _old_journal(str(tmp_path / "baseline.db"), BASELINE_SCHEMA)
+    repo = TradeRepository(path)
+    try:
+        repo.init_schema()
+        assert_migrated(repo)
+    finally:
+        repo.close()
+
+
+def test_migrates_text_schema_journal(tmp_path):
+    path = _old_journal(str(tmp_path / "text.db"), _pre_typed_schema(),
+                        ("import_key", "pre_image_path", "pre_thumb_path"))
+    conn = sqlite3.connect(path)
+    # A deleted trade: its id must not be handed out again after the table is rebuilt
+    conn.execute("INSERT INTO trades (date, profit_percent) VALUES ('2024-04-01', 1)")
+    conn.execute("DELETE FROM trades WHERE id = 6")
+    conn.commit()
+    conn.close()
+
+    repo = TradeRepository(path)
+    try:
+        repo.init_schema()
+        assert_migrated(repo)
+        assert repo.select("SELECT import_key, pre_image_path, pre_thumb_path FROM trades WHERE id = 3") == [
+            ("import_key-2", "pre_image_path-2", "pre_thumb_path-2")]
+        assert repo.insert_trade(date="2024-05-01", profit_percent=1.0) == 7
+        assert_consistent(repo)
+    finally:
+        repo.close()
+
+
+def test_migrating_twice_is_a_no_op(tmp_path):
+    path = _old_journal(str(tmp_path / "baseline.db"), BASELINE_SCHEMA)
+    for _ in range(2):
+        repo = TradeRepository(path)
+        try:
+            repo.init_schema()
+            assert migrations.migrate(repo.conn) == migrations.SCHEMA_VERSION
+            assert repo.count_trades() == len(TRADES)
+        finally:
+            repo.close()
+
+
+def test_newer_journal_is_refused(tmp_path):
+    path = str(tmp_path / "newer.db")
+    conn = sqlite3.connect(path)
+    conn.execute(f"PRAGMA user_version = {migrations.SCHEMA_VERSION + 1}")
+    conn.close()
+    repo = TradeRepository(path)
+    try:
+        with pytest.raises(RuntimeError):
+            repo.init_schema()
+    finally:
+        repo.close()
+
+
+def test_triggers_match_recompute(repo):
+    ids = []
+    for date, pair, direction, quantity, strategy, followed, profit, notes in TRADES:
+        ids.append(repo.insert_trade(date=date, pair=pair, direction=direction, quantity=quantity, strategy=strategy,
+                                     rules_mask=repo.rule_mask(followed), profit_percent=profit, notes=notes or ""))
+        assert_consistent(repo)
+    # A back-dated trade lands before the period's last one, leaving its drawdown stale
+    ids.append(repo.insert_trade(date="2024-01-01", pair="EURUSD", strategy="Breakout", profit_percent=-4.0,
+                                 notes="early loss"))
+    assert_consistent(repo)
+
+    changes = repo.change_counter()
+    for trade_id, fields in (
+        (ids[0], {"profit_percent": -3.0}),
+        (ids[1], {"date": "2024-02-11"}),
+        (ids[2], {"strategy": "Reversal", "pair": "USDJPY"}),
+        (ids[3], {"date": "2024-03-01", "notes": "dated later"}),
+        (ids[4], {"rules_mask": repo.rule_mask(RULE_COLUMNS[:2])}),
+        (ids[5], {"notes": "quiet session"}),
+    ):
+        repo.update_trade(trade_id, **fields)
+        assert_consistent(repo)
+    assert repo.change_counter() == changes + 6
+
+    for trade_id in (ids[2], ids[0], ids[5]):
+        repo.delete_trade(trade_id)
+        assert_consistent(repo)
+    assert search(repo, "quiet") == []
+    assert repo.stats().total == len(ids) - 3
+
+
+def test_new_rule_is_counted_by_triggers(repo):
+    key = repo.add_rule("Checked news")
+    repo.insert_trade(date="2024-01-02", profit_percent=1.0, rules_mask=repo.rule_mask([key]))
+    repo.insert_trade(date="2024-01-03", profit_percent=-1.0)
+    assert repo.stats().followed[key] == 1
+    assert_consistent(repo)